@@ -0,0 +1,149 @@
+"""
+Measures the cost of loading fetched messages, against the way they were parsed before
+parsing became lazy.
+
+    python benchmarks/parse_messages.py [number of messages]
+
+Both take the FETCH response as imaplib returns it. The corpus mixes plain,
+multipart/alternative and messages with attachments, with encoded headers and a chain of
+Received headers as real mail has.
+"""
+
+from __future__ import print_function
+
+import base64
+import datetime
+import email
+import os
+import re
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from six import binary_type, PY3  # noqa: E402
+
+from gmail.message import Message  # noqa: E402
+
+
+class BaselineMessage(Message):
+    """A Message with parse as it was before parsing became lazy: everything is worked out at once."""
+
+    def parse(self, raw_message):
+        raw_headers = raw_message[0]
+        raw_email = raw_message[1].decode('utf-8') if PY3 else raw_message[1]
+        string_headers = raw_headers.decode('utf-8')
+
+        message = email.message_from_string(raw_email)
+        self.message = message
+        self.headers = self.parse_headers(message)
+
+        froms = self.parse_addresses(message['from'])
+        self.fr = froms[0] if froms else ''
+        self.to = self.parse_addresses(message['to'])
+        self.cc = self.parse_addresses(message['cc'])
+        self.delivered_to = self.parse_addresses(message['delivered_to'])
+
+        self.subject = self.decode_header(message['subject'])
+        content_type = message.get_content_maintype()
+        message_charset = self.get_charset() or 'us-ascii'
+        if content_type == "multipart":
+            for content in message.walk():
+                if content.get_content_type() == "text/plain":
+                    charset = self.get_charset(content) or message_charset
+                    self.body = content.get_payload(decode=True).decode(charset)
+                elif content.get_content_type() == "text/html":
+                    charset = self.get_charset(content) or message_charset
+                    self.html_body = content.get_payload(decode=True).decode(charset)
+        elif content_type == "text":
+            payload = message.get_payload()
+            self.body = payload.decode(message_charset) if isinstance(payload, binary_type) else payload
+
+        self.sent_at = datetime.datetime.fromtimestamp(time.mktime(email.utils.parsedate_tz(message['date'])[:9]))
+
+        self.flags = self.parse_flags(raw_headers)
+
+        self.labels = self.parse_labels(string_headers)
+
+        if re.search(r'X-GM-THRID (\d+)', string_headers):
+            self.thread_id = re.search(r'X-GM-THRID (\d+)', string_headers).groups(1)[0]
+        if re.search(r'X-GM-MSGID (\d+)', string_headers):
+            self.message_id = re.search(r'X-GM-MSGID (\d+)', string_headers).groups(1)[0]
+
+
+RECEIVED = ''.join('Received: from mx%d.example.com (mx%d.example.com [10.0.0.%d])\r\n'
+                   '        by mx.google.com with ESMTPS id x%d; Mon, 1 Jan 2018 10:00:%02d +0000\r\n' % (i, i, i, i, i)
+                   for i in range(6))
+
+
+def headers(i, content_type):
+    return ('Delivered-To: me@example.com\r\n' + RECEIVED +
+            'From: =?utf-8?q?J=C3=B6rg_Sender_{0}?= <sender{0}@example.com>\r\n'
+            'To: Me <me@example.com>, Other <other@example.com>\r\n'
+            'Cc: =?utf-8?b?w4lxdWlwZQ==?= <team@example.com>\r\n'
+            'Subject: =?utf-8?q?Weekly_r=C3=A9port_{0}?=\r\n'
+            'Date: Mon, 1 Jan 2018 10:{1:02d}:00 +0000\r\n'
+            'Message-ID: <{0}@example.com>\r\n'
+            'MIME-Version: 1.0\r\n'
+            'Content-Type: {2}\r\n').format(i, i % 60, content_type)
+
+
+def plain_message(i):
+    return headers(i, 'text/plain; charset="utf-8"') + '\r\n' + 'Some text of the message.\r\n' * 40
+
+
+def alternative_message(i):
+    return (headers(i, 'multipart/alternative; boundary="b1"') + '\r\n'
+            '--b1\r\nContent-Type: text/plain; charset="utf-8"\r\n\r\n' + 'Plain text line.\r\n' * 40 +
+            '--b1\r\nContent-Type: text/html; charset="utf-8"\r\n\r\n' + '<p>Html text line.</p>\r\n' * 40 +
+            '--b1--\r\n')
+
+
+def attachment_message(i):
+    attachment = base64.encodestring(os.urandom(60 * 1024)) if sys.version_info < (3,) else base64.encodebytes(os.urandom(60 * 1024))
+    return (headers(i, 'multipart/mixed; boundary="b2"') + '\r\n'
+            '--b2\r\nContent-Type: text/plain; charset="utf-8"\r\n\r\n' + 'See the attached file.\r\n' * 10 +
+            '--b2\r\nContent-Type: application/pdf; name="report.pdf"\r\nContent-Transfer-Encoding: base64\r\n'
+            'Content-Disposition: attachment; filename="report.pdf"\r\n\r\n' + attachment.decode('ascii') +
+            '--b2--\r\n')
+
+
+# (uid, FETCH response) pairs, the response as imaplib returns it
+def corpus(count):
+    makers = (plain_message, alternative_message, alternative_message, attachment_message)
+    items = []
+    for i in range(count):
+        raw = makers[i % len(makers)](i).encode('utf-8')
+        metadata = '%d (UID %d FLAGS (\\Seen) X-GM-LABELS (\\Inbox) X-GM-THRID %d X-GM-MSGID %d BODY[] {%d}' % (
+            i + 1, i, 1000 + i, 2000 + i, len(raw))
+        items.append((str(i), (metadata.encode('ascii'), raw)))
+    return items
+
+
+def list_view(items, message_class):
+    for uid, fetched in items:
+        message = message_class(None, uid)
+        message.parse(fetched)
+        message.subject, message.fr
+
+
+def read_all(items, message_class):
+    for uid, fetched in items:
+        message = message_class(None, uid)
+        message.parse(fetched)
+        message.subject, message.fr, message.to, message.cc, message.sent_at, message.body, message.html_body
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    items = corpus(count)
+    print('%d messages, microseconds per message' % count)
+    for name, function in (('subject and sender', list_view), ('every attribute', read_all)):
+        for label, message_class in (('baseline', BaselineMessage), ('lazy', Message)):
+            seconds = min(timeit.repeat(lambda: function(items, message_class), number=1, repeat=3))
+            print('  %-20s %-8s %8.1f' % (name, label, seconds / count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,889 @@
+"""
+gmail.aio
+~~~~~~~~~
+
+An asyncio counterpart of Gmail, Mailbox and Message. Requires Python 3.7 or later.
+
+Commands are written as soon as they are issued and matched with their tagged responses as
+they come back, so a single connection can have many commands in flight at once.
+
+"""
+
+import asyncio
+import base64
+import re
+import smtplib
+import socket
+from collections import deque
+
+from .append import LITERAL_MINUS_LIMIT
+from .batch import batch_by_count, compress_uids, sort_uids
+from .draft import Draft
+from .exceptions import AuthenticationError, ConnectionError
+from .gmail import add_mailboxes, list_entries, text_layouts
+from .labels import STATUS_ITEMS
+from .mailbox import Mailbox, MessageList, SearchLiteral, Thread, group_threads, search_stats, thread_criteria, uid_stats
+from .message import Message, fetch_items
+from .parser import parse_esearch, parse_fetch_response, parse_status, to_text
+from .smtp import check_replies, data_chunks, transaction_commands
+from .utf import quote, quote_string
+
+
+LITERAL = re.compile(br'\{(\d+)\+?\}$')
+UNTAGGED = re.compile(br'^\* (?:(\d+) )?([A-Za-z-]+)(?: (.*))?$')
+TAGGED = re.compile(br'^(\S+) (OK|NO|BAD)(?: (.*))?$', re.IGNORECASE)
+RESPONSE_CODE = re.compile(r'^\[([^\s\]]+)(?: ([^\]]*))?\]')
+ESEARCH_TAG = re.compile(br'^\(TAG "?([^")]+)"?\)')
+
+SELECTS = ('SELECT', 'EXAMINE')
+EXPUNGES = ('EXPUNGE', 'UID EXPUNGE', 'MOVE', 'UID MOVE')
+
+# the commands each type of untagged response is sent for; the others go with the oldest command in flight
+UNTAGGED_COMMANDS = {
+    'CAPABILITY': ('CAPABILITY', 'LOGIN', 'AUTHENTICATE'),
+    'ENABLED': ('ENABLE',),
+    'LIST': ('LIST',),
+    'STATUS': ('STATUS', 'LIST'),
+    'SEARCH': ('SEARCH', 'UID SEARCH'),
+    'ESEARCH': ('SEARCH', 'UID SEARCH'),
+    'FETCH': ('FETCH', 'UID FETCH', 'STORE', 'UID STORE'),
+    'EXISTS': SELECTS,
+    'RECENT': SELECTS,
+    'FLAGS': SELECTS,
+    'EXPUNGE': EXPUNGES,
+    'VANISHED': EXPUNGES,
+}
+
+# the same for the codes of untagged OK responses
+CODE_COMMANDS = {
+    'UIDVALIDITY': SELECTS,
+    'UIDNEXT': SELECTS,
+    'HIGHESTMODSEQ': SELECTS,
+    'NOMODSEQ': SELECTS,
+    'PERMANENTFLAGS': SELECTS,
+    'UNSEEN': SELECTS,
+    'COPYUID': ('MOVE', 'UID MOVE'),
+}
+
+
+class Response(object):
+    def __init__(self, command):
+        self.command = command
+        self.status = None
+        self.text = ''
+        self.untagged = {}
+        self.codes = {}
+
+    @property
+    def ok(self):
+        return self.status == 'OK'
+
+    # the data of all the untagged responses of a type, in the list form imaplib returns
+    def data(self, type):
+        return [piece for data in self.untagged.get(type, []) for piece in data]
+
+    def __repr__(self):
+        return '<Response %s %s>' % (self.command, self.status)
+
+
+class AsyncIMAP(object):
+    """An IMAP client connection that pipelines commands.
+
+    command() writes a command right away and returns a future for its Response. An untagged
+    response goes with the oldest command in flight that it can be an answer to, going by its
+    type, its response code or, for ESEARCH, the tag it quotes; the server may run the commands
+    of a pipeline at the same time. Untagged responses that no command in flight asked for are
+    kept in unsolicited. A command with a literal the server has to ask for holds back the
+    commands issued after it until it has.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.tagnum = 0
+        self.pending = deque()
+        self.continuations = deque()
+        self.outgoing = deque()
+        self.literal_tag = None
+        self.literal = None
+        self.unsolicited = deque(maxlen=1000)
+        self.capabilities = set()
+        self.closed = False
+        self.loop = asyncio.get_running_loop()
+        self.greeting = self.loop.create_future()
+        self.reader_task = self.loop.create_task(self.read_loop())
+
+    @classmethod
+    async def connect(cls, host, port, ssl=True):
+        reader, writer = await asyncio.open_connection(host, port, ssl=ssl)
+        imap = cls(reader, writer)
+        await imap.greeting
+        await imap.capability()
+        return imap
+
+    def new_tag(self):
+        self.tagnum += 1
+        return 'A%d' % self.tagnum
+
+    # literal, if given, is sent as the last argument
+    def command(self, *args, literal=None):
+        future = self.loop.create_future()
+        if self.closed:
+            future.set_exception(ConnectionError('IMAP connection is closed'))
+            return future
+
+        tag = self.new_tag()
+        name = ' '.join(args[:2] if args[0].upper() == 'UID' else args[:1]).upper()
+        self.pending.append((tag, Response(name), future))
+        line = ('%s %s' % (tag, ' '.join(args))).encode('utf-8')
+        if literal is None:
+            self.outgoing.append((tag, line + b'\r\n', None))
+        elif self.nonsync(len(literal)):
+            self.outgoing.append((tag, line + b' {%d+}\r\n' % len(literal) + literal + b'\r\n', None))
+        else:
+            self.outgoing.append((tag, line + b' {%d}\r\n' % len(literal), literal + b'\r\n'))
+        self.flush()
+        return future
+
+    def nonsync(self, size):
+        return 'LITERAL+' in self.capabilities or ('LITERAL-' in self.capabilities and size <= LITERAL_MINUS_LIMIT)
+
+    def flush(self):
+        while self.outgoing and self.literal_tag is None:
+            tag, data, literal = self.outgoing.popleft()
+            self.writer.write(data)
+            if literal is not None:
+                self.literal_tag, self.literal = tag, literal
+                self.continuations.append(self.send_literal)
+
+    def send_literal(self, challenge):
+        self.writer.write(self.literal)
+        self.release_literal()
+
+    def release_literal(self):
+        self.literal_tag = self.literal = None
+        self.flush()
+
+    async def capability(self):
+        response = await self.command('CAPABILITY')
+        for data in response.data('CAPABILITY'):
+            self.capabilities.update(to_text(data).upper().split())
+        return response
+
+    def login(self, username, password):
+        return self.command('LOGIN', quote_string(username), quote_string(password))
+
+    def authenticate(self, mechanism, auth_string):
+        encoded = base64.b64encode(auth_string.encode('utf-8')).decode('ascii')
+        if 'SASL-IR' in self.capabilities:
+            return self.command('AUTHENTICATE', mechanism, encoded)
+        self.continuations.append(lambda challenge: self.writer.write(encoded.encode('ascii') + b'\r\n'))
+        return self.command('AUTHENTICATE', mechanism)
+
+    async def logout(self):
+        try:
+            if not self.closed:
+                await self.command('LOGOUT')
+        finally:
+            self.close()
+
+    def close(self):
+        self.closed = True
+        self.writer.close()
+
+    async def read_response(self):
+        pieces = []
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionError('IMAP connection closed')
+            line = line.rstrip(b'\r\n')
+            match = LITERAL.search(line)
+            if not match:
+                pieces.append(line)
+                return pieces
+            pieces.append((line, await self.reader.readexactly(int(match.group(1)))))
+
+    async def read_loop(self):
+        try:
+            while True:
+                self.dispatch(await self.read_response())
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            if not isinstance(error, ConnectionError):
+                error = ConnectionError(str(error))
+            self.fail(error)
+
+    def fail(self, error):
+        self.closed = True
+        if not self.greeting.done():
+            self.greeting.set_exception(error)
+        while self.pending:
+            tag, response, future = self.pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+    def dispatch(self, pieces):
+        first, literal = pieces[0] if isinstance(pieces[0], tuple) else (pieces[0], None)
+
+        if first.startswith(b'+'):
+            if self.continuations:
+                self.continuations.popleft()(first[1:].strip())
+            else:
+                self.writer.write(b'\r\n')  # cancels a SASL exchange, e.g. after an error challenge
+            return
+
+        match = UNTAGGED.match(first)
+        if match:
+            number, type, rest = match.groups()
+            if number:
+                rest = number + (b' ' + rest if rest else b'')
+            rest = rest or b''
+            pieces[0] = (rest, literal) if literal is not None else rest
+            self.untagged(type.decode('ascii').upper(), pieces)
+            return
+
+        match = TAGGED.match(first)
+        if match:
+            self.complete(match.group(1).decode('ascii'), match.group(2).decode('ascii').upper(),
+                          (match.group(3) or b'').decode('utf-8', 'replace'))
+
+    def untagged(self, type, data):
+        if not self.greeting.done():
+            self.greeting.set_result(type)
+            return
+        if type == 'BYE':
+            self.closed = True
+
+        response = self.response_for(type, data)
+        if response is None:
+            self.unsolicited.append((type, data))
+            return
+        response.untagged.setdefault(type, []).append(data)
+        if type in ('OK', 'NO', 'BAD') and isinstance(data[0], bytes):
+            self.response_code(response, data[0].decode('utf-8', 'replace'))
+
+    # the Response of the command in flight an untagged response belongs to, if any
+    def response_for(self, type, data):
+        first = data[0][0] if isinstance(data[0], tuple) else data[0]
+        commands = UNTAGGED_COMMANDS.get(type)
+        if type == 'ESEARCH':
+            match = ESEARCH_TAG.match(first)
+            if match:
+                tag = match.group(1).decode('ascii')
+                return next((response for pending_tag, response, future in self.pending if pending_tag == tag), None)
+        elif type == 'OK':
+            match = RESPONSE_CODE.match(first.decode('utf-8', 'replace'))
+            commands = CODE_COMMANDS.get(match.group(1).upper()) if match else None
+
+        for tag, response, future in self.pending:
+            if commands is None or response.command in commands:
+                return response
+        return None
+
+    def response_code(self, response, text):
+        match = RESPONSE_CODE.match(text)
+        if match:
+            response.codes[match.group(1).upper()] = match.group(2)
+
+    def complete(self, tag, status, text):
+        if tag == self.literal_tag:
+            # refused before the server asked for the literal
+            self.continuations.remove(self.send_literal)
+            self.release_literal()
+        for index, (pending_tag, response, future) in enumerate(self.pending):
+            if pending_tag == tag:
+                del self.pending[index]
+                response.status = status
+                response.text = text
+                self.response_code(response, text)
+                if not future.done():
+                    future.set_result(response)
+                return
+
+
+class AsyncSMTP(object):
+    """An SMTP client connection; MAIL, RCPT and DATA go out together when the server supports PIPELINING."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.extensions = {}
+        self.lock = asyncio.Lock()
+
+    @classmethod
+    async def connect(cls, host, port, ssl=True, local_hostname=None):
+        reader, writer = await asyncio.open_connection(host, port, ssl=ssl)
+        smtp = cls(reader, writer)
+        code, message = await smtp.read_reply()
+        if code != 220:
+            raise ConnectionError('SMTP server refused the connection: %s' % message)
+        await smtp.ehlo(local_hostname)
+        return smtp
+
+    async def read_reply(self):
+        lines = []
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionError('SMTP connection closed')
+            lines.append(line[4:].strip().decode('utf-8', 'replace'))
+            if line[3:4] != b'-':
+                return int(line[:3]), '\n'.join(lines)
+
+    async def command(self, line):
+        self.writer.write(line.encode('utf-8') + b'\r\n')
+        return await self.read_reply()
+
+    async def ehlo(self, local_hostname=None):
+        code, message = await self.command('EHLO %s' % (local_hostname or socket.getfqdn()))
+        self.extensions = {}
+        for line in message.split('\n')[1:]:
+            keyword, _, value = line.partition(' ')
+            self.extensions[keyword.upper()] = value
+        return code, message
+
+    async def auth(self, mechanism, auth_string):
+        encoded = base64.b64encode(auth_string.encode('utf-8')).decode('ascii')
+        code, message = await self.command('AUTH %s %s' % (mechanism, encoded))
+        if code == 334:
+            # XOAUTH2 reports errors as a challenge that has to be answered before the final reply
+            code, message = await self.command('')
+        if code != 235:
+            raise AuthenticationError(message)
+
+    def login(self, username, password):
+        return self.auth('PLAIN', '\0%s\0%s' % (username, password))
+
+    async def send_draft(self, draft):
+        commands = transaction_commands(draft.sender, draft.recipients)
+        async with self.lock:
+            if 'PIPELINING' in self.extensions:
+                self.writer.write(''.join(command + '\r\n' for command in commands).encode('utf-8'))
+                replies = [await self.read_reply() for command in commands]
+            else:
+                replies = [await self.command(command) for command in commands]
+
+            refused, error = check_replies(draft.sender, draft.recipients, replies)
+            if error:
+                if replies[-1][0] == 354:
+                    await self.command('.')
+                await self.command('RSET')
+                raise error
+
+            for chunk in data_chunks(draft):
+                self.writer.write(chunk)
+                await self.writer.drain()
+            code, reply = await self.read_reply()
+            if code != 250:
+                raise smtplib.SMTPDataError(code, reply)
+        return refused
+
+    async def quit(self):
+        try:
+            await self.command('QUIT')
+        finally:
+            self.writer.close()
+
+
+class AsyncMessage(Message):
+    """A Message whose fetch method is a coroutine; the flag and label methods return awaitables."""
+
+    # a partially fetched message is not completed behind the caller's back; await fetch('text') instead
+    def load_text(self):
+        if self.bodies_pending:
+            self.parse_bodies()
+
+    async def fetch(self, profile='full'):
+        if not self.is_fetched(profile):
+            await self.gmail.fetch_messages({self.uid: self}, profile)
+
+        return self.message
+
+    async def fetch_thread(self, profile='headers'):
+        if self.thread_id is None:
+            await self.fetch('envelope')
+        self.thread = await self.gmail.thread(self.thread_id, profile)
+        return self.thread
+
+
+# a MessageList method that runs the Mailbox method of each mailbox at once
+def gathered(mailbox_method):
+    async def method(self, *args):
+        return await asyncio.gather(*[getattr(mailbox, mailbox_method)(messages, *args) for mailbox, messages in self.mailboxes()])
+    return method
+
+
+class AsyncMessageList(MessageList):
+    """A MessageList whose flag, label and move methods are coroutines."""
+
+    read = gathered('read')
+    unread = gathered('unread')
+    star = gathered('star')
+    unstar = gathered('unstar')
+    add_label = gathered('add_label')
+    remove_label = gathered('remove_label')
+    move_to = gathered('move')
+    archive = gathered('archive')
+    delete = gathered('trash')
+
+
+class AsyncThread(AsyncMessageList, Thread):
+    """A Thread whose flag, label and move methods are coroutines."""
+
+
+# an attribute kept on the Mailbox an AsyncMailbox wraps
+def delegated(name):
+    return property(lambda self: getattr(self.mailbox, name), lambda self, value: setattr(self.mailbox, name, value))
+
+
+class AsyncMailbox(object):
+    """The asyncio counterpart of Mailbox, whose search, mail, count, store, move, trash, threads and status methods
+    are coroutines.
+
+    Its messages and what SELECT and STATUS report are kept in a Mailbox, which also does the work that needs no
+    IMAP command.
+    """
+
+    message_class = AsyncMessage
+
+    name = delegated('name')
+    external_name = delegated('external_name')
+    messages = delegated('messages')
+    exists = delegated('exists')
+    uidvalidity = delegated('uidvalidity')
+    uidnext = delegated('uidnext')
+    highestmodseq = delegated('highestmodseq')
+    unseen = delegated('unseen')
+    attributes = delegated('attributes')
+    delimiter = delegated('delimiter')
+
+    def __init__(self, gmail, name='INBOX'):
+        self.gmail = gmail
+        self.mailbox = Mailbox(gmail, name)
+        # compact records are turned back into messages of this mailbox
+        self.mailbox.messages.mailbox = self
+
+    def search_criteria(self, **kwargs):
+        return self.mailbox.search_criteria(**kwargs)
+
+    def messages_by_uid(self, messages):
+        return self.mailbox.messages_by_uid(messages)
+
+    def check_uid_expunge(self):
+        self.mailbox.check_uid_expunge()
+
+    def check_selection(self, messages, **kwargs):
+        self.mailbox.check_selection(messages, **kwargs)
+
+    def unindex(self, uid):
+        self.mailbox.unindex(uid)
+
+    def load_status(self, status):
+        self.mailbox.load_status(status)
+
+    def cached_messages(self):
+        return self.messages
+
+    def records(self):
+        return self.mailbox.records()
+
+    # returns the arguments and, for text that is not ASCII, the literal that goes last
+    def search_args(self, returns=None, **kwargs):
+        search = self.search_criteria(**kwargs)
+        args = ['RETURN', '(%s)' % ' '.join(returns)] if returns is not None else []
+        if isinstance(search[-1], SearchLiteral):
+            return args + ['CHARSET', 'UTF-8'] + search[:-1], search[-1]
+        return args + search, None
+
+    def uid_search_command(self, returns=None, **kwargs):
+        args, literal = self.search_args(returns, **kwargs)
+        return self.gmail.execute(self.name, 'UID', 'SEARCH', *args, literal=literal)
+
+    async def search(self, limit=None, **kwargs):
+        response = await self.uid_search_command(**kwargs)
+        uids = [uid for data in response.data('SEARCH') for uid in to_text(data).split()] if response.ok else []
+        return sort_uids(uids)[-limit:] if limit else uids
+
+    async def mail(self, prefetch=False, batch_size=None, profile='full', **kwargs):
+        emails = AsyncMessageList()
+
+        for uid in await self.search(**kwargs):
+            if not self.messages.get(uid):
+                self.messages[uid] = self.message_class(self, uid)
+            emails.append(self.messages[uid])
+
+        if prefetch and emails:
+            self.messages.update(await self.gmail.fetch_multiple_messages(dict((email.uid, email) for email in emails), batch_size, profile))
+
+        return emails
+
+    async def message(self, uid, profile='full'):
+        message = self.messages.get(uid) or self.message_class(self, uid)
+        if profile and not message.is_fetched(profile):
+            await message.fetch(profile)
+        self.messages[uid] = message
+        return message
+
+    async def count(self, **kwargs):
+        if self.gmail.has_capability('ESEARCH'):
+            response = await self.uid_search_command(['COUNT'], **kwargs)
+            return int(parse_esearch(response.data('ESEARCH')).get('COUNT', 0)) if response.ok else 0
+        return len(await self.search(**kwargs))
+
+    async def search_stats(self, **kwargs):
+        if self.gmail.has_capability('ESEARCH'):
+            response = await self.uid_search_command(['COUNT', 'MIN', 'MAX'], **kwargs)
+            result = parse_esearch(response.data('ESEARCH')) if response.ok else {}
+        else:
+            result = uid_stats(await self.search(**kwargs))
+        return search_stats(result)
+
+    async def store(self, messages, command, values, **kwargs):
+        self.check_selection(messages, **kwargs)
+        messages = self.messages_by_uid(await self.search(**kwargs) if messages is None else messages)
+        items = ' '.join(quote(value) if 'X-GM-LABELS' in command.upper() else value for value in values)
+
+        chunks = list(batch_by_count(sort_uids(messages.keys()), self.gmail.STORE_BATCH_SIZE))
+        responses = await asyncio.gather(*[self.gmail.execute(self.name, 'UID', 'STORE', compress_uids(chunk), command + '.SILENT', '(%s)' % items)
+                                           for chunk in chunks])
+        stored = []
+        for chunk, response in zip(chunks, responses):
+            if response.ok:
+                for uid in chunk:
+                    if messages[uid]:
+                        messages[uid].stored(command, values)
+                        self.messages.refresh(messages[uid])
+                stored.extend(chunk)
+        return stored
+
+    def read(self, messages=None, **kwargs):
+        return self.store(messages, '+FLAGS', ['\\Seen'], **kwargs)
+
+    def unread(self, messages=None, **kwargs):
+        return self.store(messages, '-FLAGS', ['\\Seen'], **kwargs)
+
+    def star(self, messages=None, **kwargs):
+        return self.store(messages, '+FLAGS', ['\\Flagged'], **kwargs)
+
+    def unstar(self, messages=None, **kwargs):
+        return self.store(messages, '-FLAGS', ['\\Flagged'], **kwargs)
+
+    def add_label(self, messages=None, label=None, **kwargs):
+        return self.store(messages, '+X-GM-LABELS', [label], **kwargs)
+
+    def remove_label(self, messages=None, label=None, **kwargs):
+        return self.store(messages, '-X-GM-LABELS', [label], **kwargs)
+
+    # the chunks are moved at once; with COPY, each one is only expunged once it has been copied
+    async def move(self, messages=None, to_mailbox=None, **kwargs):
+        self.check_selection(messages, **kwargs)
+        if not self.gmail.has_capability('MOVE'):
+            self.check_uid_expunge()
+        messages = self.messages_by_uid(await self.search(**kwargs) if messages is None else messages)
+        destination = self.gmail.mailboxes.get(to_mailbox)
+
+        chunks = list(batch_by_count(sort_uids(messages.keys()), self.gmail.STORE_BATCH_SIZE))
+        responses = await asyncio.gather(*[self.move_chunk(compress_uids(chunk), to_mailbox) for chunk in chunks])
+        moved = []
+        for chunk, response in zip(chunks, responses):
+            if response.ok:
+                moved.extend(chunk)
+                self.mailbox.moved(messages, chunk, response.codes.get('COPYUID'), destination)
+        return moved
+
+    async def move_chunk(self, uid_set, to_mailbox):
+        if self.gmail.has_capability('MOVE'):
+            return await self.gmail.execute(self.name, 'UID', 'MOVE', uid_set, quote(to_mailbox))
+        response = await self.gmail.execute(self.name, 'UID', 'COPY', uid_set, quote(to_mailbox))
+        if not response.ok:
+            return response
+        expunged = await self.expunge(uid_set)
+        return response if expunged.ok else expunged
+
+    async def expunge(self, uid_set):
+        self.check_uid_expunge()
+        response = await self.gmail.execute(self.name, 'UID', 'STORE', uid_set, '+FLAGS.SILENT', '(\\Deleted)')
+        if not response.ok:
+            return response
+        return await self.gmail.execute(self.name, 'UID', 'EXPUNGE', uid_set)
+
+    # in Gmail, archiving takes the \\Inbox label off
+    def archive(self, messages=None, **kwargs):
+        if self.name == 'INBOX':
+            return self.move(messages, self.gmail.special_mailboxes.get('All', '[Gmail]/All Mail'), **kwargs)
+        return self.remove_label(messages, '\\Inbox', **kwargs)
+
+    async def trash(self, messages=None, **kwargs):
+        trash = self.gmail.trash_mailbox_name()
+        if self.name != trash:
+            return await self.move(messages, trash, **kwargs)
+
+        self.check_selection(messages, **kwargs)
+        self.check_uid_expunge()
+        messages = self.messages_by_uid(await self.search(**kwargs) if messages is None else messages)
+        chunks = list(batch_by_count(sort_uids(messages.keys()), self.gmail.STORE_BATCH_SIZE))
+        responses = await asyncio.gather(*[self.expunge(compress_uids(chunk)) for chunk in chunks])
+        deleted = []
+        for chunk, response in zip(chunks, responses):
+            if response.ok:
+                deleted.extend(chunk)
+                for uid in chunk:
+                    self.messages.pop(uid, None)
+                    self.unindex(uid)
+        return deleted
+
+    async def threads(self, thread_ids, profile='headers', batch_size=None):
+        thread_ids = [str(thread_id) for thread_id in thread_ids]
+        chunks = list(batch_by_count(sorted(set(thread_ids)), self.gmail.THREAD_SEARCH_SIZE))
+        messages = {}
+        for uids in await asyncio.gather(*[self.search(query=thread_criteria(chunk)) for chunk in chunks]):
+            for uid in uids:
+                messages[uid] = self.messages.get(uid) or self.message_class(self, uid)
+
+        unfetched = dict((uid, message) for uid, message in messages.items() if not message.is_fetched(profile))
+        await self.gmail.fetch_multiple_messages(unfetched, batch_size, profile)
+        self.messages.update(messages)
+        return group_threads(thread_ids, messages.values(), AsyncThread)
+
+    async def status(self, refresh=False):
+        if refresh or self.unseen is None:
+            response = await self.gmail.imap.command('STATUS', quote(self.name), '(%s)' % ' '.join(STATUS_ITEMS))
+            if response.ok:
+                self.load_status(next(iter(parse_status(response.data('STATUS')).values()), {}))
+        return {'messages': self.exists, 'unseen': self.unseen, 'uidnext': self.uidnext}
+
+
+class AsyncGmail(object):
+    """The asyncio counterpart of Gmail, using one pipelined IMAP connection per account.
+
+    The SMTP connection is only opened by the first send(), so that idle accounts cost a single socket.
+    """
+
+    GMAIL_IMAP_HOST = 'imap.gmail.com'
+    GMAIL_IMAP_PORT = 993
+
+    # SMTP over TLS from the start, rather than STARTTLS
+    GMAIL_SMTP_HOST = 'smtp.gmail.com'
+    GMAIL_SMTP_PORT = 465
+
+    FETCH_BATCH_SIZE = 500
+    STORE_BATCH_SIZE = 1000
+    THREAD_SEARCH_SIZE = 100
+
+    def __init__(self):
+        self.username = None
+        self.password = None
+        self.access_token = None
+
+        self.imap = None
+        self.smtp = None
+        self.logged_in = False
+        self.mailboxes = {}
+        self.special_mailboxes = {}
+        self.selected = None
+        # made by the first send(), on the loop that runs it
+        self.smtp_lock = None
+
+    async def connect(self):
+        if not self.imap:
+            self.imap = await AsyncIMAP.connect(self.GMAIL_IMAP_HOST, self.GMAIL_IMAP_PORT)
+
+    def new_smtp(self):
+        return AsyncSMTP.connect(self.GMAIL_SMTP_HOST, self.GMAIL_SMTP_PORT)
+
+    # concurrent sends wait for the connection the first of them opens
+    async def connect_smtp(self):
+        if self.smtp_lock is None:
+            self.smtp_lock = asyncio.Lock()
+        async with self.smtp_lock:
+            if not self.smtp:
+                smtp = await self.new_smtp()
+                if self.access_token:
+                    await smtp.auth('XOAUTH2', self.auth_string())
+                else:
+                    await smtp.login(self.username, self.password)
+                self.smtp = smtp
+        return self.smtp
+
+    def auth_string(self):
+        return 'user=%s\1auth=Bearer %s\1\1' % (self.username, self.access_token)
+
+    async def login(self, username, password):
+        self.username = username if '@' in username else username + '@gmail.com'
+        self.password = password
+
+        await self.connect()
+        response = await self.imap.login(self.username, self.password)
+        if not response.ok:
+            raise AuthenticationError(response.text)
+        return await self.logged_in_imap()
+
+    async def authenticate(self, username, access_token):
+        self.username = username if '@' in username else username + '@gmail.com'
+        self.access_token = access_token
+
+        await self.connect()
+        response = await self.imap.authenticate('XOAUTH2', self.auth_string())
+        if not response.ok:
+            raise AuthenticationError(response.text)
+        return await self.logged_in_imap()
+
+    async def logged_in_imap(self):
+        # servers may announce more capabilities once logged in
+        await self.imap.capability()
+        await self.fetch_mailboxes()
+        self.logged_in = True
+        return self.logged_in
+
+    async def logout(self):
+        if self.imap:
+            await self.imap.logout()
+            self.imap = None
+        if self.smtp:
+            await self.smtp.quit()
+            self.smtp = None
+        self.selected = None
+        self.logged_in = False
+
+    async def fetch_mailboxes(self):
+        response = await self.imap.command('LIST', '""', '"*"')
+        if response.ok:
+            add_mailboxes(self, list_entries(response.data('LIST')), AsyncMailbox)
+
+    # issues a command with mailbox_name selected; a SELECT is pipelined ahead of it when needed
+    def execute(self, mailbox_name, *args, literal=None):
+        if mailbox_name and self.selected != mailbox_name:
+            self.select(mailbox_name)
+        return self.imap.command(*args, literal=literal)
+
+    def select(self, mailbox_name):
+        self.selected = mailbox_name
+        future = self.imap.command('SELECT', quote(mailbox_name))
+        future.add_done_callback(lambda future: self.selected_mailbox(mailbox_name, future))
+        return future
+
+    def selected_mailbox(self, mailbox_name, future):
+        response = None if future.cancelled() or future.exception() else future.result()
+        if not (response and response.ok):
+            if self.selected == mailbox_name:
+                self.selected = None
+            return
+
+        mailbox = self.mailboxes.get(mailbox_name)
+        if mailbox:
+            exists = response.data('EXISTS')
+            mailbox.exists = int(exists[-1]) if exists else None
+            mailbox.uidvalidity = int(response.codes['UIDVALIDITY']) if response.codes.get('UIDVALIDITY') else None
+            mailbox.uidnext = int(response.codes['UIDNEXT']) if response.codes.get('UIDNEXT') else None
+            mailbox.highestmodseq = int(response.codes['HIGHESTMODSEQ']) if response.codes.get('HIGHESTMODSEQ') else None
+
+    def has_capability(self, capability):
+        return capability in self.imap.capabilities
+
+    def mailbox(self, mailbox_name):
+        return self.mailboxes.get(mailbox_name)
+
+    def special_mailbox(self, mailbox_name):
+        return self.mailbox(self.special_mailboxes.get(mailbox_name))
+
+    def label(self, label_name):
+        return self.mailbox(label_name)
+
+    def labels(self):
+        return self.mailboxes.keys()
+
+    def inbox(self):
+        return self.mailbox('INBOX')
+
+    def spam(self):
+        return self.special_mailbox('Junk')
+
+    def starred(self):
+        return self.special_mailbox('Flagged')
+
+    def all_mail(self):
+        return self.special_mailbox('All')
+
+    def sent_mail(self):
+        return self.special_mailbox('Sent')
+
+    def important(self):
+        return self.special_mailbox('Important')
+
+    def all_mail_mailbox(self):
+        name = self.special_mailboxes.get('All', '[Gmail]/All Mail')
+        if name not in self.mailboxes:
+            self.mailboxes[name] = AsyncMailbox(self, name)
+        return self.mailboxes[name]
+
+    def threads(self, thread_ids, profile='headers', batch_size=None):
+        return self.all_mail_mailbox().threads(thread_ids, profile, batch_size)
+
+    async def thread(self, thread_id, profile='headers'):
+        return (await self.threads([thread_id], profile))[0]
+
+    def trash_mailbox_name(self):
+        return self.special_mailboxes.get('Trash') or ('[Gmail]/Bin' if '[Gmail]/Bin' in self.mailboxes else '[Gmail]/Trash')
+
+    def mail_domain(self):
+        return self.username.split('@')[-1]
+
+    async def fetch_messages(self, messages, profile='full'):
+        if not messages:
+            return []
+
+        mailbox_name = next(iter(messages.values())).mailbox.name
+        response = await self.execute(mailbox_name, 'UID', 'FETCH', ','.join(messages.keys()), fetch_items(profile))
+        fetched = []
+        if response.ok:
+            for sequence, items in parse_fetch_response(response.data('FETCH')):
+                message = messages.get(items.get('UID'))
+                if message:
+                    message.load(items)
+                    fetched.append(message)
+
+        if profile == 'text':
+            await self.fetch_text_sections(mailbox_name, fetched)
+
+        for message in fetched:
+            message.profiles.add(profile)
+
+        return fetched
+
+    async def fetch_text_sections(self, mailbox_name, messages):
+        layouts = text_layouts(messages)
+        responses = await asyncio.gather(*[self.execute(mailbox_name, 'UID', 'FETCH', ','.join(grouped.keys()), fetch_str)
+                                           for fetch_str, grouped in layouts])
+        for (fetch_str, grouped), response in zip(layouts, responses):
+            if response.ok:
+                for sequence, items in parse_fetch_response(response.data('FETCH')):
+                    message = grouped.get(items.get('UID'))
+                    if message:
+                        message.load(items)
+
+    # all the batches are in flight at once on the one connection
+    async def fetch_multiple_messages(self, messages, batch_size=None, profile='full'):
+        batches = batch_by_count(sort_uids(messages.keys()), batch_size or self.FETCH_BATCH_SIZE)
+        await asyncio.gather(*[self.fetch_messages(dict((uid, messages[uid]) for uid in batch), profile) for batch in batches])
+        return messages
+
+    async def send(self, recipients, subject, plain=None, html=None, sender=None, cc=None, bcc=None, attachments=None, headers=None):
+        sender = sender or self.username
+        draft = Draft(self, sender, recipients, subject, plain, html, cc, bcc, attachments, headers)
+        smtp = await self.connect_smtp()
+        await smtp.send_draft(draft)
+        return draft.message_id
+
+
+async def login(username, password):
+    gmail = AsyncGmail()
+    await gmail.login(username, password)
+    return gmail
+
+
+async def authenticate(username, access_token):
+    gmail = AsyncGmail()
+    await gmail.authenticate(username, access_token)
+    return gmail
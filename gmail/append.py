@@ -0,0 +1,171 @@
+import datetime
+import imaplib
+import re
+import time
+
+from six import binary_type
+
+from .batch import batch_by_count, expand_uids
+from .draft import Draft
+from .exceptions import GmailException
+from .parallel import BatchRunner
+from .utf import quote
+
+
+# with LITERAL- (RFC 7888), only literals up to this size may be sent without waiting for the server
+LITERAL_MINUS_LIMIT = 4096
+
+APPENDUID = re.compile(br'\[APPENDUID \d+ ([\d:,]+)\]', re.IGNORECASE)
+LITERAL = re.compile(br'\{(\d+)\}\r\n$')
+
+
+class AppendMessage(object):
+    """A message for Mailbox.append: raw bytes or a Draft, with the flags, internal date and Gmail labels to give it.
+
+    A Draft is sent as it is generated, so its attachments are never in memory whole.
+    """
+
+    def __init__(self, message, flags=None, date_time=None, labels=None):
+        if isinstance(message, Draft) and message.size() is None:
+            message = message.as_bytes()
+        self.message = message
+        self.flags = list(flags or [])
+        self.date_time = date_time
+        self.labels = list(labels or [])
+
+    def size(self):
+        return len(self.message) if isinstance(self.message, binary_type) else self.message.size()
+
+    def chunks(self):
+        if isinstance(self.message, binary_type):
+            return [self.message]
+        return self.message.generate()
+
+    # the APPEND arguments that go before the literal
+    def arguments(self):
+        arguments = ['(%s)' % ' '.join(self.flags)]
+        date_time = self.date_time
+        if isinstance(date_time, datetime.datetime) and date_time.tzinfo is None:
+            date_time = time.mktime(date_time.timetuple())  # taken as local time, like imaplib does time tuples
+        if date_time is not None:
+            arguments.append(imaplib.Time2Internaldate(date_time))
+        return ' '.join(arguments)
+
+
+class AppendPipeline(object):
+    """Sends APPEND commands on an IMAP connection without waiting for each one to complete.
+
+    Literals go out without a round trip when the server has LITERAL+, or LITERAL- and the
+    literal is small; otherwise only the continuation is waited for, and the next command
+    follows the literal straight away. Tagged results are read as they come in, and untagged
+    responses are dropped.
+    """
+
+    def __init__(self, imap):
+        self.imap = imap
+        self.tag_number = 0
+        self.results = {}
+
+    def new_tag(self):
+        self.tag_number += 1
+        return ('APPEND%d' % self.tag_number).encode()  # unlike imaplib's own tags
+
+    def nonsync(self, size):
+        capabilities = self.imap.capabilities
+        return 'LITERAL+' in capabilities or ('LITERAL-' in capabilities and size <= LITERAL_MINUS_LIMIT)
+
+    def read_response(self):
+        line = self.imap.readline()
+        if not line:
+            raise imaplib.IMAP4.abort('socket error: EOF')
+        literal = LITERAL.search(line)
+        if literal:
+            self.imap.read(int(literal.group(1)))  # the rest of the response comes as the next line
+        tag, _, rest = line.partition(b' ')
+        if tag not in (b'*', b'+'):
+            self.results[tag] = rest.rstrip(b'\r\n')
+        return line
+
+    # returns whether the server asked for the literal, rather than refusing the command
+    def wait_continuation(self, tag):
+        while tag not in self.results:
+            if self.read_response().startswith(b'+'):
+                return True
+        return False
+
+    def send_message(self, tag, message):
+        size = message.size()
+        nonsync = self.nonsync(size)
+        self.imap.send((' %s {%d%s}\r\n' % (message.arguments(), size, '+' if nonsync else '')).encode())
+        if not nonsync and not self.wait_continuation(tag):
+            return False
+        for chunk in message.chunks():
+            self.imap.send(chunk)
+        return True
+
+    # starts an APPEND of the messages, all of them in one command with MULTIAPPEND (RFC 3502); returns its tag
+    def append(self, mailbox_name, messages):
+        tag = self.new_tag()
+        self.imap.send(tag + (' APPEND %s' % quote(mailbox_name)).encode())
+        for message in messages:
+            if not self.send_message(tag, message):
+                return tag
+        self.imap.send(b'\r\n')
+        return tag
+
+    # waits for the commands and returns the UIDs of the appended messages, None where the server did not tell them
+    def finish(self, tags, counts):
+        while any(tag not in self.results for tag in tags):
+            self.read_response()
+
+        uids = []
+        for tag, count in zip(tags, counts):
+            result = self.results.pop(tag)
+            if not result.upper().startswith(b'OK'):
+                raise GmailException('APPEND refused: %s' % result.decode('utf-8', 'replace'))
+            appenduid = APPENDUID.search(result)
+            new_uids = expand_uids(appenduid.group(1).decode()) if appenduid else []
+            uids.extend(new_uids if len(new_uids) == count else [None] * count)
+        return uids
+
+
+def append_batch(gmail, mailbox_name, batch):
+    with gmail.connection() as imap:
+        pipeline = AppendPipeline(imap)
+        if 'MULTIAPPEND' in imap.capabilities:
+            tags, counts = [pipeline.append(mailbox_name, batch)], [len(batch)]
+        else:
+            tags, counts = [pipeline.append(mailbox_name, [message]) for message in batch], [1] * len(batch)
+        uids = pipeline.finish(tags, counts)
+
+        # the EXISTS the server sent for a mailbox this connection has selected was dropped
+        selection = gmail.selections.current(imap)
+        if selection and selection.mailbox == mailbox_name:
+            gmail.selections.forget(imap)
+    return batch, uids
+
+
+# uploads the messages a batch at a time, on several pooled connections with concurrency, and then gives the
+# appended ones their labels; returns the new UIDs in the order of the messages
+def append_messages(mailbox, messages, flags=None, date_time=None, labels=None, batch_size=None, concurrency=None):
+    gmail = mailbox.gmail
+    messages = (message if isinstance(message, AppendMessage) else AppendMessage(message, flags, date_time, labels)
+                for message in messages)
+    batches = batch_by_count(messages, batch_size or gmail.APPEND_BATCH_SIZE)
+    if concurrency:
+        results = BatchRunner(gmail, concurrency).map(lambda batch: append_batch(gmail, mailbox.name, batch), batches)
+    else:
+        results = (append_batch(gmail, mailbox.name, batch) for batch in batches)
+
+    uids = []
+    for batch, batch_uids in results:
+        uids.extend(batch_uids)
+        # labels are set through the UIDs from APPENDUID, so only with UIDPLUS
+        by_label = {}
+        for message, uid in zip(batch, batch_uids):
+            for label in message.labels:
+                if uid:
+                    by_label.setdefault(label, []).append(uid)
+        for label in sorted(by_label):
+            mailbox.add_label(by_label[label], label)
+    return uids
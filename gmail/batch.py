@@ -0,0 +1,52 @@
+def batch_by_count(uids, batch_size):
+    batch = []
+    for uid in uids:
+        batch.append(uid)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def batch_by_size(uids, sizes, batch_bytes, batch_size=None):
+    # a message larger than batch_bytes still gets a batch of its own
+    batch = []
+    total = 0
+    for uid in uids:
+        size = sizes.get(uid, 0)
+        if batch and (total + size > batch_bytes or (batch_size and len(batch) >= batch_size)):
+            yield batch
+            batch = []
+            total = 0
+        batch.append(uid)
+        total += size
+    if batch:
+        yield batch
+
+
+def sort_uids(uids):
+    return sorted(uids, key=int)
+
+
+# expands a sequence set such as '1:3,7' into a list of UIDs
+def expand_uids(sequence_set):
+    uids = []
+    for part in sequence_set.split(','):
+        if ':' in part:
+            first, last = sorted(int(uid) for uid in part.split(':'))
+            uids.extend(str(uid) for uid in range(first, last + 1))
+        elif part:
+            uids.append(part)
+    return uids
+
+
+# the inverse of expand_uids: ['1', '2', '3', '7'] becomes '1:3,7'
+def compress_uids(uids):
+    ranges = []
+    for uid in sorted(set(int(uid) for uid in uids)):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ','.join(str(first) if first == last else '%d:%d' % (first, last) for first, last in ranges)
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+
+class MessageCache(object):
+    """On-disk cache of raw messages keyed by X-GM-MSGID.
+
+    Raw messages are stored once under blobs/ named by their SHA-1, so the same message seen
+    through different labels takes the space of one. UID to X-GM-MSGID mappings are only
+    kept while the mailbox UIDVALIDITY is unchanged. Flags and labels are stored as of the
+    last time the message was fetched from the server, which is asked for them again
+    whenever a cached body is used.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.blob_path = os.path.join(path, 'blobs')
+        if not os.path.isdir(self.blob_path):
+            os.makedirs(self.blob_path)
+
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(path, 'cache.sqlite'), check_same_thread=False)
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS mailboxes (name TEXT PRIMARY KEY, uidvalidity TEXT)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS uids (mailbox TEXT, uid TEXT, message_id TEXT, PRIMARY KEY (mailbox, uid))')
+            self.db.execute('CREATE TABLE IF NOT EXISTS messages (message_id TEXT PRIMARY KEY, digest TEXT, thread_id TEXT, flags TEXT, labels TEXT)')
+
+    def close(self):
+        self.db.close()
+
+    def check_uidvalidity(self, mailbox, uidvalidity):
+        # forget the UID mappings of a mailbox whose UIDs have been reassigned
+        with self.lock, self.db:
+            row = self.db.execute('SELECT uidvalidity FROM mailboxes WHERE name = ?', (mailbox,)).fetchone()
+            if row and row[0] == uidvalidity:
+                return True
+            self.db.execute('DELETE FROM uids WHERE mailbox = ?', (mailbox,))
+            self.db.execute('INSERT OR REPLACE INTO mailboxes (name, uidvalidity) VALUES (?, ?)', (mailbox, uidvalidity))
+            return False
+
+    def message_ids(self, mailbox, uids):
+        message_ids = {}
+        with self.lock:
+            for uid in uids:
+                row = self.db.execute('SELECT message_id FROM uids WHERE mailbox = ? AND uid = ?', (mailbox, uid)).fetchone()
+                if row:
+                    message_ids[uid] = row[0]
+        return message_ids
+
+    def blob_file(self, digest):
+        return os.path.join(self.blob_path, digest[:2], digest[2:])
+
+    def load(self, message_id):
+        with self.lock:
+            row = self.db.execute('SELECT digest, thread_id, flags, labels FROM messages WHERE message_id = ?', (message_id,)).fetchone()
+        if not row:
+            return None
+
+        digest, thread_id, flags, labels = row
+        try:
+            with open(self.blob_file(digest), 'rb') as f:
+                raw = f.read()
+        except IOError:
+            return None
+
+        return {
+            'BODY[]': raw,
+            'X-GM-MSGID': message_id,
+            'X-GM-THRID': thread_id,
+            'FLAGS': json.loads(flags),
+            'X-GM-LABELS': json.loads(labels),
+        }
+
+    def store(self, mailbox, uid, message_id, raw, thread_id=None, flags=None, labels=None):
+        digest = hashlib.sha1(raw).hexdigest()
+        blob_file = self.blob_file(digest)
+        if not os.path.exists(blob_file):
+            directory = os.path.dirname(blob_file)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            temp_file = '%s.%s.tmp' % (blob_file, threading.current_thread().ident)
+            with open(temp_file, 'wb') as f:
+                f.write(raw)
+            os.rename(temp_file, blob_file)
+
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO messages (message_id, digest, thread_id, flags, labels) VALUES (?, ?, ?, ?, ?)',
+                            (message_id, digest, thread_id, json.dumps(list(flags or [])), json.dumps(list(labels or []))))
+            if mailbox:
+                self.db.execute('INSERT OR REPLACE INTO uids (mailbox, uid, message_id) VALUES (?, ?, ?)', (mailbox, uid, message_id))
+
+    def update_metadata(self, message_id, thread_id, flags, labels):
+        with self.lock, self.db:
+            self.db.execute('UPDATE messages SET thread_id = ?, flags = ?, labels = ? WHERE message_id = ?',
+                            (thread_id, json.dumps(list(flags or [])), json.dumps(list(labels or [])), message_id))
+
+    def map_uid(self, mailbox, uid, message_id):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO uids (mailbox, uid, message_id) VALUES (?, ?, ?)', (mailbox, uid, message_id))
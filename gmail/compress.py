@@ -0,0 +1,137 @@
+import threading
+import zlib
+
+
+class CompressionStats(object):
+    """Bytes sent and received by the compressed connections of a session, before and after compression."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.sent_compressed = 0
+        self.received = 0
+        self.received_compressed = 0
+
+    def add(self, sent=0, sent_compressed=0, received=0, received_compressed=0):
+        with self.lock:
+            self.sent += sent
+            self.sent_compressed += sent_compressed
+            self.received += received
+            self.received_compressed += received_compressed
+
+    # how many times smaller the transfer was, e.g. 3.0 when a third of the bytes went over the wire
+    def ratio(self):
+        compressed = self.sent_compressed + self.received_compressed
+        return float(self.sent + self.received) / compressed if compressed else None
+
+    def __repr__(self):
+        return '<CompressionStats %d bytes as %d>' % (self.sent + self.received, self.sent_compressed + self.received_compressed)
+
+
+class DeflateFile(object):
+    """The file imaplib reads responses from, on top of a DeflateSocket."""
+
+    def __init__(self, sock):
+        self.sock = sock
+
+    def readline(self, limit=-1):
+        return self.sock.readline(limit)
+
+    def read(self, size):
+        return self.sock.read(size)
+
+    # the socket itself is closed by imaplib
+    def close(self):
+        pass
+
+
+class DeflateSocket(object):
+    """Wraps the socket of an IMAP connection that has turned on COMPRESS=DEFLATE (RFC 4978).
+
+    Writes are compressed and flushed at the end of each, reads decompressed into a buffer
+    that imaplib reads lines and literals from. recv and pending work on the decompressed
+    data, for the code that polls the socket while in IDLE.
+    """
+
+    def __init__(self, sock, stats=None):
+        self.sock = sock
+        self.stats = stats or CompressionStats()
+        self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        self.decompressor = zlib.decompressobj(-15)
+        self.buffer = bytearray()
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+    def sendall(self, data):
+        compressed = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.sock.sendall(compressed)
+        self.stats.add(sent=len(data), sent_compressed=len(compressed))
+
+    send = sendall
+
+    # Python 2's IMAP4_SSL sends through sslobj.write
+    def write(self, data):
+        self.sendall(data)
+        return len(data)
+
+    # reads and decompresses what the socket has; returns False once the connection is closed
+    def fill(self):
+        data = self.sock.recv(65536)
+        if not data:
+            return False
+        decompressed = self.decompressor.decompress(data)
+        self.buffer += decompressed
+        self.stats.add(received=len(decompressed), received_compressed=len(data))
+        return True
+
+    def take(self, size):
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def recv(self, size):
+        while not self.buffer:
+            if not self.fill():
+                return b''
+        return self.take(size)
+
+    def pending(self):
+        if self.buffer:
+            return len(self.buffer)
+        pending = getattr(self.sock, 'pending', None)
+        return pending() if pending else 0
+
+    def readline(self, limit=-1):
+        while self.buffer.find(b'\n') < 0 and (limit < 0 or len(self.buffer) < limit):
+            if not self.fill():
+                break
+        end = self.buffer.find(b'\n') + 1 or len(self.buffer)
+        return self.take(min(end, limit) if limit >= 0 else end)
+
+    def read(self, size):
+        while len(self.buffer) < size:
+            if not self.fill():
+                break
+        return self.take(size)
+
+    def makefile(self, mode='rb', *args):
+        return DeflateFile(self)
+
+
+# turns on COMPRESS=DEFLATE on a logged in imaplib connection; returns whether it is on
+def compress(imap, stats=None):
+    if isinstance(imap.sock, DeflateSocket):
+        return True
+    if 'COMPRESS=DEFLATE' not in imap.capabilities:
+        return False
+    response, data = imap.xatom('COMPRESS', 'DEFLATE')
+    if response != 'OK':
+        return False
+
+    sock = DeflateSocket(getattr(imap, 'sslobj', None) or imap.sock, stats)
+    imap.sock = sock
+    if hasattr(imap, 'sslobj'):
+        imap.sslobj = sock  # Python 2 sends and reads through sslobj
+    imap.file = sock.makefile('rb')
+    return True
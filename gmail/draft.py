@@ -1,46 +1,106 @@
+import base64
 import mimetypes
 import os
-from email import encoders
+import re
+import uuid
 from email.header import Header
 from email.charset import Charset
-from email.mime.audio import MIMEAudio
 from email.mime.base import MIMEBase
-from email.mime.image import MIMEImage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import make_msgid, parseaddr, formataddr
 
-
-__all__ = ['Draft']
-
-
-def attachment_factory(attachment_type, is_binary):
-    mode = 'rb' if is_binary else 'r'
-
-    def factory(filename, subtype):
-        with open(filename, mode) as f:
-            content = f.read()
-            return attachment_type(content, _subtype=subtype)
-
-    return factory
-
-
-def default_attachment_type(maintype):
-    def factory(filename, subtype):
-        with open(filename, 'rb') as f:
-            content = f.read()
-            attachment = MIMEBase(maintype, subtype)
-            attachment.set_payload(content)
-            encoders.encode_base64(attachment)
-            return attachment
-    return factory
-
-
-attachment_types = {
-    'text': attachment_factory(MIMEText, False),
-    'image': attachment_factory(MIMEImage, True),
-    'audio': attachment_factory(MIMEAudio, True)
-}
+from six import string_types
+
+from .smtp import send_draft
+
+
+__all__ = ['Attachment', 'Draft']
+
+
+# 57 bytes encode to one 76 character line of base64
+ATTACHMENT_CHUNK_SIZE = 57 * 1024
+
+encodebytes = getattr(base64, 'encodebytes', None) or base64.encodestring
+
+
+class Attachment(object):
+    """A file that is base64 encoded a chunk at a time while the message is written out.
+
+    source is a path or a file-like object; the filename defaults to the basename of either.
+    """
+
+    def __init__(self, source, filename=None):
+        self.source = source
+        self.path = source if isinstance(source, string_types) else None
+        self.filename = filename or os.path.basename(self.path or getattr(source, 'name', '') or 'attachment')
+        # a file-like object is read again from here each time the message is written out
+        self.position = None if self.path else self.tell()
+        self.marker = 'attachment-%s' % uuid.uuid4().hex
+
+    def tell(self):
+        try:
+            return self.source.tell()
+        except (AttributeError, IOError, OSError):
+            return None
+
+    def content_type(self):
+        ctype, encoding = mimetypes.guess_type(self.filename)
+        if ctype is None or encoding is not None:
+            ctype = 'application/octet-stream'
+        return ctype.split('/', 1)
+
+    def part(self):
+        maintype, subtype = self.content_type()
+        part = MIMEBase(maintype, subtype)
+        part['Content-Transfer-Encoding'] = 'base64'
+        part.add_header('Content-Disposition', 'attachment', filename=self.filename)
+        part.set_payload(self.marker)
+        return part
+
+    def file_size(self):
+        if self.path:
+            return os.path.getsize(self.path)
+        if self.position is None:
+            return None
+        self.source.seek(0, os.SEEK_END)
+        size = self.source.tell() - self.position
+        self.source.seek(self.position)
+        return size
+
+    # the size of the encoded content, CRLF line endings included
+    def size(self):
+        size = self.file_size()
+        if size is None:
+            return None
+        encoded = (size + 2) // 3 * 4
+        return encoded + (encoded + 75) // 76 * 2
+
+    # every chunk but the last is encoded from a multiple of 57 bytes, so that together they make whole lines; what a
+    # short read leaves over goes into the next chunk
+    def chunks(self, chunk_size=ATTACHMENT_CHUNK_SIZE):
+        if chunk_size < 57:
+            raise ValueError('chunk_size must be at least 57 bytes')
+        chunk_size -= chunk_size % 57
+        source = open(self.path, 'rb') if self.path else self.source
+        try:
+            if self.position is not None:
+                source.seek(self.position)
+            rest = b''
+            while True:
+                data = source.read(chunk_size)
+                if not data:
+                    break
+                data = rest + data
+                whole = len(data) - len(data) % 57
+                rest = data[whole:]
+                if whole:
+                    yield encodebytes(data[:whole]).replace(b'\n', b'\r\n')
+            if rest:
+                yield encodebytes(rest).replace(b'\n', b'\r\n')
+        finally:
+            if self.path:
+                source.close()
 
 
 def guess_charset(content):
@@ -51,6 +111,13 @@ def guess_charset(content):
         return 'utf-8'
 
 
+def encode_address(addr):
+    name, email = parseaddr(addr)
+    charset = Charset(guess_charset(name))
+    encoded_name = charset.header_encode(name)
+    return formataddr((encoded_name, email))
+
+
 class Draft(object):
     def __init__(self, gmail, sender, recipients, subject, plain=None, html=None, cc=None, bcc=None, attachments=None, headers=None):
         if plain is None and html is None:
@@ -71,12 +138,6 @@ class Draft(object):
 
     def _populate_header(self, subject, sender, recipients, cc, headers):
         def populate_addresses(field, addresses):
-            def encode_address(addr):
-                name, email = parseaddr(addr)
-                charset = Charset(guess_charset(name))
-                encoded_name = charset.header_encode(name)
-                return formataddr((encoded_name, email))
-
             if addresses:
                 self.message[field] = ', '.join(map(encode_address, addresses))
 
@@ -85,7 +146,8 @@ class Draft(object):
         self.message['From'] = sender
         populate_addresses('To', recipients)
         populate_addresses('Cc', cc)
-        self.message['Message-ID'] = make_msgid()
+        self.message_id = make_msgid()
+        self.message['Message-ID'] = self.message_id
         for key, value in headers.items():
             self.message[key] = value
 
@@ -102,20 +164,56 @@ class Draft(object):
 
         self.message.attach(body)
 
+    # attachments are paths, file-like objects or (filename, file-like object) tuples
     def _attach(self, attachments):
-        for path in attachments:
-            directory, filename = os.path.split(path)
-            ctype, encoding = mimetypes.guess_type(filename)
-            if ctype is None or encoding is not None:
-                ctype = 'application/octet-stream'
-
-            maintype, subtype = ctype.split('/', 1)
-            factory = attachment_types.get(maintype, default_attachment_type(maintype))
-            attachment = factory(path, subtype)
-            attachment.add_header('Content-Disposition', 'attachment', filename=filename)
-            self.message.attach(attachment)
+        self.attachments = []
+        for attachment in attachments:
+            if isinstance(attachment, tuple):
+                attachment = Attachment(attachment[1], attachment[0])
+            elif not isinstance(attachment, Attachment):
+                attachment = Attachment(attachment)
+            self.attachments.append(attachment)
+            self.message.attach(attachment.part())
+
+    # the message with attachments left out, split where each one goes; the pieces start and end at line boundaries
+    def skeleton(self):
+        text = self.message.as_string()
+        pieces = []
+        for attachment in self.attachments:
+            before, text = text.split(attachment.marker + '\n', 1)
+            pieces.append((before, attachment))
+        pieces.append((text, None))
+        return [(to_crlf(before), attachment) for before, attachment in pieces]
+
+    # yields the message in chunks with CRLF line endings, so attachments never have to be in memory whole
+    def generate(self, chunk_size=ATTACHMENT_CHUNK_SIZE):
+        for before, attachment in self.skeleton():
+            yield before
+            if attachment:
+                for chunk in attachment.chunks(chunk_size):
+                    yield chunk
+
+    # the length of generate()'s output, or None when an attachment's size cannot be told in advance
+    def size(self):
+        total = 0
+        for before, attachment in self.skeleton():
+            total += len(before)
+            if attachment:
+                size = attachment.size()
+                if size is None:
+                    return None
+                total += size
+        return total
+
+    def as_bytes(self):
+        return b''.join(self.generate())
 
     def send(self):
-        self.gmail.smtp.sendmail(self.sender, self.recipients, self.message.as_string())
-        msgid = self.message['Message-ID']
-        return msgid
+        result = send_draft(self.gmail.smtp, self)
+        if result.error:
+            raise result.error
+        return self.message_id
+
+
+def to_crlf(text):
+    return re.sub(r'\r\n|\r|\n', '\r\n', text).encode('utf-8')
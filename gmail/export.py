@@ -0,0 +1,272 @@
+import imaplib
+import io
+import json
+import os
+import re
+import tarfile
+import threading
+import time
+
+from .batch import batch_by_count, batch_by_size, compress_uids
+from .exceptions import GmailException
+from .parser import parse_fetch_response, to_bytes
+
+
+# the raw message is fetched as is, with what the sidecar metadata needs
+EXPORT_ITEMS = '(UID FLAGS INTERNALDATE X-GM-THRID X-GM-MSGID X-GM-LABELS BODY.PEEK[])'
+
+# Maildir info letters, in the order they go into file names
+MAILDIR_FLAGS = (('\\Draft', 'D'), ('\\Flagged', 'F'), ('\\Answered', 'R'), ('\\Seen', 'S'), ('\\Deleted', 'T'))
+
+FROM_LINE = re.compile(br'^(>*From )', re.MULTILINE)
+
+
+def metadata(mailbox, items):
+    return {
+        'mailbox': mailbox.name,
+        'uid': int(items['UID']),
+        'message_id': items.get('X-GM-MSGID'),
+        'thread_id': items.get('X-GM-THRID'),
+        'flags': list(items.get('FLAGS') or []),
+        'labels': list(items.get('X-GM-LABELS') or []),
+        'internal_date': items.get('INTERNALDATE'),
+    }
+
+
+def internal_time(internal_date):
+    parsed = imaplib.Internaldate2tuple(('INTERNALDATE "%s"' % internal_date).encode()) if internal_date else None
+    return parsed or time.localtime()
+
+
+class ExportCheckpoint(object):
+    """Remembers, in a JSON file, the last UID exported from each mailbox and the state of its writer.
+
+    The file is rewritten after every batch the writer has committed, so an export that stops
+    halfway resumes after the last whole batch.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def load(self, mailbox):
+        with self.lock:
+            return self.read().get(mailbox)
+
+    def save(self, mailbox, state):
+        with self.lock:
+            states = self.read()
+            states[mailbox] = state
+            temp_file = '%s.%s.tmp' % (self.path, threading.current_thread().ident)
+            with open(temp_file, 'w') as f:
+                json.dump(states, f)
+            os.rename(temp_file, self.path)
+
+
+class MboxWriter(object):
+    """Appends raw messages to an mboxrd file, and their flags and labels as JSON lines to path.jsonl.
+
+    Lines are written with LF endings and those starting with From are quoted. A resumed export
+    first cuts both files back to where the last committed batch ended.
+    """
+
+    def __init__(self, path, metadata_path=None):
+        self.path = path
+        self.metadata_path = metadata_path or path + '.jsonl'
+        self.file = None
+        self.metadata_file = None
+
+    def open(self, mailbox, state=None):
+        self.file = open_at(self.path, state and state['offset'])
+        self.metadata_file = open_at(self.metadata_path, state and state['metadata_offset'])
+
+    def write(self, raw, info):
+        info['offset'] = self.file.tell()
+        from_line = 'From MAILER-DAEMON %s\n' % time.asctime(internal_time(info['internal_date']))
+        self.file.write(from_line.encode())
+        raw = FROM_LINE.sub(br'>\1', raw.replace(b'\r\n', b'\n'))
+        self.file.write(raw if raw.endswith(b'\n') else raw + b'\n')
+        self.file.write(b'\n')
+        self.metadata_file.write((json.dumps(info) + '\n').encode())
+
+    def commit(self):
+        sync(self.file)
+        sync(self.metadata_file)
+        return {'offset': self.file.tell(), 'metadata_offset': self.metadata_file.tell()}
+
+    def close(self):
+        for f in (self.file, self.metadata_file):
+            if f:
+                f.close()
+        self.file = self.metadata_file = None
+
+
+class MaildirWriter(object):
+    """Writes each raw message to its own file in a Maildir, with the flags in the file name, and the
+    flags and labels of all of them as JSON lines to gmail.jsonl in the Maildir.
+
+    Files are named by UIDVALIDITY and UID, so the messages of a batch written again on resume
+    replace the ones written before. The files of an earlier UIDVALIDITY are removed when the
+    export starts, as their UIDs have been given to other messages.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.metadata_file = None
+        self.uidvalidity = None
+        for directory in ('tmp', 'new', 'cur'):
+            if not os.path.isdir(os.path.join(path, directory)):
+                os.makedirs(os.path.join(path, directory))
+
+    def open(self, mailbox, state=None):
+        self.uidvalidity = mailbox.uidvalidity
+        for directory in ('tmp', 'cur'):
+            for name in os.listdir(os.path.join(self.path, directory)):
+                if name.partition(':')[0].endswith('.gmail') and name.split('.', 1)[0] != str(self.uidvalidity):
+                    os.remove(os.path.join(self.path, directory, name))
+        self.metadata_file = open_at(os.path.join(self.path, 'gmail.jsonl'), state and state['metadata_offset'])
+
+    def write(self, raw, info):
+        flags = ''.join(letter for flag, letter in MAILDIR_FLAGS if flag in info['flags'])
+        name = '%s.%d.gmail' % (self.uidvalidity, info['uid'])
+        temp_file = os.path.join(self.path, 'tmp', name)
+        with open(temp_file, 'wb') as f:
+            f.write(raw)
+        mtime = time.mktime(internal_time(info['internal_date']))
+        os.utime(temp_file, (mtime, mtime))
+        info['file'] = 'cur/%s:2,%s' % (name, flags)
+        os.rename(temp_file, os.path.join(self.path, info['file']))
+        self.metadata_file.write((json.dumps(info) + '\n').encode())
+
+    def commit(self):
+        sync(self.metadata_file)
+        return {'metadata_offset': self.metadata_file.tell()}
+
+    def close(self):
+        if self.metadata_file:
+            self.metadata_file.close()
+        self.metadata_file = None
+
+
+class ArchiveWriter(object):
+    """Writes each batch to a compressed tar archive of its own in the directory path.
+
+    An archive holds a UID.eml file per message and a metadata.jsonl with their flags and labels,
+    and is named by UIDVALIDITY and the first and last UID in it. compression is 'gz', 'bz2' or 'xz'.
+    An archive only gets its name once its batch is committed.
+    """
+
+    def __init__(self, path, compression='gz'):
+        self.path = path
+        self.compression = compression
+        self.uidvalidity = None
+        self.archive = None
+        self.temp_file = None
+        self.metadata = []
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def open(self, mailbox, state=None):
+        self.uidvalidity = mailbox.uidvalidity
+
+    def add(self, name, data, mtime=None):
+        member = tarfile.TarInfo(name)
+        member.size = len(data)
+        member.mtime = mtime or time.time()
+        self.archive.addfile(member, io.BytesIO(data))
+
+    def write(self, raw, info):
+        if not self.archive:
+            self.temp_file = os.path.join(self.path, '%s.%s.tmp' % (self.uidvalidity, threading.current_thread().ident))
+            self.archive = tarfile.open(self.temp_file, 'w:' + self.compression)
+        self.add('%d.eml' % info['uid'], raw, time.mktime(internal_time(info['internal_date'])))
+        self.metadata.append(info)
+
+    def commit(self):
+        if self.archive:
+            self.add('metadata.jsonl', ''.join(json.dumps(info) + '\n' for info in self.metadata).encode())
+            self.archive.close()
+            name = '%s.%d-%d.tar.%s' % (self.uidvalidity, self.metadata[0]['uid'], self.metadata[-1]['uid'], self.compression)
+            os.rename(self.temp_file, os.path.join(self.path, name))
+            self.archive = None
+            self.metadata = []
+        return {}
+
+    def close(self):
+        if self.archive:
+            self.archive.close()
+            os.remove(self.temp_file)
+        self.archive = None
+        self.metadata = []
+
+
+def open_at(path, offset=None):
+    f = open(path, 'r+b' if offset is not None and os.path.exists(path) else 'wb')
+    f.truncate(offset or 0)
+    f.seek(offset or 0)
+    return f
+
+
+def sync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+# writes the raw messages of a mailbox that match the search arguments, in UID order; UIDs are searched span at a
+# time and fetched a batch at a time, so memory stays the same however large the mailbox
+def export_mailbox(mailbox, writer, checkpoint=None, batch_size=None, batch_bytes=None, span=None, **kwargs):
+    gmail = mailbox.gmail
+    with mailbox.connection() as imap:
+        # a fresh SELECT reports the current UIDVALIDITY and UIDNEXT
+        gmail.select(imap, mailbox.name, force=True)
+
+    state = checkpoint.load(mailbox.name) if checkpoint else None
+    if state and state['uidvalidity'] != mailbox.uidvalidity:
+        state = None  # the UIDs have been reassigned; export everything again
+    last_uid = state['last_uid'] if state else 0
+    span = span or gmail.EXPORT_SEARCH_SPAN
+
+    exported = 0
+    writer.open(mailbox, state and state['writer'])
+    try:
+        start = last_uid + 1
+        while not mailbox.uidnext or start < mailbox.uidnext:
+            # without UIDNEXT a single search finds everything left; n:* also matches the last UID when it is below n
+            uid_range = '%d:%d' % (start, min(start + span, mailbox.uidnext) - 1) if mailbox.uidnext else '%d:*' % start
+            uids = [uid for uid in mailbox.search(uid_range=uid_range, **kwargs) if int(uid) >= start]
+            if batch_bytes:
+                batches = batch_by_size(uids, gmail.fetch_sizes(uids, mailbox.name), batch_bytes, batch_size)
+            else:
+                batches = batch_by_count(uids, batch_size or gmail.FETCH_BATCH_SIZE)
+
+            for batch in batches:
+                with mailbox.connection() as imap:
+                    response, results = imap.uid('FETCH', compress_uids(batch), EXPORT_ITEMS)
+                if response != 'OK':
+                    raise GmailException('export of %s stopped at UID %s: %s' % (mailbox.name, batch[0], results))
+                fetched = sorted((items for sequence, items in parse_fetch_response(results) if 'BODY[]' in items),
+                                 key=lambda items: int(items['UID']))
+                for items in fetched:
+                    writer.write(to_bytes(items['BODY[]']), metadata(mailbox, items))
+                exported += len(fetched)
+
+                last_uid = int(batch[-1])
+                if checkpoint:
+                    checkpoint.save(mailbox.name, {'uidvalidity': mailbox.uidvalidity, 'last_uid': last_uid,
+                                                   'writer': writer.commit()})
+                else:
+                    writer.commit()
+
+            if not mailbox.uidnext:
+                break
+            start += span
+    finally:
+        writer.close()
+    return exported
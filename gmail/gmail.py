@@ -2,11 +2,55 @@ import base64
 import imaplib
 import re
 import smtplib
+from contextlib import contextmanager
 
 from .mailbox import Mailbox
 from .exceptions import AuthenticationError
 from .draft import Draft
-from .utf import decode as decode_utf7, encode as encode_utf7
+from .batch import batch_by_count, batch_by_size, sort_uids
+from .message import FETCH_METADATA, fetch_items
+from .parser import parse_fetch_response, parse_mailbox_list, parse_status
+from .labels import SPECIAL_USE, STATUS_ITEMS, label_tree
+from .selection import Selection, SelectionTracker
+from .compress import CompressionStats, compress
+from .pool import ConnectionPool
+from .parallel import ParallelFetcher
+from .smtp import BulkSender
+from .template import DraftTemplate
+from .utf import decode as decode_utf7, quote
+
+
+# groups messages with the same MIME layout, so that each group needs a single FETCH of its text sections
+def text_layouts(messages):
+    layouts = {}
+    for message in messages:
+        sections = tuple(part[0] for part in message.text_parts())
+        if sections:
+            layouts.setdefault(sections, {})[message.uid] = message
+    return [('(%s)' % ' '.join('BODY.PEEK[%s]' % section for section in sections), grouped)
+            for sections, grouped in layouts.items()]
+
+
+# returns (attributes, delimiter, name, status) for each mailbox of the data of LIST responses
+def list_entries(mailbox_list, statuses=None):
+    return [(attributes, delimiter, decode_utf7(name), (statuses or {}).get(name))
+            for attributes, delimiter, name in parse_mailbox_list(mailbox_list)]
+
+
+# adds the mailboxes that can be selected to gmail.mailboxes, making the missing ones with mailbox_class
+def add_mailboxes(gmail, entries, mailbox_class):
+    for attributes, delimiter, mailbox_name, status in entries:
+        if 'Noselect' in attributes or 'NonExistent' in attributes:
+            continue
+        mailbox = gmail.mailboxes.get(mailbox_name) or mailbox_class(gmail, mailbox_name)
+        mailbox.attributes = attributes
+        mailbox.delimiter = delimiter
+        if status:
+            mailbox.load_status(status)
+        gmail.mailboxes[mailbox_name] = mailbox
+        for attribute in attributes:
+            if attribute in SPECIAL_USE:
+                gmail.special_mailboxes[attribute] = mailbox_name
 
 
 class Gmail():
@@ -18,7 +62,22 @@ class Gmail():
     GMAIL_SMTP_HOST = "smtp.gmail.com"
     GMAIL_SMTP_PORT = 587
 
-    def __init__(self):
+    # number of messages requested per UID FETCH when prefetching
+    FETCH_BATCH_SIZE = 500
+
+    # number of messages changed per UID STORE
+    STORE_BATCH_SIZE = 1000
+
+    # number of threads looked up per UID SEARCH
+    THREAD_SEARCH_SIZE = 100
+    # number of messages sent per batch of pipelined APPENDs, or per MULTIAPPEND
+    APPEND_BATCH_SIZE = 100
+
+    # UIDs searched at a time by Mailbox.export
+    EXPORT_SEARCH_SPAN = 20000
+
+    def __init__(self, cache=None, compact_messages=False, drop_tree=False, cache_policy=None, index=None, mailbox_cache=None,
+                 readonly=False, compress=False):
         self.username = None
         self.password = None
         self.access_token = None
@@ -29,51 +88,205 @@ class Gmail():
         self.mailboxes = {}
         self.special_mailboxes = {}
         self.current_mailbox = None
+        self.enabled = set()
+        # with readonly, mailboxes are opened with EXAMINE and cannot be changed
+        self.readonly = readonly
+        self.selections = SelectionTracker()
+        # with compress, IMAP connections use COMPRESS=DEFLATE where the server offers it, and count their bytes here
+        self.compression = CompressionStats() if compress else None
 
         self.imap_connected = False
         self.smtp_connected = False
 
+        # an optional gmail.cache.MessageCache
+        self.cache = cache
+        self.pool = None
+
+        # mailboxes keep gmail.records.MessageRecords instead of messages, and messages drop their MIME tree once parsed
+        self.compact_messages = compact_messages
+        self.drop_tree = drop_tree
+        # makes the gmail.policy.CachePolicy of each mailbox, e.g. lambda: CachePolicy(max_messages=10000)
+        self.cache_policy = cache_policy
+        # an optional gmail.index.LocalIndex, filled as messages are loaded
+        self.index = index
+        # an optional gmail.labels.MailboxListCache, to skip listing mailboxes at login
+        self.mailbox_cache = mailbox_cache
+        self.mailbox_entries = []
+        self.mailboxes_cached = False
+
+    def new_imap(self):
+        return imaplib.IMAP4_SSL(self.GMAIL_IMAP_HOST, self.GMAIL_IMAP_PORT)
+
+    # logs another connection in with the credentials of this session
+    def imap_login(self, imap):
+        if self.access_token:
+            auth_string = 'user=%s\1auth=Bearer %s\1\1' % (self.username, self.access_token)
+            imap.authenticate('XOAUTH2', lambda x: auth_string)
+        else:
+            imap.login(self.username, self.password)
+        self.refresh_capabilities(imap)
+        for capability in self.enabled:
+            imap.xatom('ENABLE', capability)
+        self.compress(imap)
+        return imap
+
+    # servers announce more capabilities once logged in, while imaplib only asks for them before
+    def refresh_capabilities(self, imap):
+        response, data = imap.capability()
+        if response == 'OK' and data and data[-1]:
+            imap.capabilities = tuple(data[-1].decode().upper().split())
+
+    def compress(self, imap):
+        return self.compression is not None and compress(imap, self.compression)
+
+    def new_smtp(self):
+        smtp = smtplib.SMTP(self.GMAIL_SMTP_HOST, self.GMAIL_SMTP_PORT)
+        smtp.ehlo()
+        smtp.starttls()
+        smtp.ehlo()
+        return smtp
+
+    def smtp_login(self, smtp):
+        if self.access_token:
+            auth_string = 'user=%s\1auth=Bearer %s\1\1' % (self.username, self.access_token)
+            code, response = smtp.docmd('AUTH', 'XOAUTH2 ' + base64.b64encode(auth_string.encode('utf-8')).decode('ascii'))
+            if code == 334:
+                # the error details come as a challenge that has to be answered first
+                code, response = smtp.docmd('')
+            if code != 235:
+                raise smtplib.SMTPAuthenticationError(code, response)
+        else:
+            smtp.login(self.username, self.password)
+        return smtp
+
+    def start_pool(self, size=4, timeout=None):
+        if not self.pool:
+            self.pool = ConnectionPool(self, size, timeout)
+        return self.pool
+
+    # yields an IMAP connection with mailbox_name selected, from the pool if there is one
+    @contextmanager
+    def connection(self, mailbox_name=None):
+        if self.pool:
+            with self.pool.connection(mailbox_name) as imap:
+                yield imap
+        else:
+            # the tracked selection, rather than current_mailbox, knows whether a CLOSE or an error ended it
+            if mailbox_name:
+                self.use_mailbox(mailbox_name)
+            yield self.imap
+
     def connect(self, raise_errors=True):
         if not self.imap_connected:
-            self.imap = imaplib.IMAP4_SSL(self.GMAIL_IMAP_HOST, self.GMAIL_IMAP_PORT)
+            self.imap = self.new_imap()
             self.imap_connected = True
 
         if not self.smtp_connected:
-            self.smtp = smtplib.SMTP(self.GMAIL_SMTP_HOST, self.GMAIL_SMTP_PORT)
-            self.smtp.ehlo()
-            self.smtp.starttls()
-            self.smtp.ehlo()
+            self.smtp = self.new_smtp()
             self.smtp_connected = True
 
     @property
     def connected(self):
         return self.imap_connected and self.smtp_connected
 
-    def fetch_mailboxes(self):
-        response, mailbox_list = self.imap.list()
-        if response == 'OK':
-            regex = re.compile(r'\(\\HasNoChildren( \\(?P<special>\w+))?\) "/" "(?P<name>.+)"')
-            for mailbox in mailbox_list:
-                match = regex.match(mailbox.decode())
-                if match:
-                    binding = match.groupdict()
-                    mailbox_name = decode_utf7(binding['name'])
-                    self.mailboxes[mailbox_name] = Mailbox(self, mailbox_name)
-                    special = binding['special']
-                    if special:
-                        self.special_mailboxes[special] = mailbox_name
+    # sets up the mailboxes from the mailbox cache, or else from the server
+    def fetch_mailboxes(self, refresh=False):
+        entries = self.mailbox_cache.load(self.username) if self.mailbox_cache and not refresh else None
+        self.mailboxes_cached = entries is not None
+        if entries is None:
+            entries = self.list_mailboxes()
+            if self.mailbox_cache and entries:
+                self.mailbox_cache.store(self.username, entries)
+        self.load_mailboxes(entries)
+
+    # returns (attributes, delimiter, name, status) for every mailbox, with the status of all of them in the same
+    # exchange when the server has LIST-STATUS
+    def list_mailboxes(self):
+        statuses = {}
+        if self.has_capability('LIST-STATUS'):
+            self.imap.response('STATUS')  # drops responses left over from earlier commands
+            response, data = self.imap.xatom('LIST', '""', '"*"', 'RETURN', '(STATUS (%s))' % ' '.join(STATUS_ITEMS))
+            mailbox_list = self.imap.response('LIST')[1]
+            statuses = parse_status(self.imap.response('STATUS')[1])
+        else:
+            response, mailbox_list = self.imap.list()
+        if response != 'OK':
+            return []
+        return list_entries(mailbox_list, statuses)
+
+    def load_mailboxes(self, entries):
+        self.mailbox_entries = entries
+        add_mailboxes(self, entries, Mailbox)
+
+    # the root of the label hierarchy
+    def label_tree(self):
+        return label_tree(self.mailbox_entries, self.mailboxes)
+
+    def response_code(self, code, imap=None):
+        response, data = (imap or self.imap).response(code)
+        return data[-1].decode() if data and data[-1] else None
+
+    # selects a mailbox, or examines it in a read-only session; nothing is sent when the connection already has the
+    # mailbox selected, unless force asks for the current UIDNEXT and HIGHESTMODSEQ
+    def select(self, imap, mailbox, readonly=None, force=False):
+        readonly = self.readonly if readonly is None else readonly
+        selection = self.selections.current(imap)
+        if not force and selection and selection.covers(mailbox, readonly):
+            self.selections.skipped += 1
+            exists = self.response_code('EXISTS', imap)  # reported by the commands run since
+            if exists:
+                selection.exists = int(exists)
+            self.selected_mailbox(selection)
+            return 'OK', [str(selection.exists).encode()]
+
+        self.selections.forget(imap)
+        response, data = imap.select(quote(mailbox), readonly)
+        if response != 'OK':
+            return response, data
+
+        uidvalidity = self.response_code('UIDVALIDITY', imap)
+        uidnext = self.response_code('UIDNEXT', imap)
+        highestmodseq = self.response_code('HIGHESTMODSEQ', imap)
+        selection = Selection(mailbox, readonly, int(data[0]), int(uidvalidity) if uidvalidity else None,
+                              int(uidnext) if uidnext else None, int(highestmodseq) if highestmodseq else None)
+        self.selections.selected(imap, selection)
+        self.selected_mailbox(selection)
+        if self.cache and uidvalidity:
+            self.cache.check_uidvalidity(mailbox, uidvalidity)
+        if self.index and uidvalidity:
+            self.index.check_uidvalidity(mailbox, uidvalidity)
+        return response, data
+
+    def selected_mailbox(self, selection):
+        box = self.mailboxes.get(selection.mailbox)
+        if box:
+            box.exists = selection.exists
+            box.uidvalidity = selection.uidvalidity
+            box.uidnext = selection.uidnext
+            box.highestmodseq = selection.highestmodseq
 
     def use_mailbox(self, mailbox):
         if mailbox:
-            self.imap.select(encode_utf7(mailbox))
+            self.select(self.imap, mailbox)
         self.current_mailbox = mailbox
 
-    def mailbox(self, mailbox_name):
-        mailbox = self.mailboxes.get(mailbox_name)
-        if mailbox and not self.current_mailbox == mailbox_name:
-            self.use_mailbox(mailbox_name)
+    def has_capability(self, capability):
+        return capability in self.imap.capabilities
 
-        return mailbox
+    # ENABLE is only allowed before a mailbox is selected
+    def enable(self, capability):
+        if capability not in self.enabled and self.has_capability(capability) and self.imap.state == 'AUTH':
+            response, data = self.imap.xatom('ENABLE', capability)
+            if response == 'OK':
+                self.enabled.add(capability)
+        return capability in self.enabled
+
+    # the mailbox is selected by the first command that needs it
+    def mailbox(self, mailbox_name):
+        # a mailbox missing from a cached list may have been created since
+        if mailbox_name not in self.mailboxes and self.mailboxes_cached:
+            self.fetch_mailboxes(refresh=True)
+        return self.mailboxes.get(mailbox_name)
 
     def special_mailbox(self, mailbox_name):
         real_name = self.special_mailboxes.get(mailbox_name)
@@ -82,7 +295,7 @@ class Gmail():
     def create_mailbox(self, mailbox_name):
         mailbox = self.mailboxes.get(mailbox_name)
         if not mailbox:
-            self.imap.create(encode_utf7(mailbox_name))
+            self.imap.create(quote(mailbox_name))
             mailbox = Mailbox(self, mailbox_name)
             self.mailboxes[mailbox_name] = mailbox
 
@@ -91,8 +304,11 @@ class Gmail():
     def delete_mailbox(self, mailbox_name):
         mailbox = self.mailboxes.get(mailbox_name)
         if mailbox:
-            self.imap.delete(encode_utf7(mailbox_name))
+            self.imap.delete(quote(mailbox_name))
             del self.mailboxes[mailbox_name]
+            self.selections.forget_mailbox(mailbox_name)
+            if self.current_mailbox == mailbox_name:
+                self.current_mailbox = None
 
     def login(self, username, password):
         username = username if '@' in username else username + '@gmail.com'
@@ -107,12 +323,15 @@ class Gmail():
             imap_login = self.imap.login(self.username, self.password)
             imap_logged_in = (imap_login and imap_login[0] == 'OK')
             if imap_logged_in:
+                self.refresh_capabilities(self.imap)
+                self.enable('QRESYNC') or self.enable('CONDSTORE')
+                self.compress(self.imap)
                 self.fetch_mailboxes()
         except imaplib.IMAP4.error:
             raise AuthenticationError
 
         try:
-            self.smtp.login(self.username, self.password)
+            self.smtp_login(self.smtp)
             smtp_logged_in = True
         except (smtplib.SMTPHeloError,
                 smtplib.SMTPAuthenticationError,
@@ -137,12 +356,15 @@ class Gmail():
             imap_auth = self.imap.authenticate('XOAUTH2', lambda x: auth_string)
             imap_logged_in = (imap_auth and imap_auth[0] == 'OK')
             if imap_logged_in:
+                self.refresh_capabilities(self.imap)
+                self.enable('QRESYNC') or self.enable('CONDSTORE')
+                self.compress(self.imap)
                 self.fetch_mailboxes()
         except imaplib.IMAP4.error:
             raise AuthenticationError
 
         try:
-            self.smtp.login('XOAUTH2', base64.b64encode(auth_string))
+            self.smtp_login(self.smtp)
             smtp_logged_in = True
         except (smtplib.SMTPHeloError,
                 smtplib.SMTPAuthenticationError,
@@ -154,6 +376,9 @@ class Gmail():
         return self.logged_in
 
     def logout(self):
+        if self.pool:
+            self.pool.close()
+            self.pool = None
         self.imap.logout()
         self.smtp.quit()
         self.smtp_connected = False
@@ -166,20 +391,143 @@ class Gmail():
         box = self.mailbox(mailbox_name) if mailbox_name else self.all_mail()
         return box.mail(**kwargs)
 
+    # searches the local index of every mailbox with the arguments of Mailbox.mail, fetching the matches that are no
+    # longer held in memory with profile
+    def local_search(self, profile='envelope', **kwargs):
+        emails = []
+        for mailbox_name, uid in self.index.search(**kwargs):
+            mailbox = self.mailboxes.get(mailbox_name)
+            if mailbox:
+                emails.append(mailbox.messages.get(uid) or mailbox.message_class(mailbox, uid))
+        unfetched = {}
+        for email in emails:
+            if profile and not email.is_fetched(profile):
+                unfetched.setdefault(email.mailbox.name, {})[email.uid] = email
+        for messages in unfetched.values():
+            self.fetch_multiple_messages(messages, profile=profile)
+        return emails
+
     def copy(self, uid, to_mailbox, from_mailbox=None):
-        if from_mailbox:
-            self.use_mailbox(from_mailbox)
-        self.imap.uid('COPY', uid, encode_utf7(to_mailbox))
-
-    def fetch_multiple_messages(self, messages):
-        fetch_str = ','.join(messages.keys())
-        response, results = self.imap.uid('FETCH', fetch_str, '(BODY.PEEK[] FLAGS X-GM-THRID X-GM-MSGID X-GM-LABELS)')
-        for raw_message in results:
-            if isinstance(raw_message, tuple):
-                search = re.search(r'UID (\d+)', raw_message[0].decode('utf-8'))
-                if search:
-                    uid = search.groups(1)[0]
-                    messages[uid].parse(raw_message)
+        with self.connection(from_mailbox) as imap:
+            imap.uid('COPY', uid, quote(to_mailbox))
+
+    def fetch_sizes(self, uids, mailbox_name=None):
+        sizes = {}
+        for batch in batch_by_count(uids, self.FETCH_BATCH_SIZE):
+            with self.connection(mailbox_name) as imap:
+                response, results = imap.uid('FETCH', ','.join(batch), '(RFC822.SIZE)')
+            if response == 'OK':
+                for result in results:
+                    if isinstance(result, tuple):
+                        result = result[0]
+                    result = result.decode('utf-8')
+                    uid = re.search(r'UID (\d+)', result)
+                    size = re.search(r'RFC822\.SIZE (\d+)', result)
+                    if uid and size:
+                        sizes[uid.group(1)] = int(size.group(1))
+        return sizes
+
+    def messages_mailbox_name(self, messages):
+        mailbox = next(iter(messages.values())).mailbox if messages else None
+        return mailbox.name if mailbox else None
+
+    def fetch_messages(self, messages, profile='full'):
+        with self.connection(self.messages_mailbox_name(messages)) as imap:
+            return self.fetch_messages_with(imap, messages, profile)
+
+    # like fetch_messages, over a connection that has the mailbox of the messages selected already
+    def fetch_messages_with(self, imap, messages, profile='full'):
+        if self.index:
+            # the messages are indexed together, once their profile is recorded
+            with self.index.batch():
+                return self.load_messages(imap, messages, profile)
+        return self.load_messages(imap, messages, profile)
+
+    def load_messages(self, imap, messages, profile):
+        fetched = []
+        if self.cache:
+            fetched = self.fetch_cached_messages(imap, messages)
+            messages = dict((uid, message) for uid, message in messages.items() if message not in fetched)
+
+        if messages:
+            response, results = imap.uid('FETCH', ','.join(messages.keys()), fetch_items(profile))
+            if response == 'OK':
+                for sequence, items in parse_fetch_response(results):
+                    message = messages.get(items.get('UID'))
+                    if message:
+                        message.load(items)
+                        fetched.append(message)
+                        if self.cache and 'BODY[]' in items and message.message_id:
+                            self.cache.store(self.cached_mailbox_name(message), message.uid, message.message_id, items['BODY[]'],
+                                             message.thread_id, message.flags, message.labels)
+
+        if profile == 'text':
+            self.fetch_text_sections(imap, fetched)
+
+        for message in fetched:
+            message.profiles.add(profile)
+
+        return fetched
+
+    def cached_mailbox_name(self, message):
+        # UID mappings are only kept for mailboxes whose UIDVALIDITY has been checked
+        mailbox = message.mailbox
+        return mailbox.name if mailbox and mailbox.uidvalidity else None
+
+    # flags and labels always come from the server, with one small FETCH for all the UIDs that also tells their
+    # X-GM-MSGID; only the bodies are taken from the cache
+    def fetch_cached_messages(self, imap, messages):
+        fetched = []
+        if not messages:
+            return fetched
+
+        mailbox_name = self.cached_mailbox_name(next(iter(messages.values())))
+        response, results = imap.uid('FETCH', ','.join(messages.keys()), '(%s)' % FETCH_METADATA)
+        if response != 'OK':
+            return fetched
+
+        for sequence, metadata in parse_fetch_response(results):
+            message = messages.get(metadata.get('UID'))
+            items = self.cache.load(metadata.get('X-GM-MSGID'))
+            if message and items:
+                items.update(metadata)
+                message.load(items)
+                message.profiles.add('full')
+                fetched.append(message)
+                self.cache.update_metadata(message.message_id, message.thread_id, message.flags, message.labels)
+                if mailbox_name:
+                    self.cache.map_uid(mailbox_name, message.uid, message.message_id)
+        return fetched
+
+    def fetch_text_sections(self, imap, messages):
+        for fetch_str, grouped in text_layouts(messages):
+            response, results = imap.uid('FETCH', ','.join(grouped.keys()), fetch_str)
+            if response == 'OK':
+                for sequence, items in parse_fetch_response(results):
+                    message = grouped.get(items.get('UID'))
+                    if message:
+                        message.load(items)
+
+    # with a concurrency above one, batches are fetched in parallel on pooled connections
+    # splits UIDs into batches of batch_size messages, or of batch_bytes by their RFC822.SIZE
+    def uid_batches(self, uids, batch_size=None, batch_bytes=None, mailbox_name=None):
+        if batch_bytes:
+            return batch_by_size(uids, self.fetch_sizes(uids, mailbox_name), batch_bytes, batch_size)
+        return batch_by_count(uids, batch_size or self.FETCH_BATCH_SIZE)
+
+    # fetches each {uid: message} batch as it is needed, and yields its fetched messages
+    def fetch_batches(self, batches, profile='full', concurrency=None, ordered=True):
+        if concurrency and concurrency > 1:
+            return ParallelFetcher(self, concurrency, ordered=ordered).fetch_batches(batches, profile)
+        return (self.fetch_messages(batch, profile) for batch in batches)
+
+    def fetch_message_batches(self, messages, batch_size=None, batch_bytes=None, profile='full', concurrency=None, ordered=True):
+        batches = self.uid_batches(sort_uids(messages.keys()), batch_size, batch_bytes, self.messages_mailbox_name(messages))
+        return self.fetch_batches((dict((uid, messages[uid]) for uid in batch) for batch in batches), profile, concurrency, ordered)
+
+    def fetch_multiple_messages(self, messages, batch_size=None, batch_bytes=None, profile='full', concurrency=None):
+        for batch in self.fetch_message_batches(messages, batch_size, batch_bytes, profile, concurrency):
+            pass
 
         return messages
 
@@ -204,10 +552,40 @@ class Gmail():
     def important(self):
         return self.special_mailbox("Important")
 
+    # every message is in All Mail, so a single mailbox has the whole of any thread
+    def all_mail_mailbox(self):
+        name = self.special_mailboxes.get('All', '[Gmail]/All Mail')
+        if name not in self.mailboxes:
+            self.mailboxes[name] = Mailbox(self, name)
+        return self.mailboxes[name]
+
+    def threads(self, thread_ids, profile='headers', batch_size=None):
+        return self.all_mail_mailbox().threads(thread_ids, profile, batch_size)
+
+    def thread(self, thread_id, profile='headers'):
+        return self.threads([thread_id], profile)[0]
+
+    def trash_mailbox_name(self):
+        return self.special_mailboxes.get('Trash') or ('[Gmail]/Bin' if '[Gmail]/Bin' in self.mailboxes else '[Gmail]/Trash')
+
     def mail_domain(self):
         return self.username.split('@')[-1]
 
-    def send(self, recipients, subject, plain=None, html=None, sender=None, cc=None, bcc=None, attachments=None, headers=None):
+    def draft(self, recipients, subject, plain=None, html=None, sender=None, cc=None, bcc=None, attachments=None, headers=None):
         sender = sender or self.username
-        draft = Draft(self, sender, recipients, subject, plain, html, cc, bcc, attachments, headers)
-        return draft.send()
+        return Draft(self, sender, recipients, subject, plain, html, cc, bcc, attachments, headers)
+
+    def template(self, subject, plain=None, html=None, sender=None, cc=None, bcc=None, attachments=None, headers=None):
+        return DraftTemplate(self, subject, plain, html, sender, cc, bcc, attachments, headers)
+
+    def send(self, recipients, subject, plain=None, html=None, sender=None, cc=None, bcc=None, attachments=None, headers=None):
+        return self.draft(recipients, subject, plain, html, sender, cc, bcc, attachments, headers).send()
+
+    # yields a gmail.smtp.SendResult for each draft, in order, sending on several SMTP sessions at once
+    def send_bulk(self, drafts, sessions=4, max_rate=None):
+        sender = BulkSender(self, sessions, max_rate)
+        try:
+            for result in sender.send(drafts):
+                yield result
+        finally:
+            sender.close()
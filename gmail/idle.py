@@ -0,0 +1,237 @@
+import re
+import select
+import ssl
+import threading
+import time
+
+from .batch import sort_uids
+from .exceptions import ConnectionError
+from .parser import parse_fetch_response, to_text
+from .sync import fetch_metadata
+
+
+UNTAGGED = re.compile(br'^\* (\d+) (EXISTS|EXPUNGE|FETCH|RECENT)(?: (.*))?$', re.IGNORECASE)
+
+
+class IdleEvent(object):
+    def __init__(self, type, number, items=None):
+        self.type = type
+        self.number = number
+        self.items = items or {}
+        # the UID of the message the sequence number stood for, when known
+        self.uid = None
+
+    def __repr__(self):
+        return '<IdleEvent %s %d>' % (self.type, self.number)
+
+
+class IdleWatcher(object):
+    """Keeps a selected mailbox in IMAP IDLE and yields its new messages.
+
+    Iterating over the watcher (with ``for`` or ``async for``) blocks until new mail arrives;
+    run_in_thread() does it on a thread of its own. ``on_event`` is called with every EXISTS,
+    EXPUNGE, FETCH and RECENT response.
+
+    The watcher logs in on a connection of its own, so that IDLE never blocks the session's
+    other commands. Flag changes and expunges it hears about are applied to the mailbox's messages.
+    """
+
+    # RFC 2177 asks clients to re-issue IDLE at least every 29 minutes
+    RENEW_INTERVAL = 29 * 60
+
+    # how often stop() is checked for while waiting
+    POLL_INTERVAL = 1
+
+    def __init__(self, mailbox, prefetch=True, profile='full', on_event=None, renew_interval=None):
+        self.mailbox = mailbox
+        self.gmail = mailbox.gmail
+        self.prefetch = prefetch
+        self.profile = profile
+        self.on_event = on_event
+        self.renew_interval = renew_interval or self.RENEW_INTERVAL
+
+        self.stopped = False
+        self.imap = None
+        self.uidnext = None
+        # the UIDs of the mailbox in sequence number order, to tell which message an event is about
+        self.uids = []
+        self.messages = None
+        self.executor = None
+        self.thread = None
+
+    def stop(self):
+        self.stopped = True
+
+    # whether imaplib has read more from the socket than it has handed over, which select cannot tell
+    def buffered(self):
+        sock = getattr(self.imap, 'sslobj', None) or self.imap.sock
+        pending = getattr(sock, 'pending', None)
+        if pending and pending():
+            return True
+        buffer = getattr(self.imap.file, '_rbuf', None)  # Python 2's socket._fileobject
+        if buffer is not None:
+            return len(buffer.getvalue()) > 0
+        if not hasattr(self.imap.file, 'peek'):
+            return False
+        # peeking fills an empty buffer from the socket, so it must not wait for it
+        timeout = sock.gettimeout()
+        sock.settimeout(0)
+        try:
+            return len(self.imap.file.peek(1)) > 0
+        except ssl.SSLWantReadError:
+            return False
+        finally:
+            sock.settimeout(timeout)
+
+    # reads a line through imaplib, so nothing it has buffered is missed; returns None when there is none in time
+    def read_line(self, timeout):
+        if not self.buffered() and not select.select([self.imap.sock], [], [], timeout)[0]:
+            return None
+        line = self.imap.readline()
+        if not line:
+            raise ConnectionError('connection closed while idling')
+        return line.rstrip(b'\r\n')
+
+    def parse_event(self, line):
+        match = UNTAGGED.match(line)
+        if not match:
+            return None
+        number, type, rest = match.groups()
+        items = {}
+        if type.upper() == b'FETCH' and rest:
+            responses = parse_fetch_response([number + b' ' + rest])
+            items = responses[0][1] if responses else {}
+        return IdleEvent(type.upper().decode(), int(number), items)
+
+    def wait(self, timeout=None):
+        imap = self.imap
+        tag = imap._new_tag()
+        imap.send(tag + b' IDLE\r\n')
+
+        events = []
+        idling = False
+        deadline = time.time() + min(timeout or self.renew_interval, self.renew_interval)
+        try:
+            while not (idling and (events or self.stopped or time.time() >= deadline)):
+                line = self.read_line(max(0, min(self.POLL_INTERVAL, deadline - time.time())) if idling else None)
+                if line is None:
+                    continue
+                if line.startswith(b'+'):
+                    idling = True
+                elif line.startswith(tag):
+                    raise ConnectionError('IDLE refused: %s' % line.decode('utf-8', 'replace'))
+                else:
+                    event = self.parse_event(line)
+                    if event:
+                        events.append(event)
+
+            # responses that arrive before the server acknowledges DONE belong to this round too
+            imap.send(b'DONE\r\n')
+            while True:
+                line = self.read_line(None)
+                if line.startswith(tag):
+                    break
+                event = self.parse_event(line)
+                if event:
+                    events.append(event)
+        finally:
+            imap.tagged_commands.pop(tag, None)
+
+        for event in events:
+            self.handle_event(event)
+        return events
+
+    def handle_event(self, event):
+        if event.type in ('FETCH', 'EXPUNGE'):
+            # a message that arrived during this round is not numbered yet
+            event.uid = event.items.get('UID') or (self.uids[event.number - 1] if event.number <= len(self.uids) else None)
+        if event.type == 'FETCH' and event.uid in self.mailbox.messages:
+            message = self.mailbox.messages[event.uid]
+            message.load(event.items)
+            self.mailbox.messages[event.uid] = message
+        elif event.type == 'EXPUNGE' and event.number <= len(self.uids):
+            del self.uids[event.number - 1]
+            self.mailbox.messages.pop(event.uid, None)
+            self.mailbox.unindex(event.uid)
+        if self.on_event:
+            self.on_event(event)
+
+    def fetch_new(self):
+        if self.uidnext is None:
+            return []
+
+        messages = {}
+        for uid, items in fetch_metadata(self.imap, '%d:*' % self.uidnext):
+            if int(uid) >= self.uidnext:
+                message = self.mailbox.messages.get(uid) or self.mailbox.message_class(self.mailbox, uid)
+                message.load(items)
+                self.mailbox.messages[uid] = message
+                messages[uid] = message
+        if not messages:
+            return []
+
+        uids = sort_uids(messages.keys())
+        self.uids.extend(uids)
+        self.uidnext = int(uids[-1]) + 1
+        if self.prefetch:
+            # over the watcher's own connection, which is not in use by anything else while it is not idling
+            self.gmail.fetch_messages_with(self.imap, messages, self.profile)
+        return [messages[uid] for uid in uids]
+
+    # returns whether mail arrived between the SELECT and the search
+    def start(self):
+        self.gmail.select(self.imap, self.mailbox.name, force=True)
+        response, data = self.imap.uid('SEARCH', 'ALL')
+        uids = sort_uids(to_text(data[0]).split()) if response == 'OK' and data[0] else []
+        self.uidnext = self.mailbox.uidnext or (int(uids[-1]) + 1 if uids else 1)
+        # the new messages are numbered as they are fetched
+        self.uids = [uid for uid in uids if int(uid) < self.uidnext]
+        return len(self.uids) < len(uids)
+
+    def __iter__(self):
+        self.imap = self.gmail.imap_login(self.gmail.new_imap())
+        try:
+            if self.start():
+                for message in self.fetch_new():
+                    yield message
+            while not self.stopped:
+                events = self.wait()
+                if any(event.type == 'EXISTS' for event in events):
+                    for message in self.fetch_new():
+                        yield message
+        finally:
+            try:
+                self.imap.logout()
+            except Exception:
+                pass
+
+    def run(self, callback):
+        for message in self:
+            callback(message)
+
+    # calls callback for each new message on a daemon thread, until stop(); returns the thread
+    def run_in_thread(self, callback):
+        self.thread = threading.Thread(target=self.run, args=(callback,))
+        self.thread.daemon = True
+        self.thread.start()
+        return self.thread
+
+    def next_message(self):
+        if self.messages is None:
+            self.messages = iter(self)
+        try:
+            return next(self.messages)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+
+        # the connection is blocked in IDLE, so the wait happens on a thread of its own
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(1)
+        return asyncio.get_running_loop().run_in_executor(self.executor, self.next_message)
@@ -0,0 +1,159 @@
+import datetime
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+# the Mailbox.mail arguments matched against the text columns
+TEXT_ARGUMENTS = {'sender': 'fr', 'fr': 'fr', 'to': 'recipients', 'cc': 'cc', 'subject': 'subject', 'body': 'body',
+                  'label': 'labels'}
+
+# the Mailbox.mail arguments matched against flags
+FLAG_ARGUMENTS = {'read': 'seen = 1', 'unread': 'seen = 0', 'starred': 'flagged = 1', 'unstarred': 'flagged = 0',
+                  'deleted': 'deleted = 1', 'undeleted': 'deleted = 0', 'draft': 'draft = 1', 'undraft': 'draft = 0'}
+
+TAG = re.compile(r'<[^>]*>')
+
+
+def phrase(text):
+    return '"%s"' % text.replace('"', '""')
+
+
+class LocalIndex(object):
+    """A full-text index of fetched messages in SQLite, searched with the arguments of Mailbox.mail.
+
+    Messages are indexed by mailbox and UID when they are loaded, and their flags and labels
+    kept up to date as they change. Text is matched by words rather than as substrings, and
+    dates are the Date header rather than the internal date the server searches by.
+    """
+
+    def __init__(self, path=':memory:'):
+        self.lock = threading.Lock()
+        # the messages whose updates a batch on this thread is holding back
+        self.local = threading.local()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS mailboxes (name TEXT PRIMARY KEY, uidvalidity TEXT)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY, mailbox TEXT, uid INTEGER, '
+                            'seen INTEGER, flagged INTEGER, deleted INTEGER, draft INTEGER, sent_at TEXT, UNIQUE (mailbox, uid))')
+            try:
+                self.db.execute('CREATE VIRTUAL TABLE IF NOT EXISTS texts USING fts5(subject, fr, recipients, cc, body, labels)')
+            except sqlite3.OperationalError:
+                self.db.execute('CREATE VIRTUAL TABLE IF NOT EXISTS texts USING fts4(subject, fr, recipients, cc, body, labels)')
+
+    def close(self):
+        self.db.close()
+
+    def check_uidvalidity(self, mailbox, uidvalidity):
+        with self.lock, self.db:
+            row = self.db.execute('SELECT uidvalidity FROM mailboxes WHERE name = ?', (mailbox,)).fetchone()
+            if row and row[0] == uidvalidity:
+                return True
+            self.forget(mailbox)
+            self.db.execute('INSERT OR REPLACE INTO mailboxes (name, uidvalidity) VALUES (?, ?)', (mailbox, uidvalidity))
+            return False
+
+    def forget(self, mailbox):
+        self.db.execute('DELETE FROM texts WHERE rowid IN (SELECT id FROM messages WHERE mailbox = ?)', (mailbox,))
+        self.db.execute('DELETE FROM messages WHERE mailbox = ?', (mailbox,))
+
+    def text(self, message):
+        if message.bodies_pending:
+            message.parse_bodies()
+        body = message._body or TAG.sub(' ', message._html_body or '')
+        return (message.subject or '', message.fr or '', ' '.join(message.to or []), ' '.join(message.cc or []), body,
+                ' '.join(message.labels))
+
+    # indexes a message, or updates the flags and labels of one whose text has not been fetched
+    def update(self, message):
+        if not message.mailbox:
+            return
+        pending = getattr(self.local, 'pending', None)
+        if pending is not None:
+            pending[id(message)] = message
+            return
+        with self.lock, self.db:
+            self.write(message)
+
+    # holds back the updates made on this thread and writes them in one transaction when the block ends
+    @contextmanager
+    def batch(self):
+        if getattr(self.local, 'pending', None) is not None:
+            yield
+            return
+        self.local.pending = OrderedDict()
+        try:
+            yield
+        finally:
+            pending, self.local.pending = self.local.pending, None
+            if pending:
+                with self.lock, self.db:
+                    for message in pending.values():
+                        self.write(message)
+
+    def write(self, message):
+        flags = message.flags
+        values = ('\\Seen' in flags, '\\Flagged' in flags, '\\Deleted' in flags, '\\Draft' in flags)
+        # an envelope is indexed as soon as it is loaded, before fetch_messages records the profile
+        has_text = message.raw is not None or message.has_envelope or bool(message.profiles)
+        text = self.text(message) if has_text else None
+        sent_at = str(message.sent_at) if has_text and message.sent_at else None
+
+        row = self.db.execute('SELECT id FROM messages WHERE mailbox = ? AND uid = ?', (message.mailbox.name, int(message.uid))).fetchone()
+        if row:
+            self.db.execute('UPDATE messages SET seen = ?, flagged = ?, deleted = ?, draft = ? WHERE id = ?', values + (row[0],))
+            if text:
+                # a message fetched again with a smaller profile keeps the body it was indexed with
+                if message.raw is None and not message.is_fetched('text'):
+                    indexed = self.db.execute('SELECT body FROM texts WHERE rowid = ?', (row[0],)).fetchone()
+                    if indexed:
+                        text = text[:4] + (indexed[0],) + text[5:]
+                self.db.execute('UPDATE messages SET sent_at = ? WHERE id = ?', (sent_at, row[0]))
+                self.db.execute('DELETE FROM texts WHERE rowid = ?', (row[0],))
+                self.db.execute('INSERT INTO texts (rowid, subject, fr, recipients, cc, body, labels) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                (row[0],) + text)
+            else:
+                self.db.execute('UPDATE texts SET labels = ? WHERE rowid = ?', (' '.join(message.labels), row[0]))
+        elif text:
+            cursor = self.db.execute('INSERT INTO messages (mailbox, uid, seen, flagged, deleted, draft, sent_at) '
+                                     'VALUES (?, ?, ?, ?, ?, ?, ?)', (message.mailbox.name, int(message.uid)) + values + (sent_at,))
+            self.db.execute('INSERT INTO texts (rowid, subject, fr, recipients, cc, body, labels) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            (cursor.lastrowid,) + text)
+
+    def remove(self, mailbox, uid):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM texts WHERE rowid IN (SELECT id FROM messages WHERE mailbox = ? AND uid = ?)', (mailbox, int(uid)))
+            self.db.execute('DELETE FROM messages WHERE mailbox = ? AND uid = ?', (mailbox, int(uid)))
+
+    # returns (mailbox, uid) for the indexed messages that match the Mailbox.mail arguments
+    def search(self, mailbox=None, **kwargs):
+        unsupported = [key for key in kwargs if kwargs[key] and key not in TEXT_ARGUMENTS and key not in FLAG_ARGUMENTS and
+                       key not in ('before', 'after', 'on')]
+        if unsupported:
+            raise ValueError('cannot search the local index by %s' % ', '.join(sorted(unsupported)))
+
+        conditions = [FLAG_ARGUMENTS[key] for key in sorted(FLAG_ARGUMENTS) if kwargs.get(key)]
+        args = []
+        if mailbox:
+            conditions.append('mailbox = ?')
+            args.append(mailbox)
+        if kwargs.get('before'):
+            conditions.append('sent_at < ?')
+            args.append(str(kwargs['before']))
+        if kwargs.get('after'):
+            conditions.append('sent_at >= ?')
+            args.append(str(kwargs['after']))
+        if kwargs.get('on'):
+            conditions.append('sent_at >= ? AND sent_at < ?')
+            args.extend([str(kwargs['on']), str(kwargs['on'] + datetime.timedelta(days=1))])
+
+        match = ' AND '.join('%s:%s' % (column, phrase(kwargs[key])) for key, column in sorted(TEXT_ARGUMENTS.items()) if kwargs.get(key))
+        if match:
+            conditions.append('id IN (SELECT rowid FROM texts WHERE texts MATCH ?)')
+            args.append(match)
+
+        query = 'SELECT mailbox, uid FROM messages' + (' WHERE ' + ' AND '.join(conditions) if conditions else '') + ' ORDER BY mailbox, uid'
+        with self.lock:
+            return [(name, str(uid)) for name, uid in self.db.execute(query, args).fetchall()]
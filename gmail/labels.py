@@ -0,0 +1,96 @@
+import json
+import os
+import threading
+import time
+
+
+# LIST attributes that name a special-use mailbox
+SPECIAL_USE = ('All', 'Archive', 'Drafts', 'Flagged', 'Important', 'Junk', 'Sent', 'Trash')
+
+# the STATUS items asked for with LIST-STATUS
+STATUS_ITEMS = ('MESSAGES', 'UNSEEN', 'UIDNEXT')
+
+
+class LabelNode(object):
+    """A label in the hierarchy of Gmail labels.
+
+    A parent that only exists as a path, like [Gmail], has no mailbox.
+    """
+
+    def __init__(self, name, path, delimiter=None):
+        self.name = name
+        self.path = path
+        self.delimiter = delimiter
+        self.mailbox = None
+        self.attributes = []
+        self.children = []
+
+    def child(self, name, path, delimiter):
+        for child in self.children:
+            if child.name == name:
+                return child
+        child = LabelNode(name, path, delimiter)
+        self.children.append(child)
+        return child
+
+    # this label and all those under it, parents first
+    def walk(self):
+        yield self
+        for child in self.children:
+            for node in child.walk():
+                yield node
+
+    def find(self, path):
+        for node in self.walk():
+            if node.path == path:
+                return node
+        return None
+
+    def __repr__(self):
+        return '<LabelNode %s: %d children>' % (self.path, len(self.children))
+
+
+# builds the label tree from (attributes, delimiter, name, status) entries
+def label_tree(entries, mailboxes):
+    root = LabelNode('', '')
+    for attributes, delimiter, name, status in sorted(entries, key=lambda entry: entry[2]):
+        parts = name.split(delimiter) if delimiter else [name]
+        node = root
+        for index, part in enumerate(parts):
+            node = node.child(part, delimiter.join(parts[:index + 1]) if delimiter else name, delimiter)
+        node.attributes = attributes
+        node.mailbox = mailboxes.get(name)
+    return root
+
+
+class MailboxListCache(object):
+    """Keeps the mailboxes listed for each account in a JSON file, to be reused for max_age seconds."""
+
+    def __init__(self, path, max_age=3600):
+        self.path = path
+        self.max_age = max_age
+        self.lock = threading.Lock()
+
+    def read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    # returns the entries stored for an account, or None when there are none or they are too old
+    def load(self, username):
+        with self.lock:
+            account = self.read().get(username)
+        if not account or time.time() - account['time'] > self.max_age:
+            return None
+        return [tuple(entry) for entry in account['entries']]
+
+    def store(self, username, entries):
+        with self.lock:
+            accounts = self.read()
+            accounts[username] = {'time': time.time(), 'entries': [list(entry) for entry in entries]}
+            temp_file = '%s.%s.tmp' % (self.path, threading.current_thread().ident)
+            with open(temp_file, 'w') as f:
+                json.dump(accounts, f)
+            os.rename(temp_file, self.path)
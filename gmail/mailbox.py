@@ -1,17 +1,162 @@
+import datetime
+
+from six import binary_type, text_type
+
 from .message import Message
-from .utf import encode as encode_utf7
+from .utf import encode as encode_utf7, quote, quote_string
+from .exceptions import GmailException
+from .batch import batch_by_count, compress_uids, expand_uids, sort_uids
+from .sync import sync_mailbox
+from .export import export_mailbox
+from .append import append_messages
+from .idle import IdleWatcher
+from .parser import parse_esearch, parse_status
+from .labels import STATUS_ITEMS
+from .records import MessageStore
+
+
+class SearchLiteral(binary_type):
+    """A search argument sent as a literal, for text that is not ASCII."""
+
+
+def search_text(text):
+    try:
+        text.encode('ascii')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return SearchLiteral(text.encode('utf-8') if isinstance(text, text_type) else text)
+    return quote_string(text)
+
+
+class MessageList(list):
+    """The messages returned by Mailbox.mail, with bulk versions of the Message flag, label and move methods."""
+
+    def mailboxes(self):
+        grouped = {}
+        for message in self:
+            grouped.setdefault(message.mailbox.name, (message.mailbox, []))[1].append(message)
+        return grouped.values()
+
+    def read(self):
+        for mailbox, messages in self.mailboxes():
+            mailbox.read(messages)
+
+    def unread(self):
+        for mailbox, messages in self.mailboxes():
+            mailbox.unread(messages)
+
+    def star(self):
+        for mailbox, messages in self.mailboxes():
+            mailbox.star(messages)
+
+    def unstar(self):
+        for mailbox, messages in self.mailboxes():
+            mailbox.unstar(messages)
+
+    def add_label(self, label):
+        for mailbox, messages in self.mailboxes():
+            mailbox.add_label(messages, label)
+
+    def remove_label(self, label):
+        for mailbox, messages in self.mailboxes():
+            mailbox.remove_label(messages, label)
+
+    def move_to(self, name):
+        for mailbox, messages in self.mailboxes():
+            mailbox.move(messages, name)
+
+    def archive(self):
+        for mailbox, messages in self.mailboxes():
+            mailbox.archive(messages)
+
+    def delete(self):
+        for mailbox, messages in self.mailboxes():
+            mailbox.trash(messages)
+
+
+class Thread(MessageList):
+    """The messages of a Gmail conversation, oldest first, whichever mailboxes they were found in."""
+
+    def __init__(self, thread_id, messages=()):
+        super(Thread, self).__init__(sorted(messages, key=lambda message: (message.sent_at or datetime.datetime.min, int(message.uid))))
+        self.thread_id = thread_id
+
+    @property
+    def subject(self):
+        return self[0].subject if self else None
+
+    @property
+    def last(self):
+        return self[-1] if self else None
+
+    def participants(self):
+        addresses = []
+        for message in self:
+            for address in [message.fr] + (message.to or []) + (message.cc or []):
+                if address and address not in addresses:
+                    addresses.append(address)
+        return addresses
+
+    def is_read(self):
+        return all(message.is_read() for message in self)
+
+    def __repr__(self):
+        return '<Thread %s: %d messages>' % (self.thread_id, len(self))
+
+
+# matches the messages of any of the threads
+def thread_criteria(thread_ids):
+    criteria = 'X-GM-THRID %s' % thread_ids[-1]
+    for thread_id in reversed(thread_ids[:-1]):
+        criteria = 'OR X-GM-THRID %s %s' % (thread_id, criteria)
+    return criteria
+
+
+# a Thread for each thread id, in the same order
+def group_threads(thread_ids, messages, thread_class=Thread):
+    grouped = {}
+    for message in messages:
+        grouped.setdefault(message.thread_id, []).append(message)
+    return [thread_class(thread_id, grouped.get(thread_id, [])) for thread_id in thread_ids]
+
+
+def uid_stats(uids):
+    uids = sort_uids(uids)
+    return {'COUNT': len(uids), 'MIN': uids[0] if uids else None, 'MAX': uids[-1] if uids else None}
+
+
+def search_stats(result):
+    return dict((key.lower(), int(result[key]) if result.get(key) is not None else None) for key in ('COUNT', 'MIN', 'MAX'))
 
 
 class Mailbox():
 
+    message_class = Message
+
     def __init__(self, gmail, name="INBOX"):
         self.name = name
         self.external_name = encode_utf7(name)
         self.gmail = gmail
         self.date_format = "%d-%b-%Y"
-        self.messages = {}
+        cache_policy = getattr(gmail, 'cache_policy', None)
+        self.messages = MessageStore(self, getattr(gmail, 'compact_messages', False), getattr(gmail, 'drop_tree', False),
+                                     cache_policy() if cache_policy else None)
+
+        # as reported by the last SELECT
+        self.exists = None
+        self.uidvalidity = None
+        self.uidnext = None
+        self.highestmodseq = None
+        self.sync_state = None
 
-    def mail(self, prefetch=False, **kwargs):
+        # as listed
+        self.attributes = []
+        self.delimiter = None
+        self.unseen = None
+
+    def connection(self):
+        return self.gmail.connection(self.name)
+
+    def search_criteria(self, **kwargs):
         search = ['ALL']
 
         kwargs.get('read')   and search.append('SEEN')
@@ -44,28 +189,317 @@ class Mailbox():
         kwargs.get('attachment') and search.extend(['HAS', 'attachment'])
 
         kwargs.get('query') and search.extend([kwargs.get('query')])
+        kwargs.get('uid_range') and search.extend(['UID', kwargs.get('uid_range')])
+
+        # Gmail's own search syntax, e.g. 'has:attachment larger:10M'; goes last as it may be a literal
+        kwargs.get('gmail_query') and search.extend(['X-GM-RAW', search_text(kwargs.get('gmail_query'))])
+
+        return search
+
+    def uid_search(self, imap, search, returns=None):
+        args = ['RETURN', '(%s)' % ' '.join(returns)] if returns is not None else []
+        if isinstance(search[-1], SearchLiteral):
+            imap.literal = search[-1]
+            args += ['CHARSET', 'UTF-8'] + search[:-1]
+        else:
+            args += search
+        return imap.uid('SEARCH', *args)
 
-        emails = []
+    # returns the matching UIDs in ascending order; with limit, only the newest ones
+    def search(self, limit=None, **kwargs):
+        search = self.search_criteria(**kwargs)
+        if self.gmail.has_capability('ESEARCH'):
+            uids = expand_uids(self.esearch(['ALL'], search).get('ALL') or '')
+        else:
+            with self.connection() as imap:
+                response, data = self.uid_search(imap, search)
+            uids = list(filter(None, data[0].decode().split(' '))) if response == 'OK' else []  # filter out empty strings
+        return sort_uids(uids)[-limit:] if limit else uids
 
-        response, data = self.gmail.imap.uid('SEARCH', *search)
-        if response == 'OK':
-            uids = filter(None, data[0].decode().split(' '))  # filter out empty strings
+    # UID SEARCH RETURN (...); returns the result items, such as {'COUNT': '3', 'MIN': '1', 'MAX': '7'}
+    def esearch(self, returns, search):
+        with self.connection() as imap:
+            imap.response('ESEARCH')  # drops a response left over from an earlier command
+            response, data = self.uid_search(imap, search, returns)
+            response, data = imap.response('ESEARCH')
+        return parse_esearch([piece for piece in data if piece]) if data and data[-1] else {}
 
-            for uid in uids:
-                if not self.messages.get(uid):
-                    self.messages[uid] = Message(self, uid)
-                emails.append(self.messages[uid])
+    # with limit, only the newest messages are returned
+    def mail(self, prefetch=False, batch_size=None, batch_bytes=None, profile='full', concurrency=None, **kwargs):
+        emails = MessageList()
+
+        for uid in self.search(**kwargs):
+            if not self.messages.get(uid):
+                self.messages[uid] = self.message_class(self, uid)
+            emails.append(self.messages[uid])
+
+        if prefetch:
+            messages_dict = {}
+            for email in emails:
+                messages_dict[email.uid] = email
+            self.messages.update(self.gmail.fetch_multiple_messages(messages_dict, batch_size, batch_bytes, profile, concurrency))
+
+        return emails
+
+    # the message with the given UID, from the cache or fetched again with profile
+    def message(self, uid, profile='full'):
+        message = self.messages.get(uid) or self.message_class(self, uid)
+        if profile and not message.is_fetched(profile):
+            message.fetch(profile)
+        self.messages[uid] = message
+        return message
+
+    # yields lists of page_size messages, newest first, from a single search
+    def pages(self, page_size=100, prefetch=False, profile='full', **kwargs):
+        uids = sort_uids(self.search(**kwargs))
+        uids.reverse()
+        for window in batch_by_count(uids, page_size):
+            page = MessageList()
+            for uid in window:
+                message = self.messages.get(uid) or self.message_class(self, uid)
+                self.messages[uid] = message
+                page.append(message)
+            if prefetch:
+                self.gmail.fetch_multiple_messages(dict((message.uid, message) for message in page), profile=profile)
+            yield page
+
+    # finds the messages of many threads with a search per THREAD_SEARCH_SIZE threads and fetches those not fetched
+    # with profile yet; returns a Thread for each thread id, in the same order
+    def threads(self, thread_ids, profile='headers', batch_size=None):
+        thread_ids = [str(thread_id) for thread_id in thread_ids]
+        messages = {}
+        for chunk in batch_by_count(sorted(set(thread_ids)), self.gmail.THREAD_SEARCH_SIZE):
+            for uid in self.search(query=thread_criteria(chunk)):
+                messages[uid] = self.messages.get(uid) or self.message_class(self, uid)
+
+        unfetched = dict((uid, message) for uid, message in messages.items() if not message.is_fetched(profile))
+        self.gmail.fetch_multiple_messages(unfetched, batch_size, profile=profile)
+        self.messages.update(messages)
+        return group_threads(thread_ids, messages.values())
+
+    # yields messages in UID order, fetching a window of them at a time when prefetching
+    def iter_mail(self, prefetch=False, batch_size=None, batch_bytes=None, profile='full', cache=False, **kwargs):
+        uids = sort_uids(self.search(**kwargs))
+        for window in batch_by_count(uids, batch_size or self.gmail.FETCH_BATCH_SIZE):
+            messages_dict = {}
+            for uid in window:
+                messages_dict[uid] = self.messages.get(uid) or self.message_class(self, uid)
+                if cache:
+                    self.messages[uid] = messages_dict[uid]
 
             if prefetch:
-                messages_dict = {}
-                for email in emails:
-                    messages_dict[email.uid] = email
-                self.messages.update(self.gmail.fetch_multiple_messages(messages_dict))
+                self.gmail.fetch_multiple_messages(messages_dict, batch_size, batch_bytes, profile)
 
+            for uid in window:
+                yield messages_dict[uid]
+
+    # yields lists of fetched messages without adding them to the cache; the messages of a batch are only created
+    # when it is fetched, so those of earlier batches can be freed
+    def fetch_batches(self, batch_size=None, batch_bytes=None, profile='full', concurrency=None, ordered=True, **kwargs):
+        batches = self.gmail.uid_batches(sort_uids(self.search(**kwargs)), batch_size, batch_bytes, self.name)
+        batches = (dict((uid, self.messages.get(uid) or self.message_class(self, uid)) for uid in batch) for batch in batches)
+        return self.gmail.fetch_batches(batches, profile, concurrency, ordered)
+
+    # streams the raw messages matching the search arguments to an MboxWriter, MaildirWriter or ArchiveWriter, in
+    # UID order and without parsing them; with an ExportCheckpoint, picks up after the last batch exported before.
+    # Returns the number of messages written
+    def export(self, writer, checkpoint=None, batch_size=None, batch_bytes=None, **kwargs):
+        return export_mailbox(self, writer, checkpoint, batch_size, batch_bytes, **kwargs)
+
+    # uploads messages, given as raw bytes, Drafts or AppendMessages, to this mailbox; flags, date_time and labels are
+    # for the messages that are not AppendMessages. Returns the new UIDs in order, None where the server did not tell
+    def append(self, messages, flags=None, date_time=None, labels=None, batch_size=None, concurrency=None):
+        return append_messages(self, messages, flags, date_time, labels, batch_size, concurrency)
+
+    # like mail, but searches the messages in the local index instead of asking the server; the matches that are no
+    # longer held in memory are fetched again with profile
+    def local_mail(self, profile='envelope', **kwargs):
+        emails = MessageList()
+        for mailbox_name, uid in self.gmail.index.search(self.name, **kwargs):
+            message = self.messages.get(uid) or self.message_class(self, uid)
+            self.messages[uid] = message
+            emails.append(message)
+        unfetched = dict((email.uid, email) for email in emails if profile and not email.is_fetched(profile))
+        if unfetched:
+            self.gmail.fetch_multiple_messages(unfetched, profile=profile)
         return emails
 
+    # returns the messages added, changed and removed since the last call
+    def sync(self, prefetch=False, profile='full'):
+        result = sync_mailbox(self, self.sync_state, prefetch, profile)
+        self.sync_state = result.state
+        return result
+
+    # waits for new mail with IDLE; with a callback, calls it for each new message on a thread until the returned
+    # watcher is stopped
+    def watch(self, callback=None, prefetch=True, profile='full', on_event=None, renew_interval=None):
+        watcher = IdleWatcher(self, prefetch, profile, on_event, renew_interval)
+        if callback:
+            watcher.run_in_thread(callback)
+        return watcher
+
+    # messages are Message objects or UIDs; without them, the messages matching the search arguments are used
+    def messages_by_uid(self, messages):
+        return dict((message.uid, message) if isinstance(message, Message) else (message, self.messages.get(message))
+                    for message in messages)
+
+    # changing many messages needs the messages, or search arguments that pick them, so that an argument left out
+    # does not change the whole mailbox
+    def check_selection(self, messages, **kwargs):
+        if messages is None and self.search_criteria(**kwargs) == ['ALL']:
+            raise GmailException('give the messages to change, or search arguments that pick them')
+
+    # sends one UID STORE per chunk of UIDs, and returns the UIDs that were stored
+    def store(self, messages, command, values, **kwargs):
+        self.check_selection(messages, **kwargs)
+        messages = self.messages_by_uid(self.search(**kwargs) if messages is None else messages)
+        items = ' '.join(quote(value) if 'X-GM-LABELS' in command.upper() else value for value in values)
+
+        stored = []
+        for chunk in batch_by_count(sort_uids(messages.keys()), self.gmail.STORE_BATCH_SIZE):
+            with self.connection() as imap:
+                response, data = imap.uid('STORE', compress_uids(chunk), command + '.SILENT', '(%s)' % items)
+            if response == 'OK':
+                for uid in chunk:
+                    if messages[uid]:
+                        messages[uid].stored(command, values)
+                        self.messages.refresh(messages[uid])
+                stored.extend(chunk)
+        return stored
+
+    def read(self, messages=None, **kwargs):
+        return self.store(messages, '+FLAGS', ['\\Seen'], **kwargs)
+
+    def unread(self, messages=None, **kwargs):
+        return self.store(messages, '-FLAGS', ['\\Seen'], **kwargs)
+
+    def star(self, messages=None, **kwargs):
+        return self.store(messages, '+FLAGS', ['\\Flagged'], **kwargs)
+
+    def unstar(self, messages=None, **kwargs):
+        return self.store(messages, '-FLAGS', ['\\Flagged'], **kwargs)
+
+    def add_label(self, messages=None, label=None, **kwargs):
+        return self.store(messages, '+X-GM-LABELS', [label], **kwargs)
+
+    def remove_label(self, messages=None, label=None, **kwargs):
+        return self.store(messages, '-X-GM-LABELS', [label], **kwargs)
+
+    # moves messages with UID MOVE when the server supports it, or else with COPY, STORE \\Deleted and UID EXPUNGE;
+    # moved messages that are cached follow to their new UID in the destination mailbox
+    def move(self, messages=None, to_mailbox=None, **kwargs):
+        self.check_selection(messages, **kwargs)
+        if not self.gmail.has_capability('MOVE'):
+            self.check_uid_expunge()
+        messages = self.messages_by_uid(self.search(**kwargs) if messages is None else messages)
+        destination = self.gmail.mailboxes.get(to_mailbox)
+
+        moved = []
+        for chunk in batch_by_count(sort_uids(messages.keys()), self.gmail.STORE_BATCH_SIZE):
+            uid_set = compress_uids(chunk)
+            with self.connection() as imap:
+                imap.response('COPYUID')  # drops a code left over from an earlier command
+                if self.gmail.has_capability('MOVE'):
+                    response, data = imap.uid('MOVE', uid_set, quote(to_mailbox))
+                else:
+                    response, data = imap.uid('COPY', uid_set, quote(to_mailbox))
+                    if response == 'OK':
+                        response, data = self.expunge(imap, uid_set)
+                copyuid = self.gmail.response_code('COPYUID', imap)
+            if response != 'OK':
+                continue
+
+            moved.extend(chunk)
+            self.moved(messages, chunk, copyuid, destination)
+        return moved
+
+    def moved(self, messages, chunk, copyuid, destination):
+        new_uids = dict(zip(expand_uids(copyuid.split(' ')[1]), expand_uids(copyuid.split(' ')[2]))) if copyuid else {}
+        for uid in chunk:
+            message = self.messages.pop(uid, None) or messages[uid]
+            self.unindex(uid)
+            if message and destination and uid in new_uids:
+                message.uid = new_uids[uid]
+                message.mailbox = destination
+                destination.messages[message.uid] = message
+                message.update_index()
+
+    def unindex(self, uid):
+        if getattr(self.gmail, 'index', None):
+            self.gmail.index.remove(self.name, uid)
+
+    # a plain EXPUNGE would also remove any other message marked \\Deleted in the mailbox
+    def check_uid_expunge(self):
+        if not self.gmail.has_capability('UIDPLUS'):
+            raise GmailException('the server has no UIDPLUS, so messages cannot be expunged by UID')
+
+    def expunge(self, imap, uid_set):
+        self.check_uid_expunge()
+        response, data = imap.uid('STORE', uid_set, '+FLAGS.SILENT', '(\\Deleted)')
+        if response != 'OK':
+            return response, data
+        return imap.uid('EXPUNGE', uid_set)
+
+    # in Gmail, archiving takes the \\Inbox label off
+    def archive(self, messages=None, **kwargs):
+        if self.name == 'INBOX':
+            return self.move(messages, self.gmail.special_mailboxes.get('All', '[Gmail]/All Mail'), **kwargs)
+        return self.remove_label(messages, '\\Inbox', **kwargs)
+
+    # moves messages to the trash, or deletes them for good when they are in the trash already
+    def trash(self, messages=None, **kwargs):
+        trash = self.gmail.trash_mailbox_name()
+        if self.name != trash:
+            return self.move(messages, trash, **kwargs)
+
+        self.check_selection(messages, **kwargs)
+        self.check_uid_expunge()
+        messages = self.messages_by_uid(self.search(**kwargs) if messages is None else messages)
+        deleted = []
+        for chunk in batch_by_count(sort_uids(messages.keys()), self.gmail.STORE_BATCH_SIZE):
+            with self.connection() as imap:
+                response, data = self.expunge(imap, compress_uids(chunk))
+            if response == 'OK':
+                deleted.extend(chunk)
+                for uid in chunk:
+                    self.messages.pop(uid, None)
+                    self.unindex(uid)
+        return deleted
+
     def count(self, **kwargs):
-        return len(self.mail(**kwargs))
+        if self.gmail.has_capability('ESEARCH'):
+            return int(self.esearch(['COUNT'], self.search_criteria(**kwargs)).get('COUNT', 0))
+        return len(self.search(**kwargs))
+
+    # the number of matching messages and their lowest and highest UID, without listing them where the server allows
+    def search_stats(self, **kwargs):
+        if self.gmail.has_capability('ESEARCH'):
+            result = self.esearch(['COUNT', 'MIN', 'MAX'], self.search_criteria(**kwargs))
+        else:
+            result = uid_stats(self.search(**kwargs))
+        return search_stats(result)
+
+    def load_status(self, status):
+        if 'MESSAGES' in status:
+            self.exists = status['MESSAGES']
+        if 'UNSEEN' in status:
+            self.unseen = status['UNSEEN']
+        if 'UIDNEXT' in status:
+            self.uidnext = status['UIDNEXT']
+
+    # the number of messages, unseen messages and the next UID, as of the last STATUS or LIST-STATUS unless refreshed
+    def status(self, refresh=False):
+        if refresh or self.unseen is None:
+            with self.gmail.connection() as imap:
+                imap.response('STATUS')
+                response, data = imap.status(quote(self.name), '(%s)' % ' '.join(STATUS_ITEMS))
+            if response == 'OK':
+                self.load_status(next(iter(parse_status(data).values()), {}))
+        return {'messages': self.exists, 'unseen': self.unseen, 'uidnext': self.uidnext}
 
     def cached_messages(self):
         return self.messages
+
+    # the MessageRecords of the cached messages
+    def records(self):
+        return self.messages.records()
@@ -1,70 +1,143 @@
+import base64
 import datetime
 import email
+import email.parser
 import itertools
+import quopri
 import re
 import time
 from imaplib import ParseFlags
 
 from six import u, binary_type, PY3
 
+from .parser import parse_fetch_response, text_parts, to_bytes, to_text
 
-class Message():
+
+FETCH_METADATA = 'FLAGS X-GM-THRID X-GM-MSGID X-GM-LABELS RFC822.SIZE'
+
+# what each fetch profile asks the server for; 'text' is followed by a fetch of the text sections
+FETCH_PROFILES = {
+    'envelope': 'ENVELOPE',
+    'headers': 'BODY.PEEK[HEADER]',
+    'structure': 'BODY.PEEK[HEADER] BODYSTRUCTURE',
+    'text': 'BODY.PEEK[HEADER] BODYSTRUCTURE',
+    'full': 'BODY.PEEK[]',
+}
+
+# the profiles whose data is included in each profile
+PROFILE_COVERS = {
+    'envelope': ('envelope',),
+    'headers': ('headers', 'envelope'),
+    'structure': ('structure', 'headers', 'envelope'),
+    'text': ('text', 'structure', 'headers', 'envelope'),
+    'full': ('full', 'text', 'structure', 'headers', 'envelope'),
+}
+
+
+LABELS = re.compile(r'X-GM-LABELS \(([^\)]+)\)')
+HEADER_END = re.compile(br'\r?\n\r?\n')
+
+
+def fetch_items(profile):
+    return '(%s %s)' % (FETCH_PROFILES[profile], FETCH_METADATA)
+
+
+class lazy_attribute(object):
+    """An attribute worked out from the raw message the first time it is read, unless it was set before."""
+
+    def __init__(self, parse):
+        self.parse = parse
+        self.name = '_' + parse.__name__
+
+    def __get__(self, message, owner=None):
+        if message is None:
+            return self
+        if self.name not in message.__dict__:
+            message.__dict__[self.name] = self.parse(message)
+        return message.__dict__[self.name]
+
+    def __set__(self, message, value):
+        message.__dict__[self.name] = value
+
+
+class Message(object):
+
+    # with lazy off, the whole message is parsed as soon as it is loaded
+    lazy = True
+
+    # the attributes taken from the raw message
+    PARSED = ('message', 'header_message', 'headers', 'subject', 'fr', 'to', 'cc', 'delivered_to', 'sent_at')
 
     def __init__(self, mailbox, uid):
         self.uid = uid
         self.mailbox = mailbox
         self.gmail = mailbox.gmail if mailbox else None
 
-        self.message = None
-        self.headers = {}
-
-        self.subject = None
-        self.body = None
-        self.html_body = None
+        self.raw = None
+        self.raw_headers_only = False
+        self.has_envelope = False
+        self.bodies_pending = False
+        self.structure = None
+        self.profiles = set()
 
-        self.to = None
-        self.fr = None
-        self.cc = None
-        self.delivered_to = None
-
-        self.sent_at = None
+        self._body = None
+        self._html_body = None
 
         self.flags = []
         self.labels = []
 
         self.thread_id = None
-        self.thread = []
+        self.thread = None
         self.message_id = None
+        self.size = None
+
+    @property
+    def body(self):
+        if self._body is None:
+            self.load_text()
+        return self._body
+
+    @body.setter
+    def body(self, body):
+        self._body = body
+
+    @property
+    def html_body(self):
+        if self._html_body is None:
+            self.load_text()
+        return self._html_body
+
+    @html_body.setter
+    def html_body(self, html_body):
+        self._html_body = html_body
+
+    def load_text(self):
+        if self.bodies_pending:
+            self.parse_bodies()
+        # after a partial fetch, the text parts are fetched on first access
+        elif self.profiles and not self.is_fetched('text'):
+            self.fetch('text')
+
+    def is_fetched(self, profile='full'):
+        return any(profile in PROFILE_COVERS[fetched] for fetched in self.profiles)
 
     def is_read(self):
         return ('\\Seen' in self.flags)
 
     def read(self):
-        flag = '\\Seen'
-        self.gmail.imap.uid('STORE', self.uid, '+FLAGS', flag)
-        if flag not in self.flags:
-            self.flags.append(flag)
+        return self.mailbox.read([self])
 
     def unread(self):
-        flag = '\\Seen'
-        self.gmail.imap.uid('STORE', self.uid, '-FLAGS', flag)
-        if flag in self.flags:
-            self.flags.remove(flag)
+        return self.mailbox.unread([self])
 
     def is_starred(self):
         return ('\\Flagged' in self.flags)
 
     def star(self):
-        flag = '\\Flagged'
-        self.gmail.imap.uid('STORE', self.uid, '+FLAGS', flag)
-        if flag not in self.flags:
-            self.flags.append(flag)
+        return self.mailbox.star([self])
 
     def unstar(self):
-        flag = '\\Flagged'
-        self.gmail.imap.uid('STORE', self.uid, '-FLAGS', flag)
-        if flag in self.flags:
-            self.flags.remove(flag)
+        return self.mailbox.unstar([self])
 
     def is_draft(self):
         return ('\\Draft' in self.flags)
@@ -74,37 +147,33 @@ class Message():
         return (full_label in self.labels)
 
     def add_label(self, label):
-        full_label = '%s' % label
-        self.gmail.imap.uid('STORE', self.uid, '+X-GM-LABELS', full_label)
-        if full_label not in self.labels:
-            self.labels.append(full_label)
+        return self.mailbox.add_label([self], label)
 
     def remove_label(self, label):
-        full_label = '%s' % label
-        self.gmail.imap.uid('STORE', self.uid, '-X-GM-LABELS', full_label)
-        if full_label in self.labels:
-            self.labels.remove(full_label)
+        return self.mailbox.remove_label([self], label)
+
+    # applies a successful STORE to the local flags or labels
+    def stored(self, command, values):
+        items = self.labels if 'X-GM-LABELS' in command.upper() else self.flags
+        for value in values:
+            if command.startswith('-'):
+                if value in items:
+                    items.remove(value)
+            elif value not in items:
+                items.append(value)
+        self.update_index()
 
     def is_deleted(self):
         return ('\\Deleted' in self.flags)
 
     def delete(self):
-        flag = '\\Deleted'
-        self.gmail.imap.uid('STORE', self.uid, '+FLAGS', flag)
-        if flag not in self.flags:
-            self.flags.append(flag)
-
-        trash = '[Gmail]/Trash' if '[Gmail]/Trash' in self.gmail.labels() else '[Gmail]/Bin'
-        if self.mailbox.name not in ['[Gmail]/Bin', '[Gmail]/Trash']:
-            self.move_to(trash)
+        return self.mailbox.trash([self])
 
     def move_to(self, name):
-        self.gmail.copy(self.uid, name, self.mailbox.name)
-        if name not in ['[Gmail]/Bin', '[Gmail]/Trash']:
-            self.delete()
+        return self.mailbox.move([self], name)
 
     def archive(self):
-        self.move_to('[Gmail]/All Mail')
+        return self.mailbox.archive([self])
 
     def decode_header(self, header):
         if header:
@@ -139,8 +208,9 @@ class Message():
         return list(ParseFlags(headers))
 
     def parse_labels(self, headers):
-        if re.search(r'X-GM-LABELS \(([^\)]+)\)', headers):
-            labels = re.search(r'X-GM-LABELS \(([^\)]+)\)', headers).groups(1)[0].split(' ')
+        match = LABELS.search(headers)
+        if match:
+            labels = match.group(1).split(' ')
             return map(lambda l: l.replace('"', '').decode("string_escape"), labels)
         else:
             return list()
@@ -149,22 +219,135 @@ class Message():
         message = message or self.message
         return message.get_content_charset() or message.get_charset()
 
-    def parse(self, raw_message):
-        raw_headers = raw_message[0]
-        raw_email = raw_message[1].decode('utf-8') if PY3 else raw_message[1]
-        string_headers = raw_headers.decode('utf-8')
-
-        message = email.message_from_string(raw_email)
-        self.message = message
-        self.headers = self.parse_headers(message)
+    def parse_date(self, date):
+        return datetime.datetime.fromtimestamp(time.mktime(email.utils.parsedate_tz(date)[:9]))
 
+    def parse(self, raw_message):
+        # the metadata that follows the literal is not part of raw_message
+        responses = parse_fetch_response([raw_message])
+        if responses:
+            self.load(responses[0][1])
+        self.profiles.add('full')
+
+    def load(self, items):
+        if 'FLAGS' in items:
+            self.flags = list(items['FLAGS'])
+        if 'X-GM-LABELS' in items:
+            self.labels = list(items['X-GM-LABELS'])
+        if 'X-GM-THRID' in items:
+            self.thread_id = items['X-GM-THRID']
+        if 'X-GM-MSGID' in items:
+            self.message_id = items['X-GM-MSGID']
+        if 'RFC822.SIZE' in items:
+            self.size = int(items['RFC822.SIZE'])
+
+        if 'BODY[]' in items:
+            self.parse_email(items['BODY[]'])
+        elif 'BODY[HEADER]' in items:
+            self.parse_email(items['BODY[HEADER]'], headers_only=True)
+        elif 'ENVELOPE' in items:
+            self.parse_envelope(items['ENVELOPE'])
+
+        if 'BODYSTRUCTURE' in items:
+            self.structure = items['BODYSTRUCTURE']
+        for section, subtype, charset, encoding in self.text_parts():
+            content = items.get('BODY[%s]' % section)
+            if content is not None:
+                self.parse_section(content, subtype, charset, encoding)
+        if self.mailbox is not None:
+            self.mailbox.messages.refresh(self)
+        self.update_index()
+
+    def update_index(self):
+        index = getattr(self.gmail, 'index', None)
+        if index:
+            index.update(self)
+
+    # keeps the raw message; the attributes taken from it are parsed when first read
+    def parse_email(self, raw_email, headers_only=False):
+        self.raw = raw_email
+        self.raw_headers_only = headers_only
+        for name in self.PARSED:
+            self.__dict__.pop('_' + name, None)
+        self.bodies_pending = not headers_only
+        if self.bodies_pending:
+            self._body = self._html_body = None
+
+        if not self.lazy:
+            for name in self.PARSED:
+                getattr(self, name)
+            if self.bodies_pending:
+                self.parse_bodies()
+
+    def raw_text(self, raw=None):
+        raw = self.raw if raw is None else raw
+        return raw.decode('utf-8') if PY3 and isinstance(raw, binary_type) else raw
+
+    @lazy_attribute
+    def message(self):
+        return email.message_from_string(self.raw_text()) if self.raw is not None else None
+
+    # headers are read from the whole message once it is parsed, and from the header block alone until then
+    @lazy_attribute
+    def header_message(self):
+        if '_message' in self.__dict__ or self.raw is None:
+            return self.message
+        end = HEADER_END.search(self.raw) if isinstance(self.raw, binary_type) else None
+        return email.parser.HeaderParser().parsestr(self.raw_text(self.raw[:end.end()] if end else self.raw))
+
+    @lazy_attribute
+    def headers(self):
+        message = self.header_message
+        return self.parse_headers(message) if message is not None else {}
+
+    @lazy_attribute
+    def subject(self):
+        message = self.header_message
+        return self.decode_header(message['subject']) if message is not None else None
+
+    @lazy_attribute
+    def fr(self):
+        message = self.header_message
+        if message is None:
+            return None
         froms = self.parse_addresses(message['from'])
-        self.fr = froms[0] if froms else ''
-        self.to = self.parse_addresses(message['to'])
-        self.cc = self.parse_addresses(message['cc'])
-        self.delivered_to = self.parse_addresses(message['delivered_to'])
+        return froms[0] if froms else ''
+
+    @lazy_attribute
+    def to(self):
+        message = self.header_message
+        return self.parse_addresses(message['to']) if message is not None else None
+
+    @lazy_attribute
+    def cc(self):
+        message = self.header_message
+        return self.parse_addresses(message['cc']) if message is not None else None
+
+    @lazy_attribute
+    def delivered_to(self):
+        message = self.header_message
+        return self.parse_addresses(message['delivered_to']) if message is not None else None
+
+    @lazy_attribute
+    def sent_at(self):
+        message = self.header_message
+        return self.parse_date(message['date']) if message is not None and message['date'] else None
+
+    # parses what is left of the raw message, then lets go of it and of the MIME tree
+    def drop_tree(self):
+        if self.raw is None:
+            return
+        for name in self.PARSED[2:]:
+            getattr(self, name)
+        if self.bodies_pending:
+            self.parse_bodies()
+        self.raw = None
+        self.message = None
+        self.header_message = None
 
-        self.subject = self.decode_header(message['subject'])
+    def parse_bodies(self):
+        self.bodies_pending = False
+        message = self.message
         content_type = message.get_content_maintype()
         message_charset = self.get_charset() or 'us-ascii'
         if content_type == "multipart":
@@ -179,54 +362,59 @@ class Message():
             payload = message.get_payload()
             self.body = payload.decode(message_charset) if isinstance(payload, binary_type) else payload
 
-        self.sent_at = datetime.datetime.fromtimestamp(time.mktime(email.utils.parsedate_tz(message['date'])[:9]))
-
-        self.flags = self.parse_flags(raw_headers)
+    def parse_envelope_addresses(self, addresses):
+        return [email.utils.formataddr((self.decode_header(to_text(name)) or '', '%s@%s' % (to_text(mailbox), to_text(host))))
+                for name, route, mailbox, host in (addresses or [])
+                if mailbox and host]  # group delimiters have no host
 
-        self.labels = self.parse_labels(string_headers)
+    def parse_envelope(self, envelope):
+        date, subject, fr, sender, reply_to, to, cc, bcc, in_reply_to, message_id = (list(envelope) + [None] * 10)[:10]
 
-        if re.search(r'X-GM-THRID (\d+)', string_headers):
-            self.thread_id = re.search(r'X-GM-THRID (\d+)', string_headers).groups(1)[0]
-        if re.search(r'X-GM-MSGID (\d+)', string_headers):
-            self.message_id = re.search(r'X-GM-MSGID (\d+)', string_headers).groups(1)[0]
-
-    def fetch(self):
-        if not self.message:
-            response, results = self.gmail.imap.uid('FETCH', self.uid, '(BODY.PEEK[] FLAGS X-GM-THRID X-GM-MSGID X-GM-LABELS)')
+        froms = self.parse_envelope_addresses(fr)
+        self.fr = froms[0] if froms else ''
+        self.to = self.parse_envelope_addresses(to)
+        self.cc = self.parse_envelope_addresses(cc)
+
+        self.subject = self.decode_header(to_text(subject))
+        self.sent_at = self.parse_date(to_text(date)) if date else None
+        self.has_envelope = True
+
+        for header, value in (('Date', date), ('Subject', subject), ('In-Reply-To', in_reply_to), ('Message-ID', message_id)):
+            if value:
+                self.headers[header] = self.decode_header(to_text(value))
+
+    def text_parts(self):
+        return text_parts(self.structure) if self.structure else []
+
+    def parse_section(self, content, subtype, charset, encoding):
+        content = to_bytes(content)
+        if encoding == 'base64':
+            content = base64.b64decode(content)
+        elif encoding == 'quoted-printable':
+            content = quopri.decodestring(content)
+
+        charset = charset or (self.header_message is not None and self.get_charset(self.header_message)) or 'us-ascii'
+        try:
+            text = content.decode(charset, 'replace')
+        except LookupError:  # a charset Python does not know
+            text = content.decode('latin-1')
+        if subtype == 'plain':
+            self.body = text
+        else:
+            self.html_body = text
 
-            self.parse(results[0])
+    def fetch(self, profile='full'):
+        if not self.is_fetched(profile):
+            self.gmail.fetch_messages({self.uid: self}, profile)
 
         return self.message
 
-    # returns a list of fetched messages (both sent and received) in chronological order
-    def fetch_thread(self):
-        self.fetch()
-        original_mailbox = self.mailbox
-        self.gmail.use_mailbox(original_mailbox.name)
-
-        # fetch and cache messages from inbox or other received mailbox
-        response, results = self.gmail.imap.uid('SEARCH', None, '(X-GM-THRID ' + self.thread_id + ')')
-        received_messages = {}
-        uids = results[0].split(' ')
-        if response == 'OK':
-            received_messages = {uid: Message(self.gmail.mailboxes['[Gmail]/Sent Mail'], uid) for uid in uids}
-            self.gmail.fetch_multiple_messages(received_messages)
-            self.mailbox.messages.update(received_messages)
-
-        # fetch and cache messages from 'sent'
-        self.gmail.use_mailbox('[Gmail]/Sent Mail')
-        response, results = self.gmail.imap.uid('SEARCH', None, '(X-GM-THRID ' + self.thread_id + ')')
-        sent_messages = {}
-        uids = results[0].split(' ')
-        if response == 'OK':
-            sent_messages = {uid: Message(self.gmail.mailboxes['[Gmail]/Sent Mail'], uid) for uid in uids}
-            self.gmail.fetch_multiple_messages(sent_messages)
-            self.gmail.mailboxes['[Gmail]/Sent Mail'].messages.update(sent_messages)
-
-        self.gmail.use_mailbox(original_mailbox.name)
-
-        # combine and sort sent and received messages
-        return sorted(dict(received_messages.items() + sent_messages.items()).values(), key=lambda m: m.sent_at)
+    # returns the messages of the conversation, sent and received, as a Thread in chronological order
+    def fetch_thread(self, profile='headers'):
+        if self.thread_id is None:
+            self.fetch('envelope')
+        self.thread = self.gmail.thread(self.thread_id, profile)
+        return self.thread
 
     def html_format_address(self, address):
         name, addr = email.utils.parseaddr(self.fr)
@@ -0,0 +1,60 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class BatchRunner(object):
+    """Runs a function on batches on several worker threads, each using pooled IMAP connections.
+
+    At most max_pending batches are in flight, so a slow consumer holds back the work instead of
+    piling up results. Results are yielded in the order of the batches when ordered is true, and
+    as soon as they are ready otherwise.
+    """
+
+    def __init__(self, gmail, concurrency=4, max_pending=None, ordered=True):
+        self.gmail = gmail
+        self.concurrency = concurrency
+        self.max_pending = max_pending or concurrency * 2
+        self.ordered = ordered
+
+        if not gmail.pool:
+            gmail.start_pool(concurrency)
+
+    # yields function(batch) for each batch, run on the worker threads
+    def map(self, function, batches):
+        executor = ThreadPoolExecutor(self.concurrency)
+        pending = deque()
+        try:
+            for batch in batches:
+                if len(pending) >= self.max_pending:
+                    for result in self.completed(pending):
+                        yield result
+                pending.append(executor.submit(function, batch))
+
+            while pending:
+                for result in self.completed(pending):
+                    yield result
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def completed(self, pending):
+        if self.ordered:
+            return [pending.popleft().result()]
+
+        done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.remove(future)
+        return [future.result() for future in done]
+
+
+class ParallelFetcher(BatchRunner):
+    """Fetches batches of messages on several pooled IMAP connections at once.
+
+    Each worker thread checks out its own connection from the Gmail connection pool, fetches a
+    batch and parses it. Batches are yielded in UID order when ordered is true, and as soon as
+    they are ready otherwise.
+    """
+
+    def fetch_batches(self, batches, profile='full'):
+        return self.map(lambda batch: self.gmail.fetch_messages(batch, profile), batches)
@@ -0,0 +1,167 @@
+import re
+
+from six import binary_type
+
+
+OPEN = object()
+CLOSE = object()
+
+TOKEN = re.compile(br'\s*(?:(?P<open>\()|(?P<close>\))|"(?P<quoted>(?:[^"\\]|\\.)*)"|\{(?P<literal>\d+)\+?\}\s*$|'
+                   br'(?P<atom>(?:[^\s()\[\]"{]|\[[^\]]*\])+(?:<[\d.]+>)?))')
+QUOTED_ESCAPE = re.compile(br'\\(.)')
+
+
+def tokenize(data):
+    tokens = []
+    for piece in data:
+        if piece is None:
+            continue
+        if isinstance(piece, tuple):
+            text, literal = piece
+        else:
+            text, literal = piece, None
+
+        position = 0
+        while position < len(text):
+            match = TOKEN.match(text, position)
+            if not match or match.end() == position:
+                break
+            position = match.end()
+            if match.group('open'):
+                tokens.append(OPEN)
+            elif match.group('close'):
+                tokens.append(CLOSE)
+            elif match.group('quoted') is not None:
+                tokens.append(QUOTED_ESCAPE.sub(br'\1', match.group('quoted')).decode('utf-8'))
+            elif match.group('atom'):
+                atom = match.group('atom').decode('utf-8')
+                tokens.append(None if atom.upper() == 'NIL' else atom)
+            # a {n} marker is followed by the literal itself, the second half of the tuple
+
+        if literal is not None:
+            tokens.append(literal)
+    return tokens
+
+
+def parse_tokens(tokens):
+    stack = [[]]
+    for token in tokens:
+        if token is OPEN:
+            stack.append([])
+        elif token is CLOSE:
+            if len(stack) > 1:
+                finished = stack.pop()
+                stack[-1].append(finished)
+        else:
+            stack[-1].append(token)
+    while len(stack) > 1:  # tolerate a truncated response
+        finished = stack.pop()
+        stack[-1].append(finished)
+    return stack[0]
+
+
+def parse_list(data):
+    return parse_tokens(tokenize(data if isinstance(data, list) else [data]))
+
+
+def pairs(values):
+    items = {}
+    for index in range(0, len(values) - 1, 2):
+        items[values[index].upper()] = values[index + 1]
+    return items
+
+
+# turns the data of a FETCH response into (sequence number, {item name: value}) tuples
+def parse_fetch_response(data):
+    values = parse_list(data)
+    responses = []
+    index = 0
+    while index < len(values):
+        if index + 1 < len(values) and isinstance(values[index + 1], list):
+            responses.append((values[index], pairs(values[index + 1])))
+            index += 2
+        else:
+            index += 1
+    return responses
+
+
+# splits imaplib response data into one list per response; a literal is followed by the rest of its line
+def split_responses(data):
+    responses = []
+    for piece in data:
+        if responses and isinstance(responses[-1][-1], tuple):
+            responses[-1].append(piece)
+        elif piece:
+            responses.append([piece])
+    return responses
+
+
+# turns the data of LIST responses into (attributes, delimiter, name) tuples
+def parse_mailbox_list(data):
+    mailboxes = []
+    for response in split_responses(data):
+        attributes, delimiter, name = (parse_list(response) + [None] * 3)[:3]
+        if name is not None:
+            mailboxes.append(([to_text(attribute).lstrip('\\') for attribute in attributes or []], to_text(delimiter), to_text(name)))
+    return mailboxes
+
+
+# turns the data of STATUS responses into {mailbox name: {item: value}}
+def parse_status(data):
+    statuses = {}
+    for response in split_responses(data):
+        values = parse_list(response)
+        if len(values) > 1 and isinstance(values[1], list):
+            statuses[to_text(values[0])] = dict((key, int(value)) for key, value in pairs(values[1]).items())
+    return statuses
+
+
+# turns the data of an ESEARCH response into {return item: value}, e.g. {'COUNT': '3', 'MIN': '1', 'MAX': '7'}
+def parse_esearch(data):
+    values = [value for value in parse_list(data) if not isinstance(value, list) and value.upper() != 'UID']
+    return pairs(values)
+
+
+def to_text(value):
+    if isinstance(value, binary_type):
+        return value.decode('utf-8', 'replace')
+    return value
+
+
+# a quoted string comes out of the tokenizer as text, a literal as bytes
+def to_bytes(value):
+    if isinstance(value, binary_type):
+        return value
+    return value.encode('utf-8')
+
+
+def body_params(structure):
+    params = structure[2] if len(structure) > 2 and isinstance(structure[2], list) else []
+    return dict((to_text(params[i]).lower(), to_text(params[i + 1])) for i in range(0, len(params) - 1, 2))
+
+
+def is_attachment(structure):
+    # extension data follows the basic fields (and the line count for text parts)
+    disposition_index = 9 if to_text(structure[0]).lower() == 'text' else 8
+    disposition = structure[disposition_index] if len(structure) > disposition_index else None
+    return isinstance(disposition, list) and bool(disposition) and to_text(disposition[0]).lower() == 'attachment'
+
+
+# returns (section, subtype, charset, encoding) for every inline text/plain and text/html part of a BODYSTRUCTURE
+def text_parts(structure, prefix=''):
+    parts = []
+    if structure and isinstance(structure[0], list):
+        index = 0
+        for part in structure:
+            if not isinstance(part, list):
+                break
+            index += 1
+            parts.extend(text_parts(part, prefix + str(index) + '.'))
+    elif structure:
+        maintype = to_text(structure[0]).lower()
+        subtype = to_text(structure[1]).lower()
+        if maintype == 'text' and subtype in ('plain', 'html') and not is_attachment(structure):
+            section = prefix[:-1] if prefix else '1'
+            encoding = to_text(structure[5]).lower() if len(structure) > 5 and structure[5] else '7bit'
+            parts.append((section, subtype, body_params(structure).get('charset'), encoding))
+    return parts
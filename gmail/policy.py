@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class CachePolicy(object):
+    """Decides which messages a mailbox keeps cached.
+
+    Messages are evicted least recently used first once there are more than max_messages of
+    them or their RFC822 sizes add up to more than max_bytes, and are dropped when they are
+    looked up more than ttl seconds after they were stored. Subclasses can override added,
+    accessed and removed to evict differently.
+    """
+
+    def __init__(self, max_messages=None, max_bytes=None, ttl=None):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self.lock = threading.Lock()
+        # uid -> (size, time stored), least recently used first
+        self.entries = OrderedDict()
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def expired(self, stored_at, now=None):
+        return self.ttl is not None and (now or time.time()) - stored_at > self.ttl
+
+    def over_budget(self):
+        return ((self.max_messages is not None and len(self.entries) > self.max_messages) or
+                (self.max_bytes is not None and self.bytes > self.max_bytes))
+
+    # records a stored message and returns the UIDs to evict; the message just stored is kept
+    def added(self, uid, size):
+        evicted = []
+        with self.lock:
+            self.discard(uid)
+            now = time.time()
+            self.entries[uid] = (size, now)
+            self.bytes += size
+
+            for old_uid in list(self.entries):
+                if old_uid == uid or not (self.over_budget() or self.expired(self.entries[old_uid][1], now)):
+                    break
+                self.discard(old_uid)
+                evicted.append(old_uid)
+            self.evictions += len(evicted)
+        return evicted
+
+    # records a lookup and returns whether the message may still be used
+    def accessed(self, uid):
+        with self.lock:
+            entry = self.entries.get(uid)
+            if entry is None:
+                self.misses += 1
+                return True
+            if self.expired(entry[1]):
+                self.discard(uid)
+                self.evictions += 1
+                self.misses += 1
+                return False
+            self.entries[uid] = self.entries.pop(uid)
+            self.hits += 1
+            return True
+
+    def missed(self, uid):
+        with self.lock:
+            self.misses += 1
+
+    def removed(self, uid):
+        with self.lock:
+            self.discard(uid)
+
+    def discard(self, uid):
+        entry = self.entries.pop(uid, None)
+        if entry:
+            self.bytes -= entry[0]
+
+    def stats(self):
+        return {'messages': len(self.entries), 'bytes': self.bytes, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
@@ -0,0 +1,161 @@
+import imaplib
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from .exceptions import ConnectionError, Timeout
+
+
+class Connection(object):
+    def __init__(self, imap):
+        self.imap = imap
+        self.selected = None
+        self.last_used = time.time()
+        self.depth = 0
+
+
+class ConnectionPool(object):
+    """A pool of IMAP connections logged in with the credentials of a Gmail session.
+
+    Each connection keeps its mailbox selected between checkouts, and checkouts prefer a
+    connection that already has the requested mailbox selected. A thread that already holds
+    a connection to a mailbox gets the same connection back when it asks for it again.
+    """
+
+    # idle connections older than this are checked with NOOP before being handed out
+    HEALTH_CHECK_INTERVAL = 60
+
+    def __init__(self, gmail, size=4, timeout=None):
+        self.gmail = gmail
+        self.size = size
+        self.timeout = timeout
+        self.available = []
+        self.created = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.local = threading.local()
+
+    def held(self):
+        if not hasattr(self.local, 'connections'):
+            self.local.connections = []
+        return self.local.connections
+
+    def connect(self):
+        return Connection(self.gmail.imap_login(self.gmail.new_imap()))
+
+    def take(self, mailbox_name):
+        for connection in self.available:
+            if connection.selected == mailbox_name:
+                self.available.remove(connection)
+                return connection
+        # rather than switching the mailbox of an idle connection, open a new one while the pool is not full;
+        # otherwise the least recently used mailbox is the one least likely to be wanted again
+        if self.available and (mailbox_name is None or self.created >= self.size):
+            connection = min(self.available, key=lambda c: c.last_used)
+            self.available.remove(connection)
+            return connection
+        return None
+
+    def checkout(self, mailbox_name=None):
+        for connection in self.held():
+            if mailbox_name is None or connection.selected == mailbox_name:
+                connection.depth += 1
+                return connection
+
+        deadline = time.time() + self.timeout if self.timeout else None
+        with self.condition:
+            while True:
+                if self.closed:
+                    raise ConnectionError('connection pool is closed')
+                connection = self.take(mailbox_name)
+                if connection or self.created < self.size:
+                    break
+                remaining = deadline - time.time() if deadline else None
+                if remaining is not None and remaining <= 0:
+                    raise Timeout('no IMAP connection available')
+                self.condition.wait(remaining)
+            if not connection:
+                self.created += 1
+
+        try:
+            if connection:
+                connection = self.check(connection)
+            else:
+                connection = self.connect()
+            if mailbox_name and connection.selected != mailbox_name:
+                self.gmail.select(connection.imap, mailbox_name)
+                connection.selected = mailbox_name
+        except Exception:
+            self.discard(connection)
+            raise
+
+        connection.depth = 1
+        self.held().append(connection)
+        return connection
+
+    def check(self, connection):
+        if time.time() - connection.last_used < self.HEALTH_CHECK_INTERVAL:
+            return connection
+        try:
+            connection.imap.noop()
+            return connection
+        except (imaplib.IMAP4.abort, socket.error):
+            # the server dropped the connection; log in again
+            self.close_connection(connection)
+            return self.connect()
+
+    def checkin(self, connection):
+        if connection not in self.held():
+            return  # already discarded by a nested checkout
+        connection.depth -= 1
+        if connection.depth > 0:
+            return
+        self.held().remove(connection)
+        connection.last_used = time.time()
+        with self.condition:
+            if self.closed:
+                self.created -= 1
+                self.close_connection(connection)
+            else:
+                self.available.append(connection)
+            self.condition.notify()
+
+    def discard(self, connection):
+        if connection in self.held():
+            self.held().remove(connection)
+        if connection:
+            self.close_connection(connection)
+        with self.condition:
+            self.created -= 1
+            self.condition.notify()
+
+    @contextmanager
+    def connection(self, mailbox_name=None):
+        connection = self.checkout(mailbox_name)
+        dropped = False
+        try:
+            yield connection.imap
+        except (imaplib.IMAP4.abort, socket.error):
+            dropped = True
+            raise
+        finally:
+            if dropped:
+                self.discard(connection)
+            else:
+                self.checkin(connection)
+
+    def close_connection(self, connection):
+        try:
+            connection.imap.logout()
+        except Exception:
+            pass
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            available, self.available = self.available, []
+            self.created -= len(available)
+            self.condition.notify_all()
+        for connection in available:
+            self.close_connection(connection)
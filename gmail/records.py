@@ -0,0 +1,213 @@
+import datetime
+import weakref
+
+from six.moves import intern
+from six.moves.collections_abc import MutableMapping
+
+
+# the system flags kept as bits of MessageRecord.flag_bits; other flags are kept as keywords
+SYSTEM_FLAGS = ('\\Seen', '\\Answered', '\\Flagged', '\\Deleted', '\\Draft', '\\Recent')
+FLAG_BITS = dict((flag, 1 << index) for index, flag in enumerate(SYSTEM_FLAGS))
+
+# one tuple for each distinct set of labels, keywords or addresses
+SHARED_TUPLES = {}
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def shared(values):
+    values = tuple(intern(value) if isinstance(value, str) else value for value in values or ())
+    return SHARED_TUPLES.setdefault(values, values)
+
+
+def to_int(value):
+    return int(value) if value is not None else None
+
+
+class MessageRecord(object):
+    """The metadata of a message, without its headers, bodies or MIME tree.
+
+    UIDs, thread and message ids are integers, system flags are bits, and labels, keywords
+    and addresses are interned and shared between records. A record is turned back into a
+    Message with to_message(); its bodies are fetched again when they are read.
+    """
+
+    __slots__ = ('uid', 'thread_id', 'message_id', 'flag_bits', 'keywords', 'labels', 'subject', 'fr', 'to', 'cc',
+                 'timestamp', 'size', 'fetched')
+
+    def __init__(self, uid, thread_id=None, message_id=None, flags=None, labels=None, subject=None, fr=None, to=None,
+                 cc=None, sent_at=None, size=None, fetched=False):
+        self.uid = int(uid)
+        self.thread_id = to_int(thread_id)
+        self.message_id = to_int(message_id)
+        self.flag_bits = 0
+        for flag in flags or []:
+            self.flag_bits |= FLAG_BITS.get(flag, 0)
+        self.keywords = shared(flag for flag in flags or [] if flag not in FLAG_BITS)
+        self.labels = shared(labels)
+        self.subject = subject
+        self.fr = intern(fr) if isinstance(fr, str) else fr
+        self.to = shared(to)
+        self.cc = shared(cc)
+        self.timestamp = int((sent_at - EPOCH).total_seconds()) if sent_at else None
+        self.size = size
+        self.fetched = fetched
+
+    @classmethod
+    def from_message(cls, message):
+        fetched = bool(message.profiles) or message.raw is not None
+        if not fetched:
+            return cls(message.uid, message.thread_id, message.message_id, message.flags, message.labels, size=message.size)
+        return cls(message.uid, message.thread_id, message.message_id, message.flags, message.labels, message.subject,
+                   message.fr, message.to, message.cc, message.sent_at, message.size, fetched)
+
+    @property
+    def flags(self):
+        return [flag for flag in SYSTEM_FLAGS if self.flag_bits & FLAG_BITS[flag]] + list(self.keywords)
+
+    @property
+    def sent_at(self):
+        return EPOCH + datetime.timedelta(seconds=self.timestamp) if self.timestamp is not None else None
+
+    def has_flag(self, flag):
+        return bool(self.flag_bits & FLAG_BITS[flag]) if flag in FLAG_BITS else flag in self.keywords
+
+    def is_read(self):
+        return self.has_flag('\\Seen')
+
+    def is_starred(self):
+        return self.has_flag('\\Flagged')
+
+    def has_label(self, label):
+        return label in self.labels
+
+    # a Message with the metadata of the record; anything else is fetched again when it is read
+    def to_message(self, mailbox):
+        message = mailbox.message_class(mailbox, str(self.uid))
+        message.flags = self.flags
+        message.labels = list(self.labels)
+        message.thread_id = str(self.thread_id) if self.thread_id is not None else None
+        message.message_id = str(self.message_id) if self.message_id is not None else None
+        message.size = self.size
+        if self.fetched:
+            message.subject = self.subject
+            message.fr = self.fr
+            message.to = list(self.to)
+            message.cc = list(self.cc)
+            message.sent_at = self.sent_at
+            message.profiles.add('envelope')
+        return message
+
+    def __repr__(self):
+        return '<MessageRecord %s>' % self.uid
+
+
+# what a message counts for in a byte budget
+def message_size(message):
+    if message.size is not None:
+        return message.size
+    return len(message.raw) if message.raw is not None else 0
+
+
+class MessageStore(MutableMapping):
+    """The messages of a mailbox by UID, as Message objects or, when compact, as MessageRecords.
+
+    A compact store turns a record into a Message when it is looked up, and keeps handing
+    out that Message for as long as it is in use elsewhere. With drop_tree, stored messages
+    let go of their raw text and MIME tree once their headers and bodies are parsed. An
+    optional gmail.policy.CachePolicy decides which messages are evicted.
+    """
+
+    def __init__(self, mailbox, compact=False, drop_tree=False, policy=None):
+        self.mailbox = mailbox
+        self.compact = compact
+        self.drop_tree = drop_tree
+        self.policy = policy
+        self.entries = {}
+        self.live = weakref.WeakValueDictionary()
+
+    def key(self, uid):
+        return int(uid) if self.compact else uid
+
+    def __getitem__(self, uid):
+        if self.policy:
+            if uid not in self:
+                self.policy.missed(str(uid))
+                raise KeyError(uid)
+            if not self.policy.accessed(str(uid)):
+                self.evict(uid)
+                raise KeyError(uid)
+        return self.lookup(uid)
+
+    def lookup(self, uid):
+        if not self.compact:
+            return self.entries[uid]
+        message = self.live.get(str(uid))
+        if message is None:
+            message = self.entries[int(uid)].to_message(self.mailbox)
+            self.live[str(uid)] = message
+        return message
+
+    def __setitem__(self, uid, message):
+        if self.drop_tree:
+            message.drop_tree()
+        if self.compact:
+            self.entries[int(uid)] = MessageRecord.from_message(message)
+            self.live[str(uid)] = message
+        else:
+            self.entries[uid] = message
+
+        if self.policy:
+            for evicted in self.policy.added(str(uid), message_size(message)):
+                self.evict(evicted)
+
+    def __delitem__(self, uid):
+        self.evict(uid)
+        if self.policy:
+            self.policy.removed(str(uid))
+
+    def evict(self, uid):
+        self.entries.pop(self.key(uid), None)
+        self.live.pop(str(uid), None)
+
+    def __contains__(self, uid):
+        try:
+            return self.key(uid) in self.entries
+        except ValueError:
+            return False
+
+    def __iter__(self):
+        return (str(key) for key in self.entries) if self.compact else iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    # records the changes made to a message that is in the store, and charges the policy for what it has loaded
+    def refresh(self, message):
+        stored = self.live.get(str(message.uid)) if self.compact else self.entries.get(message.uid)
+        if stored is not message:
+            return
+        if self.compact:
+            self.entries[int(message.uid)] = MessageRecord.from_message(message)
+        if self.policy:
+            for evicted in self.policy.added(str(message.uid), message_size(message)):
+                self.evict(evicted)
+
+    def records(self):
+        for key in list(self.entries):
+            entry = self.entries.get(key)
+            message = self.live.get(str(key)) if self.compact else entry
+            if message is not None:
+                yield MessageRecord.from_message(message)
+            elif entry is not None:
+                yield entry
+
+    # switches to records, converting the messages already stored
+    def set_compact(self, compact=True):
+        if compact != self.compact:
+            messages = [(uid, self.lookup(uid)) for uid in list(self)]
+            self.entries.clear()
+            self.live.clear()
+            self.compact = compact
+            for uid, message in messages:
+                self[uid] = message
@@ -0,0 +1,50 @@
+import weakref
+
+
+class Selection(object):
+    """The mailbox selected on a connection, as reported by its SELECT or EXAMINE."""
+
+    def __init__(self, mailbox, readonly, exists=None, uidvalidity=None, uidnext=None, highestmodseq=None):
+        self.mailbox = mailbox
+        self.readonly = readonly
+        self.exists = exists
+        self.uidvalidity = uidvalidity
+        self.uidnext = uidnext
+        self.highestmodseq = highestmodseq
+
+    # a read-write selection also serves reads
+    def covers(self, mailbox, readonly):
+        return self.mailbox == mailbox and (readonly or not self.readonly)
+
+    def __repr__(self):
+        return '<Selection %s%s>' % (self.mailbox, ' read-only' if self.readonly else '')
+
+
+class SelectionTracker(object):
+    """Remembers which mailbox each IMAP connection has selected, so that selecting it again can be skipped."""
+
+    def __init__(self):
+        self.selections = weakref.WeakKeyDictionary()
+        self.selects = 0
+        self.skipped = 0
+
+    def current(self, imap):
+        selection = self.selections.get(imap)
+        # imaplib leaves the SELECTED state on CLOSE, LOGOUT and errors
+        if selection and getattr(imap, 'state', 'SELECTED') != 'SELECTED':
+            self.forget(imap)
+            return None
+        return selection
+
+    def selected(self, imap, selection):
+        self.selects += 1
+        self.selections[imap] = selection
+
+    def forget(self, imap):
+        self.selections.pop(imap, None)
+
+    # forgets the selections of a mailbox that was renamed or deleted
+    def forget_mailbox(self, mailbox):
+        for imap, selection in list(self.selections.items()):
+            if selection.mailbox == mailbox:
+                self.forget(imap)
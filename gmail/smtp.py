@@ -0,0 +1,187 @@
+import re
+import smtplib
+import socket
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from six.moves import queue
+
+
+def dot_stuff(chunk):
+    return re.sub(br'(?m)^\.', b'..', chunk)
+
+
+# the DATA of a draft, written out a chunk at a time; every chunk starts at a line boundary
+def data_chunks(draft):
+    for chunk in draft.generate():
+        yield dot_stuff(chunk)
+    yield b'.\r\n'
+
+
+def transaction_commands(sender, recipients):
+    return ['MAIL FROM:<%s>' % sender] + ['RCPT TO:<%s>' % recipient for recipient in recipients] + ['DATA']
+
+
+# checks the replies to transaction_commands; returns the refused recipients and the error that ends the
+# transaction before the message data, if any
+def check_replies(sender, recipients, replies):
+    sender_reply, data_reply = replies[0], replies[-1]
+    refused = dict((recipient, reply) for recipient, reply in zip(recipients, replies[1:-1]) if reply[0] not in (250, 251))
+
+    error = None
+    if sender_reply[0] != 250:
+        error = smtplib.SMTPSenderRefused(sender_reply[0], sender_reply[1], sender)
+    elif len(refused) == len(recipients):
+        error = smtplib.SMTPRecipientsRefused(refused)
+    elif data_reply[0] != 354:
+        error = smtplib.SMTPDataError(*data_reply)
+    return refused, error
+
+
+class SendResult(object):
+    def __init__(self, draft, recipients=None, error=None):
+        self.draft = draft
+        # the (code, message) reply to each RCPT TO
+        self.recipients = recipients or {}
+        self.error = error
+
+    @property
+    def message_id(self):
+        return self.draft.message_id
+
+    @property
+    def ok(self):
+        return self.error is None and all(code in (250, 251) for code, message in self.recipients.values())
+
+    def refused(self):
+        return dict((recipient, reply) for recipient, reply in self.recipients.items() if reply[0] not in (250, 251))
+
+    def __repr__(self):
+        return '<SendResult %s %s>' % (self.message_id, 'ok' if self.ok else 'failed')
+
+
+class SMTPSession(object):
+    """An SMTP connection logged in with the credentials of a Gmail session.
+
+    MAIL, RCPT and DATA are sent together when the server supports PIPELINING. A connection
+    dropped before the message data went out is reopened and the message sent again; with
+    max_rate, the session sends at most that many messages per second.
+    """
+
+    def __init__(self, gmail, max_rate=None):
+        self.gmail = gmail
+        self.max_rate = max_rate
+        self.smtp = None
+        self.last_sent = None
+
+    def connect(self):
+        if not self.smtp:
+            self.smtp = self.gmail.smtp_login(self.gmail.new_smtp())
+        return self.smtp
+
+    def close(self):
+        if self.smtp:
+            try:
+                self.smtp.quit()
+            except (smtplib.SMTPException, socket.error):
+                pass
+            self.smtp = None
+
+    def wait(self):
+        if self.max_rate and self.last_sent:
+            delay = self.last_sent + 1.0 / self.max_rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        self.last_sent = time.time()
+
+    def send(self, draft):
+        self.wait()
+        try:
+            return self.sendmail(draft)
+        except (smtplib.SMTPServerDisconnected, socket.error) as error:
+            self.smtp = None
+            if getattr(error, 'data_sent', False):
+                return SendResult(draft, error=error)  # it may have been delivered; sending again could duplicate it
+        try:
+            return self.sendmail(draft)
+        except (smtplib.SMTPServerDisconnected, socket.error) as error:
+            self.smtp = None
+            return SendResult(draft, error=error)
+
+    def sendmail(self, draft):
+        return send_draft(self.connect(), draft)
+
+
+# sends a draft over an smtplib connection, streaming its data
+def send_draft(smtp, draft):
+    commands = transaction_commands(draft.sender, draft.recipients)
+    if smtp.has_extn('pipelining'):
+        smtp.send(''.join(command + '\r\n' for command in commands))
+        replies = [smtp.getreply() for command in commands]
+    else:
+        replies = [smtp.docmd(command) for command in commands]
+
+    results = dict(zip(draft.recipients, replies[1:-1]))
+    refused, error = check_replies(draft.sender, draft.recipients, replies)
+    if error:
+        if replies[-1][0] == 354:
+            smtp.docmd('.')
+        smtp.rset()
+        return SendResult(draft, results, error)
+
+    try:
+        for chunk in data_chunks(draft):
+            smtp.send(chunk)
+        code, response = smtp.getreply()
+    except (smtplib.SMTPServerDisconnected, socket.error) as error:
+        error.data_sent = True
+        raise
+    return SendResult(draft, results, smtplib.SMTPDataError(code, response) if code != 250 else None)
+
+
+class BulkSender(object):
+    """Sends drafts over several SMTP sessions at once.
+
+    Each session sends one message at a time. At most max_pending messages are waiting to
+    be sent, and results are returned in the order of the drafts.
+    """
+
+    def __init__(self, gmail, sessions=4, max_rate=None, max_pending=None):
+        self.gmail = gmail
+        self.size = sessions
+        self.max_rate = max_rate
+        self.max_pending = max_pending or sessions * 2
+        self.sessions = queue.Queue()
+        for i in range(sessions):
+            self.sessions.put(SMTPSession(gmail, max_rate))
+
+    def send_one(self, draft):
+        session = self.sessions.get()
+        try:
+            return session.send(draft)
+        except (smtplib.SMTPException, socket.error) as error:
+            session.close()
+            return SendResult(draft, error=error)
+        finally:
+            self.sessions.put(session)
+
+    def send(self, drafts):
+        executor = ThreadPoolExecutor(self.size)
+        pending = deque()
+        try:
+            for draft in drafts:
+                if len(pending) >= self.max_pending:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(self.send_one, draft))
+
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def close(self):
+        while not self.sessions.empty():
+            self.sessions.get().close()
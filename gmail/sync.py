@@ -0,0 +1,120 @@
+from .batch import expand_uids, sort_uids
+from .message import FETCH_METADATA
+from .parser import parse_fetch_response, to_text
+
+
+class SyncResult(object):
+    def __init__(self, added, changed, removed, state, full=False):
+        self.added = added
+        self.changed = changed
+        self.removed = removed
+        self.state = state
+        # the whole mailbox was listed, either on the first sync or after a UIDVALIDITY change
+        self.full = full
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed)
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '<SyncResult added=%d changed=%d removed=%d>' % (len(self.added), len(self.changed), len(self.removed))
+
+
+def fetch_metadata(imap, uid_set, modifier=None):
+    args = ['FETCH', uid_set, '(%s)' % FETCH_METADATA]
+    if modifier:
+        args.append(modifier)
+    response, results = imap.uid(*args)
+    if response != 'OK':
+        return []
+    return [(items['UID'], items) for sequence, items in parse_fetch_response(results) if 'UID' in items]
+
+
+def metadata_signature(items):
+    return ' '.join(sorted(items.get('FLAGS') or []) + sorted(items.get('X-GM-LABELS') or []))
+
+
+def sync_mailbox(mailbox, state=None, prefetch=False, profile='full'):
+    gmail = mailbox.gmail
+    # Gmail.login enables these already; it is too late once a mailbox has been selected
+    condstore = gmail.enable('QRESYNC') or gmail.enable('CONDSTORE')
+    qresync = 'QRESYNC' in gmail.enabled
+
+    added = []
+    changed = []
+    removed = []
+    signatures = dict(state.get('signatures') or {}) if state else {}
+
+    with mailbox.connection() as imap:
+        # a fresh SELECT reports the current UIDVALIDITY, UIDNEXT and HIGHESTMODSEQ
+        gmail.select(imap, mailbox.name, force=True)
+        full = not state or state['uidvalidity'] != mailbox.uidvalidity
+
+        if full:
+            signatures = {}
+            added = fetch_metadata(imap, '1:*') if mailbox.exists else []
+            current = set(uid for uid, items in added)
+            removed = [uid for uid in state['uids'] if uid not in current] if state else []
+        else:
+            known = set(state['uids'])
+            uidnext = state['uidnext']
+
+            if mailbox.uidnext is None or mailbox.uidnext > uidnext:
+                # n:* always matches the highest UID, even when it is below n
+                added = [(uid, items) for uid, items in fetch_metadata(imap, '%d:*' % uidnext) if int(uid) >= uidnext]
+
+            if known and condstore and state.get('highestmodseq'):
+                if mailbox.highestmodseq != state['highestmodseq']:
+                    modifier = '(CHANGEDSINCE %d%s)' % (state['highestmodseq'], ' VANISHED' if qresync else '')
+                    imap.response('VANISHED')  # drops responses left over from earlier commands
+                    changed = [(uid, items) for uid, items in fetch_metadata(imap, '1:%d' % (uidnext - 1), modifier) if uid in known]
+                    if qresync:
+                        # the server may split the UIDs over several VANISHED (EARLIER) responses
+                        response, data = imap.response('VANISHED')
+                        vanished = set(uid for line in data if line for uid in expand_uids(to_text(line).split(' ')[-1]))
+                        removed = [uid for uid in state['uids'] if uid in vanished]
+            elif known:
+                # without CONDSTORE, flags and labels are compared with the ones seen on the last sync
+                for uid, items in fetch_metadata(imap, '1:%d' % (uidnext - 1)):
+                    if uid in known and signatures.get(uid) != metadata_signature(items):
+                        changed.append((uid, items))
+
+            if not qresync and mailbox.exists != len(known) + len(added):
+                # searched over the connection already held, which has the mailbox selected
+                response, data = mailbox.uid_search(imap, ['ALL'])
+                if response == 'OK':
+                    current = set(to_text(data[0]).split())
+                    removed = [uid for uid in state['uids'] if uid not in current]
+
+    messages = {}
+    for uid, items in added + changed:
+        message = mailbox.messages.get(uid) or mailbox.message_class(mailbox, uid)
+        message.load(items)
+        mailbox.messages[uid] = message
+        messages[uid] = message
+        if not condstore:
+            signatures[uid] = metadata_signature(items)
+    for uid in removed:
+        mailbox.messages.pop(uid, None)
+        mailbox.unindex(uid)
+        signatures.pop(uid, None)
+
+    if prefetch and added:
+        gmail.fetch_multiple_messages(dict((uid, messages[uid]) for uid, items in added), profile=profile)
+
+    removed_uids = set(removed)
+    uids = [uid for uid in (state['uids'] if state and not full else []) if uid not in removed_uids]
+    uids.extend(uid for uid, items in added)
+    uidnext = max([mailbox.uidnext or 1] + [int(uid) + 1 for uid, items in added])
+
+    new_state = {
+        'uidvalidity': mailbox.uidvalidity,
+        'uidnext': uidnext,
+        'highestmodseq': mailbox.highestmodseq,
+        'uids': sort_uids(uids),
+    }
+    if not condstore:
+        new_state['signatures'] = signatures
+
+    return SyncResult([messages[uid] for uid, items in added], [messages[uid] for uid, items in changed], removed, new_state, full)
@@ -0,0 +1,177 @@
+import uuid
+from email.header import Header
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.utils import parseaddr
+from string import Formatter
+
+from .draft import Attachment, Draft, encode_address, encodebytes, guess_charset, to_crlf
+
+
+__all__ = ['DraftTemplate']
+
+
+def template_fields(template):
+    return set(name for literal, name, spec, conversion in Formatter().parse(template or '') if name is not None)
+
+
+class Content(object):
+    """A part of a message that is already encoded."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def size(self):
+        return len(self.data)
+
+    def chunks(self, chunk_size=None):
+        yield self.data
+
+
+class TextSlot(object):
+    """Where the plain or html body goes in a template; the part headers depend on the charset of the rendered text."""
+
+    def __init__(self, subtype, template):
+        self.subtype = subtype
+        self.template = template
+        self.marker = 'text-%s' % uuid.uuid4().hex
+        self.headers = {}
+        self.content = None
+        # a body without fields is encoded once
+        if not template_fields(template):
+            self.content = self.render({})
+
+    def part(self):
+        part = MIMEBase('text', self.subtype)
+        part.set_payload(self.marker)
+        return part
+
+    def render(self, fields):
+        if self.content:
+            return self.content
+
+        text = self.template.format(**fields)
+        charset = guess_charset(text)
+        if charset not in self.headers:
+            encoding = '7bit' if charset == 'us-ascii' else 'base64'
+            self.headers[charset] = to_crlf('Content-Type: text/%s; charset="%s"\nMIME-Version: 1.0\nContent-Transfer-Encoding: %s\n\n'
+                                            % (self.subtype, charset, encoding))
+        if charset == 'us-ascii':
+            body = to_crlf(text if text.endswith('\n') else text + '\n')
+        else:
+            body = encodebytes(text.encode(charset)).replace(b'\n', b'\r\n')
+        return Content(self.headers[charset] + body)
+
+
+class DraftTemplate(object):
+    """Renders personalized drafts from a subject, plain and html text with str.format fields.
+
+    The MIME structure, the shared headers and the attachments are put together and encoded
+    once. Rendering only fills in the recipients, the subject and bodies that have fields, and
+    a new Message-ID:
+
+        template = g.template('Hello {name}', plain='Dear {name},\n...', attachments=['terms.pdf'])
+        g.send_bulk(template.render([user.email], name=user.name) for user in users)
+    """
+
+    def __init__(self, gmail, subject, plain=None, html=None, sender=None, cc=None, bcc=None, attachments=None, headers=None,
+                 cache_attachments=True):
+        if plain is None and html is None:
+            raise ValueError('plain and html cannot be None at the same time')
+
+        self.gmail = gmail
+        sender = sender or gmail.username
+        self.sender = parseaddr(sender)[1]
+        self.domain = self.sender.split('@')[-1]
+        self.cc = cc or []
+        self.bcc = bcc or []
+        self.subject = subject
+        self.subject_fields = template_fields(subject)
+
+        self.markers = dict((name, ('header-%s-%s' % (name, uuid.uuid4().hex))) for name in ('to', 'subject', 'message-id'))
+        message = MIMEMultipart()
+        message['Subject'] = self.markers['subject'] if self.subject_fields else Header(subject, guess_charset(subject))
+        message['From'] = sender
+        message['To'] = self.markers['to']
+        if self.cc:
+            message['Cc'] = ', '.join(map(encode_address, self.cc))
+        message['Message-ID'] = self.markers['message-id']
+        for key, value in (headers or {}).items():
+            message[key] = value
+
+        slots = [TextSlot(subtype, text) for subtype, text in (('plain', plain), ('html', html)) if text is not None]
+        if len(slots) > 1:
+            body = MIMEMultipart('alternative')
+            for slot in slots:
+                body.attach(slot.part())
+            message.attach(body)
+        else:
+            message.attach(slots[0].part())
+
+        self.attachments = []
+        for attachment in attachments or []:
+            if isinstance(attachment, tuple):
+                attachment = Attachment(attachment[1], attachment[0])
+            elif not isinstance(attachment, Attachment):
+                attachment = Attachment(attachment)
+            message.attach(attachment.part())
+            self.attachments.append(attachment)
+
+        self.skeleton = self.split(message.as_string(), slots)
+        if cache_attachments:
+            self.skeleton = [(before, Content(b''.join(slot.chunks())) if isinstance(slot, Attachment) else slot)
+                             for before, slot in self.skeleton]
+
+    # splits the prototype message around its text slots and attachments; a text slot takes the place of its whole part
+    def split(self, text, slots):
+        pieces = []
+        for slot in slots + self.attachments:
+            position = text.index(slot.marker + '\n')
+            before = text[:position]
+            if isinstance(slot, TextSlot):
+                boundary = before.rfind('\n--') + 1  # or the very start, right after the previous slot
+                before = before[:before.index('\n', boundary) + 1]
+            pieces.append((to_crlf(before), slot))
+            text = text[position + len(slot.marker) + 1:]
+        pieces.append((to_crlf(text), None))
+        return pieces
+
+    def render(self, recipients, **fields):
+        return RenderedDraft(self, recipients, fields)
+
+    # renders one draft for each (recipients, fields) pair
+    def render_all(self, rows):
+        for recipients, fields in rows:
+            yield self.render(recipients, **fields)
+
+
+class RenderedDraft(Draft):
+    """A draft put together from the precompiled pieces of a DraftTemplate."""
+
+    def __init__(self, template, recipients, fields):
+        self.gmail = template.gmail
+        self.template = template
+        self.sender = template.sender
+        self.recipients = recipients + template.cc + template.bcc
+        self.attachments = template.attachments
+        self.message = None
+        self.message_id = '<%s@%s>' % (uuid.uuid4().hex, template.domain)
+
+        if template.subject_fields:
+            subject = template.subject.format(**fields)
+            self.subject = subject if guess_charset(subject) == 'us-ascii' else Header(subject, 'utf-8').encode()
+        else:
+            self.subject = None
+
+        markers = template.markers
+        header = template.skeleton[0][0]
+        header = header.replace(markers['to'].encode('ascii'), to_crlf(', '.join(map(encode_address, recipients))), 1)
+        header = header.replace(markers['message-id'].encode('ascii'), self.message_id.encode('ascii'), 1)
+        if self.subject is not None:
+            header = header.replace(markers['subject'].encode('ascii'), to_crlf(self.subject), 1)
+
+        self.pieces = [(header, template.skeleton[0][1])] + template.skeleton[1:]
+        self.pieces = [(before, slot.render(fields) if isinstance(slot, TextSlot) else slot) for before, slot in self.pieces]
+
+    def skeleton(self):
+        return self.pieces
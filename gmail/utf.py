@@ -91,6 +91,15 @@ def decode(s):
     return ''.join(r)
 
 
+# imaplib does not quote arguments, and Gmail's system mailbox names contain spaces
+def quote(mailbox_name):
+    return '"%s"' % encode(mailbox_name).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def quote_string(value):
+    return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
+
+
 def modified_utf7(s):
     # encode to utf-7: '\xff' => b'+AP8-', decode from latin-1 => '+AP8-'
     s_utf7 = s.encode('utf-7').decode('latin-1')
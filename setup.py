@@ -24,5 +24,5 @@ setup(
         "Topic :: Communications :: Email",
         "License :: OSI Approved :: MIT License",
     ],
-    install_requires=['six'],
+    install_requires=['six', 'futures; python_version < "3"'],
 )
@@ -0,0 +1,517 @@
+"""A small IMAP server with the Gmail extensions the library uses, to run the tests against."""
+
+import email
+import email.utils
+import imaplib
+import re
+import select
+import threading
+import zlib
+from collections import OrderedDict
+
+from six.moves import socketserver
+
+from gmail import Gmail
+from gmail.batch import compress_uids
+
+
+# like Gmail, the extensions are only announced once logged in
+PRE_LOGIN_CAPABILITIES = ('IMAP4rev1', 'AUTH=XOAUTH2')
+CAPABILITIES = ('IMAP4rev1', 'UIDPLUS', 'MOVE', 'ENABLE', 'CONDSTORE', 'QRESYNC', 'X-GM-EXT-1')
+
+LITERAL = re.compile(br'\{(\d+)(\+)?\}\r\n$')
+FETCH = re.compile(r'^(\S+) \((.*?)\)(?: \(CHANGEDSINCE (\d+)( VANISHED)?\))?$', re.IGNORECASE)
+
+
+def message(number, subject=None):
+    return ('From: Alice <alice@example.com>\r\nTo: bob@example.com\r\nSubject: %s\r\n'
+            'Date: Mon, 1 Jan 2018 10:%02d:00 +0000\r\nMessage-ID: <m%d@example.com>\r\n\r\n'
+            'Body of message %d\r\n' % (subject or 'Message %d' % number, number % 60, number, number)).encode()
+
+
+def uid_set(text, largest):
+    uids = set()
+    for part in text.split(','):
+        first, _, last = part.partition(':')
+        first = largest if first == '*' else int(first)
+        last = first if not last else largest if last == '*' else int(last)
+        uids.update(range(min(first, last), max(first, last) + 1))
+    return uids
+
+
+def envelope(raw):
+    headers = email.message_from_string(raw.decode('utf-8'))
+
+    def string(value):
+        return '"%s"' % value if value else 'NIL'
+
+    def addresses(value):
+        if not value:
+            return 'NIL'
+        return '(%s)' % ''.join('(%s NIL %s %s)' % ((string(name),) + tuple(string(part) for part in address.split('@')))
+                                for name, address in email.utils.getaddresses([value]))
+
+    return '(%s %s %s %s %s %s %s NIL NIL %s)' % (
+        string(headers['date']), string(headers['subject']), addresses(headers['from']), addresses(headers['from']),
+        addresses(headers['from']), addresses(headers['to']), addresses(headers['cc']), string(headers['message-id']))
+
+
+def mailbox_name(text):
+    return text.split('"')[1] if text.startswith('"') else text.split(' ')[0]
+
+
+class StoredMessage(object):
+    def __init__(self, raw, flags, labels, modseq, message_id, thread_id=None):
+        self.raw = raw
+        self.flags = list(flags)
+        self.labels = list(labels)
+        self.modseq = modseq
+        self.message_id = message_id
+        # a message starts a thread of its own unless told otherwise
+        self.thread_id = thread_id or message_id
+
+
+class Folder(object):
+    def __init__(self, uidvalidity=1):
+        self.uidvalidity = uidvalidity
+        self.uidnext = 1
+        self.messages = OrderedDict()
+        # uid -> the MODSEQ it was expunged at
+        self.vanished = {}
+
+
+class Account(object):
+    """The mailboxes of the server. Tests change them directly, between the commands of the client."""
+
+    def __init__(self, capabilities=CAPABILITIES):
+        self.capabilities = capabilities
+        self.lock = threading.RLock()
+        self.modseq = 1
+        self.message_ids = 1000
+        self.folders = {'INBOX': Folder(), '[Gmail]/All Mail': Folder(), '[Gmail]/Trash': Folder()}
+        # names listed with these attributes that cannot be selected, such as '\\Noselect'
+        self.unselectable = {}
+        self.commands = []
+        # the literals sent, and whether the client waited to be asked for each
+        self.literals = []
+        # messages that arrive in the INBOX right after the next SELECT, or while a connection is idling; also
+        # ('FLAGS', uid, flags) and ('EXPUNGE', uid), for changes made to the INBOX from elsewhere
+        self.incoming = []
+
+    def next_modseq(self):
+        self.modseq += 1
+        return self.modseq
+
+    def add(self, raw, flags=(), labels=(), mailbox='INBOX', message_id=None, thread_id=None):
+        with self.lock:
+            folder = self.folders[mailbox]
+            uid = folder.uidnext
+            folder.uidnext += 1
+            if message_id is None:
+                self.message_ids += 1
+                message_id = self.message_ids
+            folder.messages[uid] = StoredMessage(raw, flags, labels, self.next_modseq(), message_id, thread_id)
+            return uid
+
+    def set_flags(self, uid, flags, mailbox='INBOX'):
+        with self.lock:
+            stored = self.folders[mailbox].messages[uid]
+            stored.flags = list(flags)
+            stored.modseq = self.next_modseq()
+
+    def expunge(self, uid, mailbox='INBOX'):
+        with self.lock:
+            folder = self.folders[mailbox]
+            del folder.messages[uid]
+            folder.vanished[uid] = self.next_modseq()
+
+    # gives the messages new UIDs under a new UIDVALIDITY
+    def renumber(self, mailbox='INBOX'):
+        with self.lock:
+            old = self.folders[mailbox]
+            folder = self.folders[mailbox] = Folder(old.uidvalidity + 1)
+            folder.uidnext = old.uidnext
+            for stored in old.messages.values():
+                folder.messages[folder.uidnext] = stored
+                folder.uidnext += 1
+                stored.modseq = self.next_modseq()
+
+
+class InflateReader(object):
+    """Reads what a client sends once it has turned on COMPRESS=DEFLATE."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.decompressor = zlib.decompressobj(-15)
+        self.buffer = b''
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def fill(self):
+        data = self.sock.recv(65536)
+        self.buffer += self.decompressor.decompress(data)
+        return bool(data)
+
+    def take(self, size):
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readline(self):
+        while b'\n' not in self.buffer and self.fill():
+            pass
+        return self.take(self.buffer.find(b'\n') + 1 or len(self.buffer))
+
+    def read(self, size):
+        while len(self.buffer) < size and self.fill():
+            pass
+        return self.take(size)
+
+
+class Handler(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        socketserver.StreamRequestHandler.setup(self)
+        self.account = self.server.account
+        self.logged_in = False
+        self.enabled = set()
+        self.selected = None
+        self.selected_name = None
+        self.literal = None
+        self.compressor = None
+
+    def send(self, data):
+        data = data if isinstance(data, bytes) else data.encode('utf-8')
+        if self.compressor:
+            data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.wfile.write(data)
+
+    def handle(self):
+        self.send('* OK stand-in ready\r\n')
+        # rfile is replaced once the connection is compressed
+        for line in iter(lambda: self.rfile.readline(), b''):
+            line = self.read_literals(line)
+            tag, command, arguments = (line.decode('utf-8').rstrip('\r\n').split(' ', 2) + ['', ''])[:3]
+            command = command.upper()
+            self.tag = tag
+            self.account.commands.append(' '.join(filter(None, [command, arguments])))
+            method = getattr(self, 'do_' + command, None)
+            if command == 'IDLE':
+                completion = self.idle()
+            else:
+                with self.account.lock:
+                    completion = method(arguments) if method else 'BAD unknown command'
+            # what arrives after a SELECT comes in the same packet as its completion, as on a busy server
+            notices = self.deliver() if command in ('SELECT', 'EXAMINE') else ''
+            self.send('%s %s\r\n%s' % (tag, completion, notices))
+            if command == 'LOGOUT':
+                return
+            if command == 'COMPRESS' and completion.startswith('OK'):
+                self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+                self.rfile = InflateReader(self.request)
+
+    # adds the incoming messages and returns the EXISTS responses announcing them
+    def deliver(self):
+        with self.account.lock:
+            notices = ''
+            while self.account.incoming:
+                change = self.account.incoming.pop(0)
+                uids = list(self.account.folders['INBOX'].messages)
+                if change[0] == 'FLAGS':
+                    self.account.set_flags(change[1], change[2])
+                    notices += '* %d FETCH (FLAGS (%s))\r\n' % (uids.index(change[1]) + 1, ' '.join(change[2]))
+                elif change[0] == 'EXPUNGE':
+                    self.account.expunge(change[1])
+                    notices += '* %d EXPUNGE\r\n' % (uids.index(change[1]) + 1)
+                else:
+                    self.account.add(change)
+                    notices += '* %d EXISTS\r\n' % len(self.account.folders['INBOX'].messages)
+            return notices
+
+    def idle(self):
+        self.send('+ idling\r\n')
+        while not select.select([self.rfile], [], [], 0.05)[0]:
+            notices = self.deliver()
+            if notices:
+                self.send(notices)
+        self.rfile.readline()  # DONE
+        return 'OK idle done'
+
+    # keeps the last literal of the command and takes it out of the line
+    def read_literals(self, line):
+        self.literal = None
+        # (what came before it since the previous literal, the literal) for each literal of the command
+        self.command_literals = []
+        start = 0
+        match = LITERAL.search(line)
+        while match:
+            synchronizing = not match.group(2)
+            if synchronizing:
+                self.send('+ go ahead\r\n')
+            self.literal = self.rfile.read(int(match.group(1)))
+            self.account.literals.append((self.literal, synchronizing))
+            self.command_literals.append((line[start:match.start()].decode('utf-8'), self.literal))
+            line = line[:match.start()].rstrip(b' ') + b' '
+            start = len(line)
+            line += self.rfile.readline()
+            match = LITERAL.search(line)
+        return line
+
+    def do_CAPABILITY(self, arguments):
+        self.send('* CAPABILITY %s\r\n' % ' '.join(self.account.capabilities if self.logged_in else PRE_LOGIN_CAPABILITIES))
+        return 'OK done'
+
+    def do_LOGIN(self, arguments):
+        self.logged_in = True
+        return 'OK logged in'
+
+    def do_LOGOUT(self, arguments):
+        self.send('* BYE\r\n')
+        return 'OK bye'
+
+    def do_NOOP(self, arguments):
+        return 'OK done'
+
+    def do_COMPRESS(self, arguments):
+        if 'COMPRESS=DEFLATE' not in self.account.capabilities or arguments.upper() != 'DEFLATE':
+            return 'BAD compression not supported'
+        if self.compressor:
+            return 'NO [COMPRESSIONACTIVE] already compressed'
+        return 'OK deflate active'
+
+    def do_ENABLE(self, arguments):
+        enabled = [capability for capability in arguments.upper().split() if capability in self.account.capabilities]
+        self.enabled.update(enabled)
+        self.send('* ENABLED %s\r\n' % ' '.join(enabled))
+        return 'OK done'
+
+    def do_LIST(self, arguments):
+        attributes = dict(self.account.unselectable, **{'[Gmail]/All Mail': '\\All', '[Gmail]/Trash': '\\Trash'})
+        for name in sorted(set(self.account.folders) | set(self.account.unselectable)):
+            self.send('* LIST (%s) "/" "%s"\r\n' % (attributes.get(name, '\\HasNoChildren'), name))
+            if 'RETURN (STATUS' in arguments and 'LIST-STATUS' in self.account.capabilities and name in self.account.folders:
+                self.do_STATUS('"%s"' % name)
+        return 'OK done'
+
+    def do_STATUS(self, arguments):
+        name = mailbox_name(arguments)
+        if name not in self.account.folders:
+            return 'NO no such mailbox'
+        folder = self.account.folders[name]
+        unseen = len([stored for stored in folder.messages.values() if '\\Seen' not in stored.flags])
+        self.send('* STATUS "%s" (MESSAGES %d UNSEEN %d UIDNEXT %d)\r\n' % (name, len(folder.messages), unseen, folder.uidnext))
+        return 'OK done'
+
+    def do_SELECT(self, arguments, readonly=False):
+        name = mailbox_name(arguments)
+        if name not in self.account.folders:
+            return 'NO no such mailbox'
+        self.selected = folder = self.account.folders[name]
+        self.selected_name = name
+        self.send('* %d EXISTS\r\n* OK [UIDVALIDITY %d] UIDs valid\r\n* OK [UIDNEXT %d] next UID\r\n' %
+                  (len(folder.messages), folder.uidvalidity, folder.uidnext))
+        if self.enabled & set(['CONDSTORE', 'QRESYNC']):
+            self.send('* OK [HIGHESTMODSEQ %d] modseq\r\n' % self.account.modseq)
+        return 'OK [%s] selected' % ('READ-ONLY' if readonly else 'READ-WRITE')
+
+    def do_CREATE(self, arguments):
+        self.account.folders.setdefault(mailbox_name(arguments), Folder())
+        return 'OK created'
+
+    def do_DELETE(self, arguments):
+        if self.account.folders.pop(mailbox_name(arguments), None) is None:
+            return 'NO no such mailbox'
+        return 'OK deleted'
+
+    def do_APPEND(self, arguments):
+        name = mailbox_name(arguments)
+        if name not in self.account.folders:
+            return 'NO [TRYCREATE] no such mailbox'
+        if len(self.command_literals) > 1 and 'MULTIAPPEND' not in self.account.capabilities:
+            return 'BAD one message at a time'
+        uids = []
+        for before, raw in self.command_literals:
+            flags = re.search(r'\(([^)]*)\)', before)
+            uids.append(self.account.add(raw, flags.group(1).split() if flags else (), mailbox=name))
+        if 'UIDPLUS' not in self.account.capabilities:
+            return 'OK appended'
+        return 'OK [APPENDUID %d %s] appended' % (self.account.folders[name].uidvalidity, compress_uids(uids))
+
+    def do_CLOSE(self, arguments):
+        self.selected = self.selected_name = None
+        return 'OK closed'
+
+    def do_EXAMINE(self, arguments):
+        return self.do_SELECT(arguments, readonly=True)
+
+    def do_UID(self, arguments):
+        command, _, arguments = arguments.partition(' ')
+        method = getattr(self, 'uid_' + command.upper(), None)
+        if not self.selected or not method:
+            return 'BAD unknown command'
+        return method(arguments)
+
+    # only the thread ids and the Gmail query are searched for; every message matches the rest
+    def uid_SEARCH(self, arguments):
+        uids = list(self.selected.messages)
+        uid_range = re.search(r'\bUID (\S+)', arguments)
+        if uid_range:
+            matching = uid_set(uid_range.group(1), max(uids or [0]))
+            uids = [uid for uid in uids if uid in matching]
+        thread_ids = re.findall(r'X-GM-THRID (\d+)', arguments)
+        if thread_ids:
+            uids = [uid for uid in uids if str(self.selected.messages[uid].thread_id) in thread_ids]
+        query = re.search(r'X-GM-RAW "(.*)"', arguments)
+        if 'X-GM-RAW' in arguments:
+            text = self.literal if self.literal is not None else query.group(1).encode('utf-8')
+            uids = [uid for uid in uids if text in self.selected.messages[uid].raw]
+        for negated, flag in re.findall(r'\b(UN)?(SEEN|FLAGGED)\b', arguments.split(' X-GM-RAW ')[0]):
+            wanted = '\\' + flag.capitalize()
+            uids = [uid for uid in uids if (wanted in self.selected.messages[uid].flags) != bool(negated)]
+
+        returns = re.match(r'RETURN \((.*?)\)', arguments)
+        if returns and 'ESEARCH' in self.account.capabilities:
+            results = []
+            for item in returns.group(1).split() or ['ALL']:
+                if item == 'COUNT':
+                    results.append('COUNT %d' % len(uids))
+                elif item in ('MIN', 'MAX') and uids:
+                    results.append('%s %d' % (item, min(uids) if item == 'MIN' else max(uids)))
+                elif item == 'ALL' and uids:
+                    results.append('ALL %s' % compress_uids(uids))
+            self.send('* ESEARCH (TAG "%s") UID %s\r\n' % (self.tag, ' '.join(results)))
+        else:
+            self.send('* SEARCH %s\r\n' % ' '.join(str(uid) for uid in uids))
+        return 'OK done'
+
+    def uids(self, text):
+        matching = uid_set(text, max(list(self.selected.messages) or [0]))
+        return [uid for uid in self.selected.messages if uid in matching]
+
+    def uid_STORE(self, arguments):
+        text, command, values = arguments.split(' ', 2)
+        for uid in self.uids(text):
+            stored = self.selected.messages[uid]
+            items = stored.labels if 'X-GM-LABELS' in command.upper() else stored.flags
+            for value in [value.strip('"') for value in values.strip('()').split()]:
+                if command.startswith('-') and value in items:
+                    items.remove(value)
+                elif command.startswith('+') and value not in items:
+                    items.append(value)
+            stored.modseq = self.account.next_modseq()
+        return 'OK done'
+
+    # returns the COPYUID response code, or None when there is no such mailbox
+    def copy(self, arguments):
+        text, _, name = arguments.partition(' ')
+        name = mailbox_name(name)
+        if name not in self.account.folders:
+            return None
+        uids = self.uids(text)
+        new_uids = [self.account.add(stored.raw, stored.flags, stored.labels, name, stored.message_id, stored.thread_id)
+                    for stored in [self.selected.messages[uid] for uid in uids]]
+        return '[COPYUID %d %s %s]' % (self.account.folders[name].uidvalidity, ','.join(map(str, uids)),
+                                       ','.join(map(str, new_uids)))
+
+    def expunge(self, uids):
+        for uid in reversed(uids):
+            self.send('* %d EXPUNGE\r\n' % (list(self.selected.messages).index(uid) + 1))
+            self.account.expunge(uid, self.selected_name)
+
+    def uid_COPY(self, arguments):
+        code = self.copy(arguments)
+        return 'OK %s copied' % code if code else 'NO [TRYCREATE] no such mailbox'
+
+    def uid_MOVE(self, arguments):
+        code = self.copy(arguments)
+        if not code:
+            return 'NO [TRYCREATE] no such mailbox'
+        self.send('* OK %s moving\r\n' % code)
+        self.expunge(self.uids(arguments.split(' ')[0]))
+        return 'OK moved'
+
+    def uid_EXPUNGE(self, arguments):
+        self.expunge([uid for uid in self.uids(arguments) if '\\Deleted' in self.selected.messages[uid].flags])
+        return 'OK expunged'
+
+    def uid_FETCH(self, arguments):
+        match = FETCH.match(arguments)
+        if not match:
+            return 'BAD cannot parse'
+        uids = uid_set(match.group(1), max(list(self.selected.messages) or [0]))
+        items = match.group(2).upper().split()
+        changed_since = int(match.group(3)) if match.group(3) else None
+
+        if match.group(4):
+            vanished = sorted(uid for uid, modseq in self.selected.vanished.items() if uid in uids and modseq > changed_since)
+            for uid in vanished:  # a response per UID, as a server may split them
+                self.send('* VANISHED (EARLIER) %d\r\n' % uid)
+
+        for sequence, (uid, stored) in enumerate(self.selected.messages.items()):
+            if uid not in uids or (changed_since is not None and stored.modseq <= changed_since):
+                continue
+            response = ['UID %d' % uid, 'FLAGS (%s)' % ' '.join(stored.flags), 'X-GM-THRID %d' % stored.thread_id,
+                        'X-GM-MSGID %d' % stored.message_id, 'X-GM-LABELS (%s)' % ' '.join(stored.labels)]
+            if 'RFC822.SIZE' in items:
+                response.append('RFC822.SIZE %d' % len(stored.raw))
+            if self.enabled & set(['CONDSTORE', 'QRESYNC']):
+                response.append('MODSEQ (%d)' % stored.modseq)
+            if 'ENVELOPE' in items:
+                response.append('ENVELOPE %s' % envelope(stored.raw))
+            end = stored.raw.find(b'\r\n\r\n') + 4 if b'\r\n\r\n' in stored.raw else len(stored.raw)
+            header, body = stored.raw[:end], stored.raw[end:]
+            if 'BODYSTRUCTURE' in items:
+                # every message is a single text/plain part
+                response.append('BODYSTRUCTURE ("text" "plain" ("charset" "us-ascii") NIL NIL "7bit" %d %d)' %
+                                (len(body), body.count(b'\n')))
+            literals = []
+            for name, data in (('BODY[]', stored.raw), ('BODY[HEADER]', header), ('BODY[1]', body)):
+                if name in items or name.replace('BODY', 'BODY.PEEK') in items:
+                    literals.append((name, data))
+            text = '* %d FETCH (%s' % (sequence + 1, ' '.join(response))
+            for name, data in literals:
+                self.send('%s %s {%d}\r\n' % (text, name, len(data)))
+                self.send(data)
+                text = ''
+            self.send(text + ')\r\n')
+        return 'OK done'
+
+
+class StandInServer(socketserver.ThreadingTCPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, account):
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), Handler)
+        self.account = account
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def connect(self):
+        return imaplib.IMAP4(*self.server_address)
+
+
+class StandInGmail(Gmail):
+    """A session whose IMAP connections go to the stand-in server; SMTP is left out."""
+
+    def __init__(self, server, **kwargs):
+        Gmail.__init__(self, **kwargs)
+        self.server = server
+
+    def new_imap(self):
+        return self.server.connect()
+
+    def new_smtp(self):
+        return None
+
+    def smtp_login(self, smtp):
+        return smtp
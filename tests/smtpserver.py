@@ -0,0 +1,102 @@
+"""A small SMTP server that keeps the messages it is sent, to run the tests against."""
+
+import threading
+
+from six.moves import socketserver
+
+
+class Mailer(object):
+    """What the server has been sent. Tests change refused between the messages of the client."""
+
+    def __init__(self, pipelining=True):
+        self.pipelining = pipelining
+        self.lock = threading.Lock()
+        self.connections = 0
+        # (sender, recipients, data) for every message accepted
+        self.messages = []
+        # recipients answered with 550
+        self.refused = set()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        socketserver.StreamRequestHandler.setup(self)
+        self.mailer = self.server.mailer
+        with self.mailer.lock:
+            self.mailer.connections += 1
+        self.reset()
+
+    def reset(self):
+        self.sender = None
+        self.recipients = []
+
+    def send(self, line):
+        self.wfile.write(line.encode('utf-8') + b'\r\n')
+
+    def handle(self):
+        self.send('220 stand-in ready')
+        for line in iter(self.rfile.readline, b''):
+            command, _, argument = line.decode('utf-8').rstrip('\r\n').partition(' ')
+            command = command.upper()
+            if command == 'EHLO':
+                self.send('250-stand-in')
+                if self.mailer.pipelining:
+                    self.send('250-PIPELINING')
+                self.send('250 AUTH PLAIN XOAUTH2')
+            elif command == 'AUTH':
+                self.send('235 accepted')
+            elif command == 'MAIL':
+                self.sender = argument.split(':', 1)[1].strip('<>')
+                self.send('250 ok')
+            elif command == 'RCPT':
+                recipient = argument.split(':', 1)[1].strip('<>')
+                if recipient in self.mailer.refused:
+                    self.send('550 no such user')
+                else:
+                    self.recipients.append(recipient)
+                    self.send('250 ok')
+            elif command == 'DATA':
+                if not self.recipients:
+                    self.send('554 no valid recipients')
+                    continue
+                self.send('354 go ahead')
+                lines = []
+                for data_line in iter(self.rfile.readline, b''):
+                    if data_line == b'.\r\n':
+                        break
+                    lines.append(data_line)
+                else:
+                    return
+                with self.mailer.lock:
+                    self.mailer.messages.append((self.sender, self.recipients, b''.join(lines)))
+                self.reset()
+                self.send('250 queued')
+            elif command == 'RSET':
+                self.reset()
+                self.send('250 ok')
+            elif command == 'QUIT':
+                self.send('221 bye')
+                return
+            else:
+                self.send('250 ok')
+
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mailer):
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), SMTPHandler)
+        self.mailer = mailer
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,140 @@
+import unittest
+
+from gmail import GmailException
+
+from .imapserver import CAPABILITIES, Account, StandInServer, message
+from .smtpserver import Mailer, StandInSMTPServer
+
+try:
+    import asyncio
+    from gmail import aio
+except (ImportError, SyntaxError):
+    aio = None
+
+
+@unittest.skipIf(aio is None, 'gmail.aio needs Python 3.7 or later')
+class AsyncTest(unittest.TestCase):
+
+    capabilities = CAPABILITIES
+
+    def setUp(self):
+        self.account = Account(self.capabilities)
+        for number in range(1, 4):
+            self.account.add(message(number, u'Caf\xe9 %d' % number if number == 2 else None))
+        self.server = StandInServer(self.account).start()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.gmail = aio.AsyncGmail()
+        self.gmail.imap = self.wait(aio.AsyncIMAP.connect(*self.server.server_address, ssl=False))
+        self.wait(self.gmail.login('user', 'password'))
+        self.inbox = self.gmail.inbox()
+
+    def tearDown(self):
+        self.wait(self.gmail.logout())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        self.server.stop()
+
+    def wait(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_non_ascii_search_is_a_literal(self):
+        # the count is pipelined behind the search, and only goes out once the literal has been sent
+        uids, count = self.wait(asyncio.gather(self.inbox.search(gmail_query=u'Caf\xe9'), self.inbox.count()))
+        self.assertEqual(['2'], uids)
+        self.assertEqual(3, count)
+        self.assertEqual([(u'Caf\xe9'.encode('utf-8'), True)], self.account.literals)
+
+    def test_refused_literal(self):
+        response, count = self.wait(asyncio.gather(self.gmail.execute(None, 'NOSUCH', literal=b'x'), self.inbox.count()))
+        self.assertEqual('BAD', response.status)
+        self.assertEqual(3, count)
+
+    def test_archive_and_delete(self):
+        email = self.wait(self.inbox.message('1'))
+        self.wait(email.archive())
+        self.assertEqual('[Gmail]/All Mail', email.mailbox.name)
+        self.assertEqual('1', email.uid)
+        self.assertEqual([2, 3], list(self.account.folders['INBOX'].messages))
+
+        self.wait(self.wait(self.inbox.mail()).delete())
+        self.assertEqual([], list(self.account.folders['INBOX'].messages))
+        self.assertEqual(2, len(self.account.folders['[Gmail]/Trash'].messages))
+
+        trash = self.gmail.mailbox('[Gmail]/Trash')
+        self.assertRaises(GmailException, self.wait, trash.trash())
+        self.assertEqual(['1', '2'], self.wait(trash.trash(gmail_query='Message')))
+        self.assertEqual([], list(self.account.folders['[Gmail]/Trash'].messages))
+
+    def test_search_stats_and_status(self):
+        self.assertEqual({'count': 3, 'min': 1, 'max': 3}, self.wait(self.inbox.search_stats()))
+        self.assertEqual({'messages': 3, 'unseen': 3, 'uidnext': 4}, self.wait(self.inbox.status()))
+
+    def test_fetch_thread(self):
+        self.wait(self.inbox.move(['2'], '[Gmail]/All Mail'))
+        email = self.wait(self.gmail.all_mail().message('1', profile=None))
+        thread = self.wait(email.fetch_thread())
+        self.assertEqual([email], list(thread))
+        self.assertEqual(email.thread_id, thread.thread_id)
+
+    def test_untagged_by_type(self):
+        imap = self.gmail.imap
+        store, search = aio.Response('UID STORE'), aio.Response('UID SEARCH')
+        imap.pending.extend([('X1', store, None), ('X2', search, None)])
+        # a server that runs the pipelined commands at once may answer the search before the store is done
+        imap.dispatch([b'* SEARCH 1 2'])
+        imap.dispatch([b'* 4 EXISTS'])
+        imap.pending.clear()
+        self.assertEqual({}, store.untagged)
+        self.assertEqual([b'1 2'], search.data('SEARCH'))
+        self.assertEqual(('EXISTS', [b'4']), imap.unsolicited[-1])
+
+    def test_esearch_by_tag(self):
+        imap = self.gmail.imap
+        first, second = aio.Response('UID SEARCH'), aio.Response('UID SEARCH')
+        imap.pending.extend([('X1', first, None), ('X2', second, None)])
+        imap.dispatch([b'* ESEARCH (TAG "X2") UID COUNT 3'])
+        imap.pending.clear()
+        self.assertEqual({}, first.untagged)
+        self.assertEqual({'COUNT': '3'}, aio.parse_esearch(second.data('ESEARCH')))
+
+    def test_unselectable_mailboxes(self):
+        self.account.unselectable = {'[Gmail]': '\\Noselect', 'Gone': '\\NonExistent'}
+        self.wait(self.gmail.fetch_mailboxes())
+        self.assertIn('[Gmail]/Trash', self.gmail.mailboxes)
+        self.assertNotIn('[Gmail]', self.gmail.mailboxes)
+        self.assertNotIn('Gone', self.gmail.mailboxes)
+        self.assertIsInstance(self.gmail.inbox(), aio.AsyncMailbox)
+
+    def test_sends_share_a_connection(self):
+        mailer = Mailer()
+        server = StandInSMTPServer(mailer).start()
+        self.gmail.new_smtp = lambda: aio.AsyncSMTP.connect(*server.server_address, ssl=False)
+        try:
+            self.wait(asyncio.gather(*[self.gmail.send(['bob@example.com'], 'Hello %d' % number, plain='Hi') for number in range(3)]))
+        finally:
+            self.wait(self.gmail.smtp.quit())
+            self.gmail.smtp = None
+            server.stop()
+        self.assertEqual(1, mailer.connections)
+        self.assertEqual(3, len(mailer.messages))
+
+
+class LiteralPlusTest(AsyncTest):
+    """The same against a server with LITERAL+, where literals are sent without waiting."""
+
+    capabilities = CAPABILITIES + ('LITERAL+',)
+
+    def test_non_ascii_search_is_a_literal(self):
+        self.assertEqual(['2'], self.wait(self.inbox.search(gmail_query=u'Caf\xe9')))
+        self.assertEqual([(u'Caf\xe9'.encode('utf-8'), False)], self.account.literals)
+
+
+class CopyTest(AsyncTest):
+    """The same against a server without MOVE, where messages are copied and expunged by UID."""
+
+    capabilities = ('IMAP4rev1', 'UIDPLUS', 'X-GM-EXT-1')
+
+
+if __name__ == '__main__':
+    unittest.main()
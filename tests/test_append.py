@@ -0,0 +1,111 @@
+import unittest
+
+from gmail.append import AppendMessage
+from gmail.exceptions import GmailException
+
+from .imapserver import CAPABILITIES, Account, StandInGmail, StandInServer, message
+
+
+class AppendTest(unittest.TestCase):
+
+    capabilities = CAPABILITIES
+
+    def setUp(self):
+        self.account = Account(self.capabilities)
+        self.account.add(message(1))
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server)
+        self.gmail.login('user', 'password')
+        self.inbox = self.gmail.inbox()
+
+    def tearDown(self):
+        if self.gmail.pool:
+            self.gmail.pool.close()
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def appends(self):
+        return [command for command in self.account.commands if command.startswith('APPEND')]
+
+    def stored(self, uid):
+        return self.account.folders['INBOX'].messages[uid]
+
+    def test_append(self):
+        uids = self.inbox.append([message(2), message(3)], flags=['\\Seen'])
+        self.assertEqual(['2', '3'], uids)
+        self.assertEqual(message(3), self.stored(3).raw)
+        self.assertEqual(['\\Seen'], self.stored(2).flags)
+        self.assertEqual(2, len(self.appends()))
+
+    def test_each_message_its_own(self):
+        uids = self.inbox.append([AppendMessage(message(2), flags=['\\Flagged'], labels=['Receipts']), message(3)],
+                                 labels=['Imported'])
+        self.assertEqual(['\\Flagged'], self.stored(int(uids[0])).flags)
+        self.assertEqual(['Receipts'], self.stored(2).labels)
+        self.assertEqual(['Imported'], self.stored(3).labels)
+
+    def test_draft(self):
+        draft = self.gmail.draft(['bob@example.com'], 'Drafted', plain='Hello')
+        uid, = self.inbox.append([draft])
+        self.assertIn(b'Subject: Drafted', self.stored(int(uid)).raw)
+
+    def test_batches_on_pooled_connections(self):
+        uids = self.inbox.append([message(number) for number in range(2, 12)], batch_size=3, concurrency=2)
+        # the batches run at once, so their UIDs interleave
+        self.assertEqual(list(range(2, 12)), sorted(int(uid) for uid in uids))
+        self.assertEqual([message(number) for number in range(2, 12)], [self.stored(int(uid)).raw for uid in uids])
+
+    def test_refused(self):
+        del self.account.folders['[Gmail]/All Mail']
+        self.assertRaises(GmailException, self.gmail.all_mail().append, [message(2)])
+
+    def test_synchronizing_literals(self):
+        self.inbox.append([message(2)])
+        self.assertEqual([(message(2), True)], self.account.literals)
+
+
+class MultiAppendTest(AppendTest):
+
+    capabilities = CAPABILITIES + ('MULTIAPPEND', 'LITERAL+')
+
+    def test_append(self):
+        uids = self.inbox.append([message(2), message(3)], flags=['\\Seen'])
+        self.assertEqual(['2', '3'], uids)
+        self.assertEqual(['\\Seen'], self.stored(3).flags)
+        self.assertEqual(1, len(self.appends()))
+
+    def test_synchronizing_literals(self):
+        self.inbox.append([message(2), message(3)])
+        self.assertEqual([(message(2), False), (message(3), False)], self.account.literals)
+
+
+class LiteralMinusTest(AppendTest):
+
+    capabilities = CAPABILITIES + ('LITERAL-',)
+
+    def test_synchronizing_literals(self):
+        large = message(3) + b'x' * 5000
+        self.inbox.append([message(2), large])
+        self.assertEqual([(message(2), False), (large, True)], self.account.literals)
+
+
+class WithoutUIDPlusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.account = Account(('IMAP4rev1', 'X-GM-EXT-1'))
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server)
+        self.gmail.login('user', 'password')
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def test_uids_unknown(self):
+        self.assertEqual([None, None], self.gmail.inbox().append([message(1), message(2)], labels=['Imported']))
+        self.assertEqual(2, len(self.account.folders['INBOX'].messages))
+        self.assertFalse([command for command in self.account.commands if command.startswith('UID STORE')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import shutil
+import tempfile
+import unittest
+
+from gmail.cache import MessageCache
+
+from .imapserver import Account, StandInGmail, StandInServer, message
+
+
+class MessageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.account = Account()
+        for number in range(1, 4):
+            self.account.add(message(number), labels=['\\Inbox'])
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server, cache=MessageCache(self.path))
+        self.gmail.login('user', 'password')
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+        shutil.rmtree(self.path)
+
+    def fetch_again(self):
+        inbox = self.gmail.inbox()
+        inbox.messages.clear()
+        del self.account.commands[:]
+        return inbox.mail(prefetch=True)
+
+    def test_bodies_from_cache(self):
+        self.gmail.inbox().mail(prefetch=True)
+        emails = self.fetch_again()
+        self.assertEqual(['Message 1', 'Message 2', 'Message 3'], [email.subject for email in emails])
+        self.assertFalse([command for command in self.account.commands if 'BODY' in command])
+
+    def test_flags_and_labels_from_server(self):
+        self.gmail.inbox().mail(prefetch=True)
+        self.account.set_flags(2, ['\\Seen', '\\Flagged'])
+        self.account.folders['INBOX'].messages[3].labels = ['\\Inbox', 'Receipts']
+
+        emails = self.fetch_again()
+        self.assertTrue(emails[1].is_read())
+        self.assertTrue(emails[1].is_starred())
+        self.assertEqual(['\\Inbox', 'Receipts'], emails[2].labels)
+        self.assertFalse(emails[0].is_read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import socket
+import threading
+import unittest
+import zlib
+
+from gmail.compress import DeflateSocket
+
+from .imapserver import CAPABILITIES, Account, StandInGmail, StandInServer, message
+
+
+class DeflateSocketTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client, self.server = socket.socketpair()
+        self.sock = DeflateSocket(self.client)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+
+    def send_compressed(self, *chunks):
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        for chunk in chunks:
+            self.server.sendall(compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    def test_lines_and_literals(self):
+        self.send_compressed(b'* 1 FETCH (BODY[] {5}\r\nhel', b'lo)\r\na1 OK done\r\n')
+        self.assertEqual(b'* 1 FETCH (BODY[] {5}\r\n', self.sock.readline())
+        self.assertEqual(b'hello', self.sock.read(5))
+        self.assertEqual(b')\r\n', self.sock.readline())
+        self.assertEqual(b'a1 OK done\r\n', self.sock.readline())
+
+    def test_writes(self):
+        self.sock.sendall(b'a1 NOOP\r\n')
+        self.assertEqual(b'a1 NOOP\r\n', zlib.decompressobj(-15).decompress(self.server.recv(1024)))
+        self.assertEqual(9, self.sock.stats.sent)
+
+    def test_closed(self):
+        self.send_compressed(b'* BYE')
+        self.server.close()
+        self.assertEqual(b'* BYE', self.sock.readline())
+        self.assertEqual(b'', self.sock.readline())
+
+
+class CompressedSessionTest(unittest.TestCase):
+
+    capabilities = CAPABILITIES + ('COMPRESS=DEFLATE',)
+
+    def setUp(self):
+        self.account = Account(self.capabilities)
+        for number in range(1, 21):
+            self.account.add(message(number))
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server, compress=True)
+        self.gmail.login('user', 'password')
+
+    def tearDown(self):
+        if self.gmail.pool:
+            self.gmail.pool.close()
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def test_fetch(self):
+        emails = self.gmail.inbox().mail(prefetch=True)
+        self.assertEqual('Body of message 20\r\n', emails[-1].body)
+        self.assertIsInstance(self.gmail.imap.sock, DeflateSocket)
+        self.assertGreater(self.gmail.compression.ratio(), 1)
+
+    def test_pooled_connections(self):
+        self.gmail.inbox().mail(prefetch=True, batch_size=5, concurrency=2)
+        self.assertEqual(3, self.account.commands.count('COMPRESS DEFLATE'))
+
+    def test_idle(self):
+        arrived = threading.Event()
+        watcher = self.gmail.inbox().watch(lambda email: arrived.set())
+        try:
+            self.account.incoming.append(message(21))
+            self.assertTrue(arrived.wait(5))
+        finally:
+            watcher.stop()
+            watcher.thread.join(10)
+        self.assertIsInstance(watcher.imap.sock, DeflateSocket)
+
+
+class UncompressedSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.account = Account()
+        self.account.add(message(1))
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server, compress=True)
+        self.gmail.login('user', 'password')
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def test_not_offered(self):
+        self.assertEqual(['Message 1'], [email.subject for email in self.gmail.inbox().mail(prefetch=True)])
+        self.assertNotIn('COMPRESS DEFLATE', self.account.commands)
+        self.assertIsNone(self.gmail.compression.ratio())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import base64
+import io
+import unittest
+
+from gmail.draft import Attachment, Draft, encodebytes
+
+
+class ShortReads(io.BytesIO):
+    """A file that never returns more than a few bytes at a time, like a pipe or a socket."""
+
+    def read(self, size=-1):
+        return io.BytesIO.read(self, min(size, 10) if size > 0 else size)
+
+
+class AttachmentTest(unittest.TestCase):
+
+    data = bytes(bytearray(range(256))) * 40
+
+    def test_short_reads(self):
+        attachment = Attachment(ShortReads(self.data), 'data.bin')
+        encoded = b''.join(attachment.chunks(57 * 3))
+        self.assertEqual(encodebytes(self.data).replace(b'\n', b'\r\n'), encoded)
+        self.assertEqual(self.data, base64.b64decode(encoded))
+        self.assertEqual(len(encoded), attachment.size())
+
+    def test_draft_size(self):
+        draft = Draft(None, 'alice@example.com', ['bob@example.com'], 'Data', plain='Attached',
+                      attachments=[Attachment(ShortReads(self.data), 'data.bin')])
+        self.assertEqual(len(draft.as_bytes()), draft.size())
+
+    def test_chunk_size_too_small(self):
+        attachment = Attachment(io.BytesIO(self.data), 'data.bin')
+        self.assertRaises(ValueError, list, attachment.chunks(56))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import json
+import mailbox
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from gmail.exceptions import GmailException
+from gmail.export import ArchiveWriter, ExportCheckpoint, MaildirWriter, MboxWriter
+
+from .imapserver import Account, StandInGmail, StandInServer, message
+
+
+class MaildirExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.account = Account()
+        for number in range(1, 4):
+            self.account.add(message(number), flags=['\\Seen'] if number == 2 else [])
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server)
+        self.gmail.login('user', 'password')
+        self.inbox = self.gmail.inbox()
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+        shutil.rmtree(self.path)
+
+    def files(self):
+        return sorted(os.listdir(os.path.join(self.path, 'maildir', 'cur')))
+
+    def test_files(self):
+        self.assertEqual(3, self.inbox.export(MaildirWriter(os.path.join(self.path, 'maildir'))))
+        self.assertEqual(['1.1.gmail:2,', '1.2.gmail:2,S', '1.3.gmail:2,'], self.files())
+
+    def test_uidvalidity_change(self):
+        checkpoint = ExportCheckpoint(os.path.join(self.path, 'checkpoint.json'))
+        self.inbox.export(MaildirWriter(os.path.join(self.path, 'maildir')), checkpoint)
+        self.account.renumber()
+
+        self.assertEqual(3, self.inbox.export(MaildirWriter(os.path.join(self.path, 'maildir')), checkpoint))
+        self.assertEqual(['2.4.gmail:2,', '2.5.gmail:2,S', '2.6.gmail:2,'], self.files())
+
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.account = Account()
+        for number in range(1, 26):
+            self.account.add(message(number), labels=['\\Inbox'])
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server)
+        self.gmail.login('user', 'password')
+        self.inbox = self.gmail.inbox()
+        self.checkpoint = ExportCheckpoint(os.path.join(self.path, 'checkpoint.json'))
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+        shutil.rmtree(self.path)
+
+    def mbox(self):
+        return os.path.join(self.path, 'inbox.mbox')
+
+    def subjects(self):
+        return [entry['Subject'] for entry in mailbox.mbox(self.mbox(), create=False)]
+
+    # the fetch of the given batch of messages fails
+    def fail_fetch(self, batch):
+        uid = self.gmail.imap.uid
+        fetches = []
+
+        def failing(command, *args):
+            if command == 'FETCH' and 'BODY.PEEK[]' in args[-1]:
+                fetches.append(args)
+                if len(fetches) == batch:
+                    return 'NO', [b'failed']
+            return uid(command, *args)
+        self.gmail.imap.uid = failing
+
+    def test_mbox(self):
+        self.account.add(b'Subject: Quoting\r\n\r\nFrom the start\r\n>From quoted\r\n')
+        self.assertEqual(26, self.inbox.export(MboxWriter(self.mbox()), batch_size=10))
+        entries = list(mailbox.mbox(self.mbox(), create=False))
+        self.assertEqual(['Message %d' % number for number in range(1, 26)] + ['Quoting'], [entry['Subject'] for entry in entries])
+        self.assertEqual('>From the start\n>>From quoted\n', entries[-1].get_payload())
+
+        with open(self.mbox() + '.jsonl') as f:
+            info = [json.loads(line) for line in f]
+        self.assertEqual(list(range(1, 27)), [line['uid'] for line in info])
+        self.assertEqual(['\\Inbox'], info[0]['labels'])
+
+    def test_resumed(self):
+        self.fail_fetch(2)
+        self.assertRaises(GmailException, self.inbox.export, MboxWriter(self.mbox()), self.checkpoint, batch_size=10)
+        self.assertEqual(10, self.checkpoint.load('INBOX')['last_uid'])
+        del self.gmail.imap.uid
+
+        self.assertEqual(15, self.inbox.export(MboxWriter(self.mbox()), self.checkpoint, batch_size=10))
+        self.assertEqual(['Message %d' % number for number in range(1, 26)], self.subjects())
+
+    def test_new_messages_only(self):
+        self.inbox.export(MboxWriter(self.mbox()), self.checkpoint)
+        self.account.add(message(26))
+        self.assertEqual(1, self.inbox.export(MboxWriter(self.mbox()), self.checkpoint))
+        self.assertEqual(26, len(self.subjects()))
+        self.assertEqual(0, self.inbox.export(MboxWriter(self.mbox()), self.checkpoint))
+
+    def test_search_spans(self):
+        self.gmail.EXPORT_SEARCH_SPAN = 10
+        self.assertEqual(25, self.inbox.export(MboxWriter(self.mbox()), batch_size=4))
+        self.assertEqual(3, len([command for command in self.account.commands if command.startswith('UID SEARCH')]))
+
+    def test_search_arguments(self):
+        self.account.set_flags(3, ['\\Seen'])
+        self.assertEqual(1, self.inbox.export(MboxWriter(self.mbox()), read=True))
+        self.assertEqual(['Message 3'], self.subjects())
+
+    def test_archives(self):
+        directory = os.path.join(self.path, 'archives')
+        self.assertEqual(25, self.inbox.export(ArchiveWriter(directory), batch_size=10))
+        self.assertEqual(['1.1-10.tar.gz', '1.11-20.tar.gz', '1.21-25.tar.gz'], sorted(os.listdir(directory)))
+
+        archive = tarfile.open(os.path.join(directory, '1.21-25.tar.gz'))
+        self.assertEqual(message(21), archive.extractfile('21.eml').read())
+        info = [json.loads(line) for line in archive.extractfile('metadata.jsonl').read().decode().splitlines()]
+        self.assertEqual([21, 22, 23, 24, 25], [line['uid'] for line in info])
+
+    def test_archive_of_a_failed_batch_dropped(self):
+        directory = os.path.join(self.path, 'archives')
+        self.fail_fetch(2)
+        self.assertRaises(GmailException, self.inbox.export, ArchiveWriter(directory), self.checkpoint, batch_size=10)
+        self.assertEqual(['1.1-10.tar.gz'], os.listdir(directory))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import gc
+import unittest
+import weakref
+
+from gmail.parallel import BatchRunner
+
+from .imapserver import Account, StandInGmail, StandInServer, message
+
+
+class FetchBatchesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.account = Account()
+        for number in range(1, 51):
+            self.account.add(message(number))
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server)
+        self.gmail.login('user', 'password')
+        self.inbox = self.gmail.inbox()
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def test_batches_in_uid_order(self):
+        batches = list(self.inbox.fetch_batches(batch_size=20))
+        self.assertEqual([20, 20, 10], [len(batch) for batch in batches])
+        self.assertEqual('Message 21', batches[1][0].subject)
+
+    def test_earlier_batches_are_freed(self):
+        seen = []
+        for batch in self.inbox.fetch_batches(batch_size=10):
+            seen.extend(weakref.ref(email) for email in batch)
+            del batch
+            gc.collect()
+            self.assertLessEqual(sum(1 for ref in seen if ref() is not None), 10)
+        self.assertEqual(50, len(seen))
+        self.assertEqual(0, len(self.inbox.messages))
+
+
+class IterMailTest(unittest.TestCase):
+
+    def setUp(self):
+        self.account = Account()
+        for number in range(1, 26):
+            self.account.add(message(number))
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server)
+        self.gmail.login('user', 'password')
+        self.inbox = self.gmail.inbox()
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def fetches(self):
+        return [command for command in self.account.commands if command.startswith('UID FETCH')]
+
+    def test_fetched_a_batch_at_a_time(self):
+        emails = self.inbox.iter_mail(prefetch=True, batch_size=10)
+        self.assertEqual('Message 1', next(emails).subject)
+        self.assertEqual(1, len(self.fetches()))
+
+        subjects = [email.subject for email in emails]
+        self.assertEqual(['Message %d' % number for number in range(2, 26)], subjects)
+        self.assertEqual(3, len(self.fetches()))
+
+    def test_not_cached(self):
+        self.assertEqual(25, len(list(self.inbox.iter_mail(prefetch=True))))
+        self.assertEqual(0, len(self.inbox.messages))
+
+    def test_cached(self):
+        list(self.inbox.iter_mail(batch_size=10, cache=True))
+        self.assertEqual(25, len(self.inbox.messages))
+        self.assertFalse(self.fetches())
+
+
+class ParallelFetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.account = Account()
+        for number in range(1, 51):
+            self.account.add(message(number))
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server)
+        self.gmail.login('user', 'password')
+        self.inbox = self.gmail.inbox()
+
+    def tearDown(self):
+        if self.gmail.pool:
+            self.gmail.pool.close()
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def test_prefetch_on_pooled_connections(self):
+        emails = self.inbox.mail(prefetch=True, batch_size=10, concurrency=3)
+        self.assertEqual(['Message %d' % number for number in range(1, 51)], [email.subject for email in emails])
+        self.assertTrue(1 < self.gmail.pool.created <= 3)
+
+    def test_batches_in_uid_order(self):
+        batches = list(self.inbox.fetch_batches(batch_size=10, concurrency=3))
+        self.assertEqual(['1', '11', '21', '31', '41'], [batch[0].uid for batch in batches])
+
+    def test_batches_as_they_are_ready(self):
+        batches = list(self.inbox.fetch_batches(batch_size=10, concurrency=3, ordered=False))
+        self.assertEqual(50, sum(len(batch) for batch in batches))
+        self.assertEqual(set(['1', '11', '21', '31', '41']), set(batch[0].uid for batch in batches))
+
+    def test_pending_batches_bounded(self):
+        pulled = []
+
+        def batches():
+            for number in range(10):
+                pulled.append(number)
+                yield number
+
+        results = BatchRunner(self.gmail, concurrency=1, max_pending=2).map(lambda batch: batch * 2, batches())
+        self.assertEqual(0, next(results))
+        self.assertEqual(3, len(pulled))
+        self.assertEqual(list(range(2, 20, 2)), list(results))
@@ -0,0 +1,80 @@
+import threading
+import unittest
+
+from .imapserver import Account, StandInGmail, StandInServer, message
+
+
+class WatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.account = Account()
+        for number in range(1, 4):
+            self.account.add(message(number))
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server)
+        self.gmail.login('user', 'password')
+        self.inbox = self.gmail.inbox()
+        self.received = []
+        self.arrived = threading.Event()
+        self.watcher = None
+
+    def tearDown(self):
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher.thread.join(10)
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def callback(self, email):
+        self.received.append(email.subject)
+        self.arrived.set()
+
+    def test_exists_buffered_before_idle(self):
+        # the EXISTS comes in the packet that completes the watcher's SELECT, so imaplib has it before IDLE starts
+        self.account.incoming.append(message(4))
+        self.watcher = self.inbox.watch(self.callback)
+        self.assertTrue(self.arrived.wait(5))
+        self.assertEqual(['Message 4'], self.received)
+
+    def test_watch_returns_while_watching(self):
+        self.watcher = self.inbox.watch(self.callback)
+        self.account.incoming.append(message(4))
+        self.assertTrue(self.arrived.wait(5))
+        self.watcher.stop()
+        self.watcher.thread.join(10)
+        self.assertFalse(self.watcher.thread.is_alive())
+        self.assertEqual(['Message 4'], self.received)
+
+    def test_own_connection(self):
+        self.watcher = self.inbox.watch(self.callback)
+        self.account.incoming.append(message(4))
+        self.assertTrue(self.arrived.wait(5))
+        # the session's connection is free for other commands while the watcher idles
+        self.assertEqual(['1', '2', '3', '4'], self.inbox.search())
+        self.assertIsNot(self.gmail.imap, self.watcher.imap)
+
+    def test_changes_by_sequence_number(self):
+        emails = self.inbox.mail()
+        events = []
+        expunged = threading.Event()
+
+        def on_event(event):
+            events.append(event)
+            if event.type == 'EXPUNGE':
+                expunged.set()
+
+        self.watcher = self.inbox.watch(self.callback, on_event=on_event)
+        self.account.incoming.append(message(4))
+        self.assertTrue(self.arrived.wait(5))
+
+        # the server tells which messages changed by sequence number only
+        self.account.incoming.extend([('FLAGS', 2, ['\\Seen']), ('EXPUNGE', 1)])
+        self.assertTrue(expunged.wait(5))
+        self.assertEqual([('FETCH', '2'), ('EXPUNGE', '1')], [(event.type, event.uid) for event in events if event.type != 'EXISTS'])
+        self.assertTrue(emails[1].is_read())
+        self.assertNotIn('1', self.inbox.messages)
+        self.assertIn('4', self.inbox.messages)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+from gmail.index import LocalIndex
+
+from .imapserver import Account, StandInGmail, StandInServer, message
+
+
+class LocalIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.account = Account()
+        for number in range(1, 4):
+            self.account.add(message(number, 'Invoice %d' % number if number == 2 else None))
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server, index=LocalIndex())
+        self.gmail.login('user', 'password')
+        self.inbox = self.gmail.inbox()
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def test_envelope_indexed(self):
+        self.inbox.mail(prefetch=True, profile='envelope')
+        self.assertEqual(['2'], [email.uid for email in self.inbox.local_mail(subject='Invoice')])
+        self.assertEqual(3, len(self.inbox.local_mail(sender='alice@example.com')))
+
+    def test_full_message_indexed(self):
+        self.inbox.mail(prefetch=True)
+        self.assertEqual(['2'], [email.uid for email in self.inbox.local_mail(subject='Invoice')])
+        self.assertEqual(['3'], [email.uid for email in self.inbox.local_mail(body='message 3')])
+
+    def test_matches_fetched_again(self):
+        self.inbox.mail(prefetch=True)
+        self.inbox.messages.clear()
+        emails = self.inbox.local_mail(body='message 3')
+        self.assertEqual(['Message 3'], [email.subject for email in emails])
+        self.assertTrue(emails[0].is_fetched('envelope'))
+        # the envelope does not take the body out of the index
+        self.assertEqual(['3'], [email.uid for email in self.inbox.local_mail(body='message 3')])
+
+    def test_local_search_fetches_again(self):
+        self.inbox.mail(prefetch=True)
+        self.inbox.messages.clear()
+        emails = self.gmail.local_search(subject='Invoice', profile='headers')
+        self.assertEqual(['Invoice 2'], [email.subject for email in emails])
+        self.assertTrue(emails[0].is_fetched('headers'))
+
+    def test_one_transaction_per_fetch(self):
+        emails = self.inbox.mail()
+        statements = []
+        self.gmail.index.db.set_trace_callback(statements.append)
+        self.gmail.fetch_messages(dict((email.uid, email) for email in emails))
+        self.assertEqual(1, len([statement for statement in statements if statement.upper().startswith('BEGIN')]))
+
+
+if __name__ == '__main__':
+    unittest.main()
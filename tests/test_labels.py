@@ -0,0 +1,126 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from gmail.labels import MailboxListCache
+
+from .imapserver import CAPABILITIES, Account, Folder, StandInGmail, StandInServer, message
+
+
+class LabelTreeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.account = Account()
+        for name in ('Work', 'Work/Clients', 'Personal/Travel'):
+            self.account.folders[name] = Folder()
+        self.account.unselectable['[Gmail]'] = '\\Noselect \\HasChildren'
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server)
+        self.gmail.login('user', 'password')
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def test_tree(self):
+        tree = self.gmail.label_tree()
+        self.assertEqual(['INBOX', 'Personal', 'Work', '[Gmail]'], sorted(node.name for node in tree.children))
+        work = tree.find('Work')
+        self.assertIs(self.gmail.mailboxes['Work'], work.mailbox)
+        self.assertEqual(['Work/Clients'], [node.path for node in work.children])
+
+    def test_parents_without_mailboxes(self):
+        tree = self.gmail.label_tree()
+        # Personal is only there as the path of Personal/Travel
+        self.assertIsNone(tree.find('Personal').mailbox)
+        self.assertIsNotNone(tree.find('Personal/Travel').mailbox)
+        gmail = tree.find('[Gmail]')
+        self.assertIsNone(gmail.mailbox)
+        self.assertIn('Noselect', gmail.attributes)
+        self.assertEqual(['[Gmail]/All Mail', '[Gmail]/Trash'], [node.path for node in gmail.children])
+        self.assertNotIn('[Gmail]', self.gmail.mailboxes)
+
+
+class StatusTest(unittest.TestCase):
+
+    capabilities = CAPABILITIES + ('LIST-STATUS',)
+
+    def setUp(self):
+        self.account = Account(self.capabilities)
+        for number in range(1, 4):
+            self.account.add(message(number), flags=['\\Seen'] if number == 1 else [])
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server)
+        self.gmail.login('user', 'password')
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def test_status_with_the_list(self):
+        self.assertEqual({'messages': 3, 'unseen': 2, 'uidnext': 4}, self.gmail.inbox().status())
+        self.assertEqual({'messages': 0, 'unseen': 0, 'uidnext': 1}, self.gmail.mailboxes['[Gmail]/Trash'].status())
+        self.assertFalse([command for command in self.account.commands if command.startswith('STATUS')])
+
+    def test_refresh(self):
+        self.account.add(message(4))
+        self.assertEqual({'messages': 4, 'unseen': 3, 'uidnext': 5}, self.gmail.inbox().status(refresh=True))
+
+
+class PlainStatusTest(StatusTest):
+
+    capabilities = CAPABILITIES
+
+    def test_status_with_the_list(self):
+        self.assertEqual({'messages': 3, 'unseen': 2, 'uidnext': 4}, self.gmail.inbox().status())
+        self.assertEqual(['STATUS "INBOX" (MESSAGES UNSEEN UIDNEXT)'],
+                         [command for command in self.account.commands if command.startswith('STATUS')])
+
+
+class MailboxListCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = MailboxListCache(os.path.join(self.path, 'mailboxes.json'))
+        self.account = Account()
+        self.server = StandInServer(self.account).start()
+        self.sessions = []
+
+    def tearDown(self):
+        for gmail in self.sessions:
+            gmail.imap.logout()
+        self.server.stop()
+        shutil.rmtree(self.path)
+
+    def login(self):
+        gmail = StandInGmail(self.server, mailbox_cache=self.cache)
+        gmail.login('user', 'password')
+        self.sessions.append(gmail)
+        return gmail
+
+    def lists(self):
+        return [command for command in self.account.commands if command.startswith('LIST')]
+
+    def test_list_reused(self):
+        self.login()
+        gmail = self.login()
+        self.assertEqual(1, len(self.lists()))
+        self.assertIn('INBOX', gmail.mailboxes)
+
+    def test_listed_again_for_a_new_mailbox(self):
+        self.login()
+        self.account.folders['Receipts'] = Folder()
+        gmail = self.login()
+        self.assertIsNotNone(gmail.mailbox('Receipts'))
+        self.assertEqual(2, len(self.lists()))
+
+    def test_expired(self):
+        self.cache.max_age = -1
+        self.login()
+        self.login()
+        self.assertEqual(2, len(self.lists()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+
+from gmail.message import Message
+
+
+class ParseSectionTest(unittest.TestCase):
+
+    def load(self, content, charset='utf-8', encoding='7bit'):
+        email = Message(None, '1')
+        email.load({'BODYSTRUCTURE': ['text', 'plain', ['charset', charset], None, None, encoding, 5, 1],
+                    'BODY[1]': content})
+        return email
+
+    def test_quoted_section(self):
+        # a short section may come as a quoted string rather than a literal
+        self.assertEqual(u'Caf\xe9', self.load(u'Caf\xe9').body)
+
+    def test_literal_section(self):
+        self.assertEqual(u'Caf\xe9', self.load(u'Caf\xe9'.encode('utf-8')).body)
+
+    def test_base64_section(self):
+        self.assertEqual(u'Caf\xe9', self.load(b'Q2Fmw6k=', encoding='base64').body)
+
+    def test_unknown_charset(self):
+        self.assertEqual(u'Caf\xe9', self.load(u'Caf\xe9'.encode('latin-1'), charset='x-unknown').body)
+
+    def test_undecodable_section(self):
+        self.assertEqual(u'Caf\ufffd', self.load(b'Caf\xe9').body)
+
+
+if __name__ == '__main__':
+    unittest.main()
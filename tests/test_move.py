@@ -0,0 +1,71 @@
+import unittest
+
+from gmail import GmailException
+
+from .imapserver import CAPABILITIES, Account, StandInGmail, StandInServer, message
+
+
+class NoUidExpungeTest(unittest.TestCase):
+    """A server with neither MOVE nor UIDPLUS, where only a plain EXPUNGE could remove the moved messages."""
+
+    def setUp(self):
+        self.account = Account(('IMAP4rev1', 'X-GM-EXT-1'))
+        for number in range(1, 4):
+            self.account.add(message(number))
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server)
+        self.gmail.login('user', 'password')
+        del self.account.commands[:]
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def assert_nothing_removed(self):
+        self.assertFalse([command for command in self.account.commands if 'EXPUNGE' in command or 'STORE' in command])
+        self.assertEqual(3, len(self.account.folders['INBOX'].messages))
+
+    def test_move_refused(self):
+        self.assertRaises(GmailException, self.gmail.inbox().move, ['1', '2'], '[Gmail]/All Mail')
+        self.assert_nothing_removed()
+
+    def test_delete_from_trash_refused(self):
+        self.gmail.special_mailboxes['Trash'] = 'INBOX'
+        self.assertRaises(GmailException, self.gmail.inbox().trash, ['1'])
+        self.assert_nothing_removed()
+
+
+
+class WholeMailboxTest(unittest.TestCase):
+    """Bulk changes without messages or search arguments, which would change every message in the mailbox."""
+
+    def setUp(self):
+        self.account = Account(CAPABILITIES)
+        for number in range(1, 4):
+            self.account.add(message(number))
+            self.account.add(message(number), mailbox='[Gmail]/Trash')
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server)
+        self.gmail.login('user', 'password')
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def test_refused(self):
+        trash = self.gmail.mailbox('[Gmail]/Trash')
+        self.assertRaises(GmailException, trash.trash)
+        self.assertRaises(GmailException, self.gmail.inbox().move, to_mailbox='[Gmail]/All Mail')
+        self.assertRaises(GmailException, self.gmail.inbox().read)
+        self.assertRaises(GmailException, self.gmail.inbox().archive)
+        self.assertEqual(3, len(self.account.folders['[Gmail]/Trash'].messages))
+        self.assertEqual(3, len(self.account.folders['INBOX'].messages))
+
+    def test_search_arguments(self):
+        trash = self.gmail.mailbox('[Gmail]/Trash')
+        self.assertEqual(['2'], trash.trash(gmail_query='Message 2'))
+        self.assertEqual([1, 3], list(self.account.folders['[Gmail]/Trash'].messages))
+
+
+if __name__ == '__main__':
+    unittest.main()
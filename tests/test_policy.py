@@ -0,0 +1,90 @@
+import time
+import unittest
+
+from gmail.policy import CachePolicy
+
+from .imapserver import Account, StandInGmail, StandInServer, message
+
+
+class CachePolicyTest(unittest.TestCase):
+
+    def test_max_messages(self):
+        policy = CachePolicy(max_messages=2)
+        self.assertEqual([], policy.added('1', 10))
+        self.assertEqual([], policy.added('2', 10))
+        policy.accessed('1')  # now the most recently used
+        self.assertEqual(['2'], policy.added('3', 10))
+        self.assertEqual(['1', '3'], list(policy.entries))
+
+    def test_max_bytes(self):
+        policy = CachePolicy(max_bytes=100)
+        policy.added('1', 40)
+        policy.added('2', 40)
+        self.assertEqual(['1', '2'], policy.added('3', 90))
+        self.assertEqual(90, policy.stats()['bytes'])
+
+    def test_added_again(self):
+        # a message charged again counts for its new size only
+        policy = CachePolicy(max_bytes=100)
+        policy.added('1', 0)
+        policy.added('1', 60)
+        self.assertEqual({'messages': 1, 'bytes': 60, 'hits': 0, 'misses': 0, 'evictions': 0}, policy.stats())
+
+    def test_ttl(self):
+        policy = CachePolicy(ttl=0.05)
+        policy.added('1', 10)
+        self.assertTrue(policy.accessed('1'))
+        time.sleep(0.1)
+        self.assertFalse(policy.accessed('1'))
+        self.assertEqual({'messages': 0, 'bytes': 0, 'hits': 1, 'misses': 1, 'evictions': 1}, policy.stats())
+
+    def test_expired_evicted_when_adding(self):
+        policy = CachePolicy(ttl=0.05)
+        policy.added('1', 10)
+        time.sleep(0.1)
+        self.assertEqual(['1'], policy.added('2', 10))
+
+    def test_stats(self):
+        policy = CachePolicy(max_messages=1)
+        policy.added('1', 10)
+        policy.accessed('1')
+        policy.accessed('2')  # not tracked
+        policy.missed('3')
+        policy.added('2', 20)
+        policy.removed('2')
+        self.assertEqual({'messages': 0, 'bytes': 0, 'hits': 1, 'misses': 2, 'evictions': 1}, policy.stats())
+
+
+class MailboxPolicyTest(unittest.TestCase):
+    """A policy with room for two of the stand-in's messages, which are all the same size."""
+
+    def setUp(self):
+        self.account = Account()
+        for number in range(1, 4):
+            self.account.add(message(number))
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server, cache_policy=lambda: CachePolicy(max_bytes=2 * len(message(1))))
+        self.gmail.login('user', 'password')
+        self.inbox = self.gmail.inbox()
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def test_charged_when_loaded(self):
+        emails = self.inbox.mail()
+        policy = self.inbox.messages.policy
+        self.assertEqual(0, policy.stats()['bytes'])
+
+        emails[0].fetch()
+        self.assertEqual(len(message(1)), policy.stats()['bytes'])
+
+    def test_evicted_when_loaded(self):
+        for email in self.inbox.mail():
+            email.fetch()
+        self.assertEqual(['2', '3'], sorted(self.inbox.messages))
+        self.assertEqual(1, self.inbox.messages.policy.stats()['evictions'])
+
+
+if __name__ == '__main__':
+    unittest.main()
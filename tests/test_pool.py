@@ -0,0 +1,91 @@
+import threading
+import unittest
+
+from gmail.exceptions import ConnectionError, Timeout
+
+from .imapserver import Account, StandInGmail, StandInServer, message
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.account = Account()
+        for number in range(1, 4):
+            self.account.add(message(number))
+        self.account.add(message(4), mailbox='[Gmail]/All Mail')
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server)
+        self.gmail.login('user', 'password')
+        self.pool = self.gmail.start_pool(2, timeout=0.2)
+
+    def tearDown(self):
+        self.pool.close()
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def selects(self):
+        return [command for command in self.account.commands if command.startswith('SELECT')]
+
+    def test_connection_keeps_its_mailbox(self):
+        with self.pool.connection('INBOX') as imap:
+            first = imap
+        del self.account.commands[:]
+        with self.pool.connection('INBOX') as imap:
+            self.assertIs(first, imap)
+        self.assertEqual([], self.selects())
+
+    def test_prefers_the_selected_mailbox(self):
+        with self.pool.connection('INBOX') as inbox:
+            with self.pool.connection('[Gmail]/All Mail') as all_mail:
+                self.assertIsNot(inbox, all_mail)
+        with self.pool.connection('[Gmail]/All Mail') as imap:
+            self.assertIs(all_mail, imap)
+        self.assertEqual(2, self.pool.created)
+
+    def test_nested_checkout_on_a_thread(self):
+        with self.pool.connection('INBOX') as outer:
+            with self.pool.connection('INBOX') as inner:
+                self.assertIs(outer, inner)
+            with self.pool.connection() as any_mailbox:
+                self.assertIs(outer, any_mailbox)
+        self.assertEqual(1, self.pool.created)
+
+    def test_waits_for_a_connection(self):
+        held = [threading.Event(), threading.Event()]
+        release = threading.Event()
+
+        def hold(event):
+            with self.pool.connection('INBOX'):
+                event.set()
+                release.wait(5)
+
+        threads = [threading.Thread(target=hold, args=(event,)) for event in held]
+        for thread in threads:
+            thread.start()
+        for event in held:
+            self.assertTrue(event.wait(5))
+        self.assertRaises(Timeout, self.pool.checkout, 'INBOX')
+
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(['1', '2', '3'], self.gmail.inbox().search())
+        self.assertEqual(2, self.pool.created)
+
+    def test_dropped_connection_discarded(self):
+        with self.assertRaises(IOError):
+            with self.pool.connection('INBOX'):
+                raise IOError('connection reset')
+        self.assertEqual(0, self.pool.created)
+        self.assertEqual([], self.pool.available)
+
+    def test_closed(self):
+        with self.pool.connection('INBOX'):
+            pass
+        self.pool.close()
+        self.assertEqual(0, self.pool.created)
+        self.assertRaises(ConnectionError, self.pool.checkout)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import datetime
+import gc
+import unittest
+
+from gmail.records import MessageRecord
+
+from .imapserver import Account, StandInGmail, StandInServer, message
+
+
+class MessageRecordTest(unittest.TestCase):
+
+    def test_flags(self):
+        record = MessageRecord('7', flags=['\\Seen', 'Important', '\\Flagged'])
+        self.assertEqual(['\\Seen', '\\Flagged', 'Important'], record.flags)
+        self.assertTrue(record.is_read())
+        self.assertTrue(record.is_starred())
+        self.assertTrue(record.has_flag('Important'))
+        self.assertFalse(record.has_flag('\\Deleted'))
+
+    def test_shared_values(self):
+        first = MessageRecord('1', labels=['\\Inbox', 'Receipts'], to=['bob@example.com'])
+        second = MessageRecord('2', labels=['\\Inbox', 'Receipts'], to=['bob@example.com'])
+        self.assertIs(first.labels, second.labels)
+        self.assertIs(first.to, second.to)
+
+    def test_sent_at(self):
+        sent_at = datetime.datetime(2018, 1, 1, 10, 1)
+        self.assertEqual(sent_at, MessageRecord('1', sent_at=sent_at).sent_at)
+        self.assertIsNone(MessageRecord('1').sent_at)
+
+
+class CompactMailboxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.account = Account()
+        for number in range(1, 4):
+            self.account.add(message(number), labels=['\\Inbox'])
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server, compact_messages=True)
+        self.gmail.login('user', 'password')
+        self.inbox = self.gmail.inbox()
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def test_records_kept(self):
+        self.inbox.mail(prefetch=True, profile='envelope')
+        gc.collect()
+        self.assertEqual(0, len(self.inbox.messages.live))
+        self.assertTrue(all(isinstance(entry, MessageRecord) for entry in self.inbox.messages.entries.values()))
+
+        del self.account.commands[:]
+        email = self.inbox.messages['2']
+        self.assertEqual('Message 2', email.subject)
+        self.assertEqual(['\\Inbox'], email.labels)
+        self.assertEqual(datetime.datetime(2018, 1, 1, 10, 2), email.sent_at)
+        self.assertEqual([], self.account.commands)
+
+    def test_same_message_while_in_use(self):
+        emails = self.inbox.mail()
+        self.assertIs(emails[0], self.inbox.messages['1'])
+
+    def test_changes_recorded(self):
+        emails = self.inbox.mail(prefetch=True, profile='envelope')
+        emails[1].read()
+        del emails
+        gc.collect()
+        self.assertEqual([False, True, False], [record.is_read() for record in self.inbox.records()])
+
+    def test_bodies_fetched_again(self):
+        self.inbox.mail(prefetch=True)
+        gc.collect()
+        self.assertEqual('Body of message 3\r\n', self.inbox.messages['3'].body)
+
+    def test_set_compact(self):
+        self.inbox.messages.set_compact(False)
+        emails = self.inbox.mail(prefetch=True, profile='envelope')
+        self.inbox.messages.set_compact()
+        self.assertEqual([1, 2, 3], sorted(self.inbox.messages.entries))
+        self.assertIs(emails[0], self.inbox.messages['1'])
+
+
+class DropTreeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.account = Account()
+        self.account.add(message(1))
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server, drop_tree=True)
+        self.gmail.login('user', 'password')
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def test_tree_dropped(self):
+        email, = self.gmail.inbox().mail(prefetch=True)
+        self.assertIsNone(email.raw)
+        self.assertEqual('Message 1', email.subject)
+        self.assertEqual('Body of message 1\r\n', email.body)
+
+
+if __name__ == '__main__':
+    unittest.main()
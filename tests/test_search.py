@@ -0,0 +1,69 @@
+import unittest
+
+from .imapserver import CAPABILITIES, Account, StandInGmail, StandInServer, message
+
+
+class SearchTest(unittest.TestCase):
+
+    capabilities = CAPABILITIES
+
+    def setUp(self):
+        self.account = Account(self.capabilities)
+        for number in range(1, 6):
+            self.account.add(message(number, u'Caf\xe9 %d' % number if number > 3 else None),
+                             flags=['\\Seen'] if number % 2 else [])
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server)
+        self.gmail.login('user', 'password')
+        self.inbox = self.gmail.inbox()
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def searches(self):
+        return [command for command in self.account.commands if command.startswith('UID SEARCH')]
+
+    def test_search(self):
+        self.assertEqual(['1', '2', '3', '4', '5'], self.inbox.search())
+        self.assertEqual(['2', '4'], self.inbox.search(unread=True))
+        self.assertEqual(['4', '5'], self.inbox.search(limit=2))
+
+    def test_gmail_query(self):
+        self.assertEqual(['3'], self.inbox.search(gmail_query='Message 3'))
+        self.assertTrue(self.searches()[-1].endswith('X-GM-RAW "Message 3"'))
+
+    def test_gmail_query_literal(self):
+        self.assertEqual(['4', '5'], self.inbox.search(gmail_query=u'Caf\xe9'))
+        self.assertEqual(u'Caf\xe9'.encode('utf-8'), self.account.literals[-1][0])
+        self.assertIn('CHARSET UTF-8', self.searches()[-1])
+
+    def test_count_and_stats(self):
+        self.assertEqual(3, self.inbox.count(read=True))
+        self.assertEqual({'count': 2, 'min': 2, 'max': 4}, self.inbox.search_stats(unread=True))
+        self.assertEqual({'count': 0, 'min': None, 'max': None}, self.inbox.search_stats(gmail_query='nothing'))
+
+    def test_pages(self):
+        pages = list(self.inbox.pages(page_size=2))
+        self.assertEqual([['5', '4'], ['3', '2'], ['1']], [[email.uid for email in page] for page in pages])
+        self.assertEqual(1, len(self.searches()))
+
+
+class ESearchTest(SearchTest):
+
+    capabilities = CAPABILITIES + ('ESEARCH',)
+
+    def test_results_not_listed(self):
+        self.inbox.count(read=True)
+        self.inbox.search_stats()
+        self.assertEqual(['UID SEARCH RETURN (COUNT) ALL SEEN', 'UID SEARCH RETURN (COUNT MIN MAX) ALL'], self.searches())
+
+    def test_response_of_another_command_dropped(self):
+        # an ESEARCH left unread by an earlier command is not taken for the answer
+        self.inbox.esearch(['COUNT'], ['UNSEEN'])
+        self.gmail.imap.untagged_responses['ESEARCH'] = [b'(TAG "X1") UID COUNT 9']
+        self.assertEqual(3, self.inbox.count(read=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+
+from .imapserver import Account, StandInGmail, StandInServer, message
+
+
+class SelectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.account = Account()
+        for number in range(1, 4):
+            self.account.add(message(number))
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server)
+        self.gmail.login('user', 'password')
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def test_response_codes(self):
+        self.gmail.select(self.gmail.imap, 'INBOX')
+        selection = self.gmail.selections.current(self.gmail.imap)
+        self.assertEqual((3, 1, 4), (selection.exists, selection.uidvalidity, selection.uidnext))
+        self.assertEqual(1, self.gmail.inbox().uidvalidity)
+
+    def test_failed_select(self):
+        response, data = self.gmail.select(self.gmail.imap, 'Missing')
+        self.assertEqual('NO', response)
+        self.assertIsNone(self.gmail.selections.current(self.gmail.imap))
+
+    def selects(self):
+        return [command for command in self.account.commands if command.startswith(('SELECT', 'EXAMINE'))]
+
+    def test_selected_once(self):
+        inbox = self.gmail.inbox()
+        inbox.search()
+        inbox.search(unread=True)
+        self.assertEqual(['SELECT "INBOX"'], self.selects())
+        self.assertEqual(1, self.gmail.selections.skipped)
+
+    def test_other_mailbox(self):
+        self.gmail.inbox().search()
+        self.gmail.all_mail().search()
+        self.gmail.inbox().search()
+        self.assertEqual(['SELECT "INBOX"', 'SELECT "[Gmail]/All Mail"', 'SELECT "INBOX"'], self.selects())
+
+    def test_selected_again_after_close(self):
+        self.gmail.inbox().search()
+        self.gmail.imap.close()
+        self.assertEqual(['1', '2', '3'], self.gmail.inbox().search())
+        self.assertEqual(2, len(self.selects()))
+
+    def test_deleted_mailbox_forgotten(self):
+        mailbox = self.gmail.create_mailbox('Receipts')
+        mailbox.search()
+        self.gmail.delete_mailbox('Receipts')
+        self.assertIsNone(self.gmail.selections.current(self.gmail.imap))
+
+    def test_forced(self):
+        self.gmail.inbox().search()
+        self.account.add(message(4))
+        self.gmail.select(self.gmail.imap, 'INBOX', force=True)
+        self.assertEqual(5, self.gmail.inbox().uidnext)
+        self.assertEqual(4, self.gmail.inbox().exists)
+
+
+class ReadOnlyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.account = Account()
+        self.account.add(message(1))
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server, readonly=True)
+        self.gmail.login('user', 'password')
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def selects(self):
+        return [command for command in self.account.commands if command.startswith(('SELECT', 'EXAMINE'))]
+
+    def test_examined(self):
+        self.gmail.inbox().search()
+        self.assertEqual(['EXAMINE "INBOX"'], self.selects())
+        self.assertTrue(self.gmail.selections.current(self.gmail.imap).readonly)
+
+    def test_read_write_serves_reads(self):
+        self.gmail.select(self.gmail.imap, 'INBOX', readonly=False)
+        self.gmail.inbox().search()
+        self.assertEqual(['SELECT "INBOX"'], self.selects())
+
+    def test_read_only_does_not_serve_writes(self):
+        self.gmail.inbox().search()
+        self.gmail.select(self.gmail.imap, 'INBOX', readonly=False)
+        self.assertEqual(['EXAMINE "INBOX"', 'SELECT "INBOX"'], self.selects())
+
+
+if __name__ == '__main__':
+    unittest.main()
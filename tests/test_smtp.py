@@ -0,0 +1,77 @@
+import smtplib
+import time
+import unittest
+
+from gmail import Gmail
+
+from .smtpserver import Mailer, StandInSMTPServer
+
+
+class StandInSMTPGmail(Gmail):
+    """A session whose SMTP connections go to the stand-in server."""
+
+    def __init__(self, server):
+        Gmail.__init__(self)
+        self.server = server
+        self.username = 'alice@example.com'
+        self.password = 'password'
+
+    def new_smtp(self):
+        smtp = smtplib.SMTP(*self.server.server_address)
+        smtp.ehlo()
+        return smtp
+
+
+class BulkSendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mailer = Mailer()
+        self.server = StandInSMTPServer(self.mailer).start()
+        self.gmail = StandInSMTPGmail(self.server)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def drafts(self, count, recipients=('bob@example.com',)):
+        return [self.gmail.draft(list(recipients), 'Hello %d' % number, plain='Message %d' % number) for number in range(count)]
+
+    def test_sent_in_order(self):
+        drafts = self.drafts(6)
+        results = list(self.gmail.send_bulk(drafts, sessions=2))
+        self.assertEqual([draft.message_id for draft in drafts], [result.message_id for result in results])
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual(6, len(self.mailer.messages))
+        self.assertEqual(2, self.mailer.connections)
+        self.assertEqual(set(['alice@example.com']), set(sender for sender, recipients, data in self.mailer.messages))
+
+    def test_without_pipelining(self):
+        self.mailer.pipelining = False
+        results = list(self.gmail.send_bulk(self.drafts(3), sessions=1))
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual(3, len(self.mailer.messages))
+
+    def test_refused_recipient(self):
+        self.mailer.refused.add('carol@example.com')
+        result, = self.gmail.send_bulk(self.drafts(1, ['bob@example.com', 'carol@example.com']), sessions=1)
+        self.assertFalse(result.ok)
+        self.assertIsNone(result.error)
+        self.assertEqual(['carol@example.com'], list(result.refused()))
+        self.assertEqual([['bob@example.com']], [recipients for sender, recipients, data in self.mailer.messages])
+
+    def test_every_recipient_refused(self):
+        self.mailer.refused.add('carol@example.com')
+        drafts = self.drafts(1, ['carol@example.com']) + self.drafts(1)
+        refused, sent = self.gmail.send_bulk(drafts, sessions=1)
+        self.assertIsInstance(refused.error, smtplib.SMTPRecipientsRefused)
+        self.assertTrue(sent.ok)
+        self.assertEqual(1, len(self.mailer.messages))
+        self.assertEqual(1, self.mailer.connections)
+
+    def test_max_rate(self):
+        start = time.time()
+        list(self.gmail.send_bulk(self.drafts(3), sessions=1, max_rate=20))
+        self.assertGreaterEqual(time.time() - start, 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
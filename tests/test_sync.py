@@ -0,0 +1,104 @@
+import unittest
+
+from .imapserver import CAPABILITIES, Account, StandInGmail, StandInServer, message
+
+
+class SyncTest(unittest.TestCase):
+
+    capabilities = CAPABILITIES
+
+    def setUp(self):
+        self.account = Account(self.capabilities)
+        for number in range(1, 6):
+            self.account.add(message(number), flags=['\\Seen'] if number % 2 else [])
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server)
+        self.gmail.login('user', 'password')
+        self.inbox = self.gmail.inbox()
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def test_capabilities_after_login(self):
+        self.assertIn('QRESYNC', self.gmail.imap.capabilities)
+        self.assertIn('QRESYNC', self.gmail.enabled)
+
+    def test_first_sync(self):
+        result = self.inbox.sync()
+        self.assertTrue(result.full)
+        self.assertEqual(['1', '2', '3', '4', '5'], [email.uid for email in result.added])
+        self.assertEqual([], result.changed)
+        self.assertEqual([], result.removed)
+        self.assertEqual(['1', '2', '3', '4', '5'], result.state['uids'])
+        self.assertTrue(result.added[0].is_read())
+        self.assertFalse(result.added[1].is_read())
+
+    def test_nothing_changed(self):
+        self.inbox.sync()
+        result = self.inbox.sync()
+        self.assertFalse(result)
+        self.assertFalse(result.full)
+
+    def test_added_and_changed(self):
+        self.inbox.sync()
+        self.account.set_flags(2, ['\\Seen', '\\Flagged'])
+        uid = self.account.add(message(6))
+        del self.account.commands[:]
+
+        result = self.inbox.sync()
+        self.assertFalse(result.full)
+        self.assertEqual([str(uid)], [email.uid for email in result.added])
+        self.assertEqual(['2'], [email.uid for email in result.changed])
+        self.assertTrue(result.changed[0].is_starred())
+        self.assertEqual([], result.removed)
+        self.assert_incremental()
+
+    def assert_incremental(self):
+        # only the messages changed since the last sync are fetched
+        self.assertTrue(any('CHANGEDSINCE' in command for command in self.account.commands))
+
+    def test_removed(self):
+        self.inbox.sync()
+        self.account.expunge(3)
+
+        result = self.inbox.sync()
+        self.assertEqual(['3'], result.removed)
+        self.assertEqual(['1', '2', '4', '5'], result.state['uids'])
+        self.assertNotIn('3', self.inbox.messages)
+
+    def test_several_removed(self):
+        self.inbox.sync()
+        self.account.expunge(2)
+        self.account.expunge(4)
+
+        result = self.inbox.sync()
+        self.assertEqual(['2', '4'], result.removed)
+        self.assertEqual(['1', '3', '5'], result.state['uids'])
+
+    def test_uidvalidity_change(self):
+        first = self.inbox.sync()
+        self.account.renumber()
+
+        result = self.inbox.sync()
+        self.assertTrue(result.full)
+        self.assertEqual(['6', '7', '8', '9', '10'], [email.uid for email in result.added])
+        self.assertEqual(sorted(first.state['uids']), sorted(result.removed))
+        self.assertNotEqual(first.state['uidvalidity'], result.state['uidvalidity'])
+
+
+class PlainSyncTest(SyncTest):
+    """The same against a server without CONDSTORE or QRESYNC, where flags are compared with the last sync."""
+
+    capabilities = ('IMAP4rev1', 'UIDPLUS', 'X-GM-EXT-1')
+
+    def test_capabilities_after_login(self):
+        self.assertIn('UIDPLUS', self.gmail.imap.capabilities)
+        self.assertEqual(set(), self.gmail.enabled)
+
+    def assert_incremental(self):
+        self.assertFalse(any('CHANGEDSINCE' in command for command in self.account.commands))
+
+
+if __name__ == '__main__':
+    unittest.main()
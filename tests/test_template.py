@@ -0,0 +1,72 @@
+import email
+import io
+import unittest
+from email.header import decode_header
+
+from gmail.draft import Attachment
+from gmail.template import DraftTemplate
+
+
+def parse(draft):
+    # everything in a draft is 7bit or base64
+    return email.message_from_string(draft.as_bytes().decode('ascii'))
+
+
+def header_text(value):
+    return u''.join(part.decode(charset or 'ascii') if isinstance(part, bytes) else part for part, charset in decode_header(value))
+
+
+class DraftTemplateTest(unittest.TestCase):
+
+    def template(self, **kwargs):
+        return DraftTemplate(None, kwargs.pop('subject', 'Hello {name}'), sender='alice@example.com', **kwargs)
+
+    def test_fields(self):
+        template = self.template(plain='Dear {name},\nthanks.')
+        message = parse(template.render(['bob@example.com'], name='Bob'))
+        self.assertEqual('Hello Bob', message['Subject'])
+        self.assertEqual('bob@example.com', message['To'])
+        self.assertEqual('alice@example.com', message['From'])
+        body, = message.get_payload()
+        self.assertEqual('Dear Bob,\r\nthanks.', body.get_payload())
+
+    def test_each_draft_its_own(self):
+        template = self.template(plain='Dear {name}', bcc=['archive@example.com'])
+        first, second = template.render_all([(['bob@example.com'], {'name': 'Bob'}), (['carol@example.com'], {'name': 'Carol'})])
+        self.assertNotEqual(first.message_id, second.message_id)
+        self.assertEqual(['carol@example.com', 'archive@example.com'], second.recipients)
+        message = parse(second)
+        self.assertEqual(second.message_id, message['Message-ID'])
+        self.assertEqual('carol@example.com', message['To'])
+        self.assertIsNone(message['Bcc'])
+
+    def test_non_ascii_fields(self):
+        template = self.template(plain='Dear {name}')
+        message = parse(template.render(['bob@example.com'], name=u'Jos\xe9'))
+        self.assertEqual(u'Hello Jos\xe9', header_text(message['Subject']))
+        body, = message.get_payload()
+        self.assertEqual('utf-8', body.get_content_charset())
+        self.assertEqual(u'Dear Jos\xe9', body.get_payload(decode=True).decode('utf-8'))
+
+    def test_alternative_and_attachments(self):
+        data = b'\x00\x01' * 100
+        template = self.template(subject='Terms', plain='See {what}', html='<p>See {what}</p>',
+                                 attachments=[Attachment(io.BytesIO(data), 'terms.bin')])
+        message = parse(template.render(['bob@example.com'], what='attached'))
+        alternative, attachment = message.get_payload()
+        self.assertEqual('multipart/alternative', alternative.get_content_type())
+        self.assertEqual(['See attached', '<p>See attached</p>'],
+                         [part.get_payload(decode=True).decode('ascii').strip() for part in alternative.get_payload()])
+        self.assertEqual('terms.bin', attachment.get_filename())
+        self.assertEqual(data, attachment.get_payload(decode=True))
+
+    def test_size(self):
+        draft = self.template(plain='Dear {name}').render(['bob@example.com'], name='Bob')
+        self.assertEqual(len(draft.as_bytes()), draft.size())
+
+    def test_no_body(self):
+        self.assertRaises(ValueError, DraftTemplate, None, 'Hello', sender='alice@example.com')
+
+
+if __name__ == '__main__':
+    unittest.main()
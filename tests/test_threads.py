@@ -0,0 +1,60 @@
+import unittest
+
+from .imapserver import Account, StandInGmail, StandInServer, message
+
+
+class ThreadsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.account = Account()
+        # thread 100 is messages 1 and 3, thread 200 message 2; message 3 is also in the INBOX
+        for number, thread_id in ((3, 100), (1, 100), (2, 200)):
+            self.account.add(message(number), flags=['\\Seen'] if number == 1 else [], mailbox='[Gmail]/All Mail',
+                             message_id=number, thread_id=thread_id)
+        self.account.add(message(3), message_id=3, thread_id=100)
+        self.server = StandInServer(self.account).start()
+        self.gmail = StandInGmail(self.server)
+        self.gmail.login('user', 'password')
+
+    def tearDown(self):
+        self.gmail.imap.logout()
+        self.server.stop()
+
+    def searches(self):
+        return [command for command in self.account.commands if command.startswith('UID SEARCH')]
+
+    def test_threads_in_order(self):
+        threads = self.gmail.threads([200, 100])
+        self.assertEqual(['200', '100'], [thread.thread_id for thread in threads])
+        self.assertEqual([['Message 2'], ['Message 1', 'Message 3']], [[email.subject for email in thread] for thread in threads])
+        self.assertEqual(1, len(self.searches()))
+
+    def test_search_per_chunk(self):
+        self.gmail.THREAD_SEARCH_SIZE = 1
+        threads = self.gmail.threads([100, 200, 300])
+        self.assertEqual([2, 1, 0], [len(thread) for thread in threads])
+        self.assertEqual(3, len(self.searches()))
+
+    def test_thread(self):
+        thread = self.gmail.thread(100)
+        self.assertEqual('Message 1', thread.subject)
+        self.assertEqual('Message 3', thread.last.subject)
+        self.assertFalse(thread.is_read())
+        self.assertEqual(['Alice <alice@example.com>', 'bob@example.com'], thread.participants())
+
+    def test_fetch_thread(self):
+        email, = self.gmail.inbox().mail()
+        thread = email.fetch_thread()
+        self.assertEqual(['Message 1', 'Message 3'], [message.subject for message in thread])
+        self.assertEqual('[Gmail]/All Mail', thread[0].mailbox.name)
+        self.assertIs(thread, email.thread)
+
+    def test_fetched_once(self):
+        self.gmail.threads([100])
+        del self.account.commands[:]
+        self.gmail.threads([100])
+        self.assertFalse([command for command in self.account.commands if command.startswith('UID FETCH')])
+
+
+if __name__ == '__main__':
+    unittest.main()